@@ -9,4 +9,10 @@ NODE_DISPLAY_NAME_MAPPINGS = {**MAIN_NODE_DISPLAY_NAME_MAPPINGS, **HELPER_NODE_D
 
 WEB_DIRECTORY = "./web"
 
+# Cache management HTTP routes need ComfyUI's PromptServer (absent when imported standalone)
+try:
+    from .utils import routes  # noqa: F401
+except ImportError:
+    pass
+
 __all__ = ["NODE_CLASS_MAPPINGS", "NODE_DISPLAY_NAME_MAPPINGS", "WEB_DIRECTORY"]
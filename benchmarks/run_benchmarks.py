@@ -0,0 +1,432 @@
+"""
+Benchmark suite for the Gemini node pack.
+
+Runs entirely offline: Gemini calls are served by the replay backend, and all media is
+generated synthetically in a temporary directory.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks --output bench_results.json
+    python -m benchmarks.run_benchmarks --quick --only cache,scan
+    python -m benchmarks.run_benchmarks --compare baseline.json --output current.json
+
+Results are written as JSON (one record per benchmark case with latency percentiles in
+microseconds) so runs from different commits can be compared with --compare.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from typing import Callable, Dict, Any, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+GROUPS = ["startup", "cache", "tensor", "scan", "image", "video", "describe"]
+
+# Loaded on first use only; importing the node pack must not pull these in
+HEAVY_MODULES = ["google.genai", "cv2", "numpy", "PIL", "torch", "aiohttp"]
+
+# Loads the node pack the way ComfyUI loads custom nodes, in a fresh interpreter
+_STARTUP_SCRIPT = """
+import sys, json, time, resource, importlib.util
+root, heavy = sys.argv[1], sys.argv[2].split(",")
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("sk_custom_nodes", root + "/__init__.py", submodule_search_locations=[root])
+module = importlib.util.module_from_spec(spec)
+sys.modules["sk_custom_nodes"] = module
+spec.loader.exec_module(module)
+seconds = time.perf_counter() - started
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+scale = 1 if sys.platform == "darwin" else 1024
+print(json.dumps({"seconds": seconds, "rss_bytes": (rss_after - rss_before) * scale,
+                  "heavy": [name for name in heavy if name in sys.modules]}))
+"""
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency statistics in microseconds."""
+    values = sorted(s * 1e6 for s in samples)
+    return {
+        'count': len(values),
+        'mean_us': round(statistics.fmean(values), 3) if values else 0.0,
+        'p50_us': round(_percentile(values, 50), 3),
+        'p95_us': round(_percentile(values, 95), 3),
+        'p99_us': round(_percentile(values, 99), 3),
+        'min_us': round(values[0], 3) if values else 0.0,
+        'max_us': round(values[-1], 3) if values else 0.0,
+    }
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Call fn warmup + repeat times and summarize the timed calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+class BenchmarkRun:
+    """Collects results and environment metadata for one invocation."""
+
+    def __init__(self) -> None:
+        self.results: List[Dict[str, Any]] = []
+
+    def add(self, group: str, name: str, params: Dict[str, Any], stats: Optional[Dict[str, Any]] = None,
+            skipped: Optional[str] = None) -> None:
+        record: Dict[str, Any] = {'group': group, 'name': name, 'params': params}
+        if skipped:
+            record['skipped'] = skipped
+            print(f"  {name} {params}: skipped ({skipped})")
+        else:
+            record['stats'] = stats
+            assert stats is not None
+            print(f"  {name} {params}: p50={stats['p50_us']:.1f}us p95={stats['p95_us']:.1f}us n={stats['count']}")
+        self.results.append(record)
+
+    def metadata(self) -> Dict[str, Any]:
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                    text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        }
+
+
+def bench_startup(run: BenchmarkRun, samples: int) -> None:
+    """Node pack import time and resident memory growth, each sample in a fresh interpreter."""
+    try:
+        import resource  # noqa: F401
+    except ImportError:
+        run.add("startup", "import_node_pack", {}, skipped="resource module not available")
+        return
+
+    print("[BENCH] startup")
+    timings, rss, heavy = [], [], set()
+    for _ in range(samples):
+        completed = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, REPO_ROOT, ",".join(HEAVY_MODULES)],
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            run.add("startup", "import_node_pack", {}, skipped=completed.stderr.strip().splitlines()[-1])
+            return
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        timings.append(result['seconds'])
+        rss.append(result['rss_bytes'])
+        heavy.update(result['heavy'])
+
+    stats = summarize(timings)
+    stats['rss_mb'] = round(statistics.median(rss) / (1024 * 1024), 1)
+    stats['heavy_modules'] = sorted(heavy)
+    run.add("startup", "import_node_pack", {}, stats)
+    print(f"  resident memory +{stats['rss_mb']}MB")
+    if heavy:
+        print(f"  [WARN] Loaded at import time: {', '.join(sorted(heavy))}")
+
+
+def bench_cache(run: BenchmarkRun, workdir: str, sizes: List[int], samples: int) -> None:
+    """GeminiCache get/set latency as the number of entries grows."""
+    from utils.cache import GeminiCache
+
+    print("[BENCH] cache")
+    cache_dir = os.path.join(workdir, "cache")
+    cache = GeminiCache(cache_dir)
+    options = {"describe_clothing": False, "describe_hair_style": True, "describe_bokeh": True, "describe_subject": True}
+    description = "A woman stands in a sunlit kitchen. " * 20
+    populated = 0
+
+    for size in sorted(sizes):
+        # Grow the same cache directory incrementally instead of rebuilding it per size
+        started = time.perf_counter()
+        while populated < size:
+            cache.set(f"file:/bench/{populated}.png:mtime:1:size:1", "models/gemini-2.5-flash", description,
+                      "Text2Image", options)
+            populated += 1
+        print(f"  populated {size} entries in {time.perf_counter() - started:.1f}s")
+
+        counter = iter(range(10 ** 12))
+        run.add("cache", "cache_set", {'entries': size}, measure(
+            lambda: cache.set(f"file:/bench/new-{size}-{next(counter)}.png:mtime:1:size:1", "models/gemini-2.5-flash",
+                              description, "Text2Image", options), samples))
+        hit_ids = iter(range(10 ** 12))
+        run.add("cache", "cache_get_hit", {'entries': size}, measure(
+            lambda: cache.get(f"file:/bench/{next(hit_ids) % size}.png:mtime:1:size:1", "models/gemini-2.5-flash",
+                              "Text2Image", options), samples))
+        miss_ids = iter(range(10 ** 12))
+        run.add("cache", "cache_get_miss", {'entries': size}, measure(
+            lambda: cache.get(f"file:/bench/missing-{next(miss_ids)}.png", "models/gemini-2.5-flash", "Text2Image", options),
+            samples))
+        run.add("cache", "cache_info", {'entries': size}, measure(cache.get_cache_info, 3, warmup=0))
+        populated += samples + 1
+
+
+def bench_tensor(run: BenchmarkRun, batch_sizes: List[int], samples: int) -> None:
+    """Tensor fingerprinting (get_tensor_media_identifier) for IMAGE batches."""
+    try:
+        import numpy as np
+    except ImportError:
+        run.add("tensor", "tensor_fingerprint", {}, skipped="numpy not installed")
+        return
+    from utils.cache import get_tensor_media_identifier
+
+    print("[BENCH] tensor")
+    rng = np.random.default_rng(0)
+    for batch in batch_sizes:
+        tensor = rng.random((batch, 512, 512, 3), dtype=np.float32)
+        run.add("tensor", "tensor_fingerprint", {'batch': batch, 'height': 512, 'width': 512},
+                measure(lambda: get_tensor_media_identifier(tensor), samples))
+
+
+def _build_tree(root: str, file_count: int, fanout: int = 20) -> None:
+    """Synthetic media tree: nested directories with a mix of image, video and other files."""
+    extensions = [".png", ".jpg", ".JPG", ".webp", ".mp4", ".mov", ".txt", ".json"]
+    for i in range(file_count):
+        subdir = os.path.join(root, f"d{i % fanout}", f"s{(i // fanout) % fanout}")
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"f{i}{extensions[i % len(extensions)]}"), 'wb'):
+            pass
+
+
+def bench_scan(run: BenchmarkRun, workdir: str, tree_sizes: List[int], samples: int) -> None:
+    """'Randomize Media from Path' directory scan and directory index browsing on synthetic trees."""
+    from utils.media import find_media_files, media_extensions
+    from utils.dir_index import DirectoryIndex
+
+    print("[BENCH] scan")
+    for size in tree_sizes:
+        root = os.path.join(workdir, f"tree_{size}")
+        _build_tree(root, size)
+        for media_type in ("image", "video"):
+            run.add("scan", "find_media_files", {'files': size, 'media_type': media_type},
+                    measure(lambda: find_media_files(root, media_type), samples))
+
+        index = DirectoryIndex(os.path.join(workdir, f"dir_index_{size}.sqlite3"))
+        run.add("scan", "dir_index_refresh_cold", {'files': size}, measure(lambda: index.refresh(root), 1, warmup=0))
+        run.add("scan", "dir_index_refresh_warm", {'files': size},
+                measure(lambda: index.refresh(root, force=True), samples))
+        videos = sorted({ext[1:].lower() for ext in media_extensions("video")})
+        run.add("scan", "dir_index_list_page", {'files': size, 'media_type': "video", 'limit': 100},
+                measure(lambda: index.list(root, extensions=videos, limit=100), samples))
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def bench_image(run: BenchmarkRun, workdir: str, resolutions: List[int], samples: int) -> None:
+    """IMAGE tensor -> JPEG and image file -> JPEG conversion."""
+    try:
+        import numpy as np
+        from PIL import Image
+        from utils.media import encode_image_tensor, encode_image_file
+    except ImportError as e:
+        run.add("image", "encode_image", {}, skipped=str(e))
+        return
+
+    print("[BENCH] image")
+    rng = np.random.default_rng(0)
+    for resolution in resolutions:
+        tensor = rng.random((1, resolution, resolution, 3), dtype=np.float32)
+        run.add("image", "encode_image_tensor", {'resolution': resolution}, measure(lambda: encode_image_tensor(tensor), samples))
+
+        png_path = os.path.join(workdir, f"image_{resolution}.png")
+        Image.fromarray((tensor[0] * 255).astype(np.uint8)).save(png_path)
+        run.add("image", "encode_image_file", {'resolution': resolution, 'format': 'png'},
+                measure(lambda: encode_image_file(png_path), samples))
+
+
+def _write_synthetic_video(path: str, seconds: int, fps: int = 24, width: int = 640, height: int = 360) -> bool:
+    import cv2
+    import numpy as np
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        return False
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    for i in range(seconds * fps):
+        frame[:, :, 0] = i % 255
+        frame[:, :, 1] = (i * 3) % 255
+        writer.write(frame)
+    writer.release()
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def bench_video(run: BenchmarkRun, workdir: str, durations: List[int], samples: int) -> None:
+    """Video metadata probe (uncached per prober, and cached by fingerprint), fingerprinting and ffmpeg trim."""
+    try:
+        from utils.media import probe_video_cv2, probe_video_ffprobe, trim_video
+        from utils.fingerprint import MediaMetadataStore, compute_video_fingerprint
+    except ImportError as e:
+        run.add("video", "probe_video", {}, skipped=str(e))
+        return
+
+    print("[BENCH] video")
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+    has_ffprobe = shutil.which("ffprobe") is not None
+    store = MediaMetadataStore(os.path.join(workdir, "media_metadata.sqlite3"))
+    for seconds in durations:
+        path = os.path.join(workdir, f"video_{seconds}s.mp4")
+        if not _write_synthetic_video(path, seconds):
+            run.add("video", "probe_video", {'seconds': seconds}, skipped="cv2.VideoWriter unavailable")
+            continue
+        run.add("video", "probe_video", {'seconds': seconds, 'prober': 'cv2'}, measure(lambda: probe_video_cv2(path), samples))
+        if has_ffprobe:
+            run.add("video", "probe_video", {'seconds': seconds, 'prober': 'ffprobe'},
+                    measure(lambda: probe_video_ffprobe(path), samples))
+        else:
+            run.add("video", "probe_video", {'seconds': seconds, 'prober': 'ffprobe'}, skipped="ffprobe not found")
+        run.add("video", "video_fingerprint", {'seconds': seconds}, measure(lambda: compute_video_fingerprint(path), samples))
+        store.probe(path)
+        run.add("video", "probe_video_cached", {'seconds': seconds}, measure(lambda: store.probe(path), samples))
+
+        if not has_ffmpeg:
+            run.add("video", "trim_video", {'seconds': seconds}, skipped="ffmpeg not found")
+            continue
+        out_path = os.path.join(workdir, f"video_{seconds}s_trim.mp4")
+        run.add("video", "trim_video", {'seconds': seconds, 'trim_to': 5},
+                measure(lambda: trim_video(path, out_path, 5), max(samples // 10, 3)))
+
+
+def bench_describe(run: BenchmarkRun, workdir: str, samples: int) -> None:
+    """End-to-end GeminiMediaDescribe with a replay backend: cache miss vs cache hit."""
+    try:
+        import numpy as np
+        from utils import cache as cache_module
+        from utils import scheduler as scheduler_module
+        from utils import thumbnails as thumbnails_module
+        from utils import usage as usage_module
+        from utils.gemini_backend import ReplayBackend, set_backend
+        from utils.nodes import GeminiMediaDescribe
+    except ImportError as e:
+        run.add("describe", "describe_media", {}, skipped=str(e))
+        return
+
+    print("[BENCH] describe")
+    # Everything a describe call writes (cache, usage ledger, scheduler heartbeats, thumbnails)
+    # goes to the workdir, so benchmarks never touch the repository's cache/ directory
+    saved = (cache_module._global_cache, usage_module._global_ledger, scheduler_module._global_scheduler,
+             thumbnails_module._global_thumbnails)
+    set_backend(ReplayBackend(fallback_text="A woman stands in a sunlit kitchen."))
+    cache_module._global_cache = cache_module.GeminiCache(os.path.join(workdir, "describe_cache"))
+    usage_module._global_ledger = usage_module.UsageLedger(os.path.join(workdir, "usage"))
+    scheduler_module._global_scheduler = scheduler_module.RequestScheduler(
+        scheduler_module.DEFAULT_SLOTS_PER_KEY, heartbeat_dir=os.path.join(workdir, "scheduler"))
+    thumbnails_module._global_thumbnails = thumbnails_module.ThumbnailCache(os.path.join(workdir, "thumbnails"))
+    try:
+        node = GeminiMediaDescribe()
+        rng = np.random.default_rng(0)
+
+        images = [rng.random((1, 512, 512, 3), dtype=np.float32) for _ in range(samples + 1)]
+        miss_iter = iter(images)
+        run.add("describe", "describe_media_miss", {'input': 'tensor', 'resolution': 512},
+                measure(lambda: node.describe_media("Upload Media", "image", 0, image=next(miss_iter)), samples))
+        run.add("describe", "describe_media_hit", {'input': 'tensor', 'resolution': 512},
+                measure(lambda: node.describe_media("Upload Media", "image", 0, image=images[0]), samples))
+        usage_module._global_ledger.flush()
+    finally:
+        set_backend(None)
+        (cache_module._global_cache, usage_module._global_ledger, scheduler_module._global_scheduler,
+         thumbnails_module._global_thumbnails) = saved
+
+
+def compare(baseline_path: str, results: List[Dict[str, Any]], threshold: float) -> int:
+    """Print p50 changes against a previous run; returns the number of regressions over threshold."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    def key(record: Dict[str, Any]) -> str:
+        return f"{record['name']} {json.dumps(record['params'], sort_keys=True)}"
+
+    previous = {key(r): r for r in baseline.get('results', []) if 'stats' in r}
+    regressions = 0
+    print(f"\n[BENCH] Comparison against {baseline_path} (commit {baseline.get('metadata', {}).get('commit')})")
+    for record in results:
+        old = previous.get(key(record))
+        if 'stats' not in record or old is None or not old['stats']['p50_us']:
+            continue
+        change = (record['stats']['p50_us'] - old['stats']['p50_us']) / old['stats']['p50_us']
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  <-- REGRESSION"
+        print(f"  {key(record)}: p50 {old['stats']['p50_us']:.1f}us -> {record['stats']['p50_us']:.1f}us ({change:+.1%}){flag}")
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for sk_custom_nodes")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"Comma separated groups ({', '.join(GROUPS)})")
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a fast smoke run")
+    parser.add_argument("--cache-sizes", type=_int_list, default=None, help="Cache entry counts (default 1000,100000,1000000)")
+    parser.add_argument("--samples", type=int, default=None, help="Timed calls per case")
+    parser.add_argument("--output", default=None, help="Write JSON results to this file")
+    parser.add_argument("--compare", default=None, help="Previous JSON results to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.2, help="Relative p50 slowdown flagged as regression")
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a temporary directory)")
+    args = parser.parse_args(argv)
+
+    groups = [g.strip() for g in args.only.split(",") if g.strip()]
+    samples = args.samples or (20 if args.quick else 200)
+    cache_sizes = args.cache_sizes or ([1000, 10000] if args.quick else [1000, 100000, 1000000])
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sk_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    run = BenchmarkRun()
+    try:
+        if "startup" in groups:
+            bench_startup(run, max(samples // 20, 5))
+        if "cache" in groups:
+            bench_cache(run, workdir, cache_sizes, samples)
+        if "tensor" in groups:
+            bench_tensor(run, [1, 4, 16] if args.quick else [1, 4, 16, 64], max(samples // 10, 5))
+        if "scan" in groups:
+            bench_scan(run, workdir, [1000, 10000] if args.quick else [1000, 10000, 100000], max(samples // 20, 3))
+        if "image" in groups:
+            bench_image(run, workdir, [512, 1024] if args.quick else [512, 1024, 2048], max(samples // 10, 5))
+        if "video" in groups:
+            bench_video(run, workdir, [10] if args.quick else [10, 60], max(samples // 10, 5))
+        if "describe" in groups:
+            bench_describe(run, workdir, max(samples // 10, 5))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {'metadata': run.metadata(), 'results': run.results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print(f"\n[BENCH] Wrote {len(run.results)} results to {args.output}")
+
+    if args.compare:
+        return 1 if compare(args.compare, run.results, args.regression_threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Tests for the cache's secondary index: list, purge and rebuild."""
+
+import json
+import os
+
+import pytest
+
+from utils.cache import GeminiCache
+
+FLASH = "models/gemini-2.5-flash"
+PRO = "models/gemini-2.5-pro"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = GeminiCache(str(tmp_path / "cache"))
+    cache.set("file:/media/a.png:mtime:1:size:10", FLASH, "a flash", "Text2Image", {"describe_bokeh": True})
+    cache.set("file:/media/a.png:mtime:2:size:10", PRO, "a pro", "Text2Image", {"describe_bokeh": True})
+    cache.set("file:/media/b.png:mtime:1:size:10", FLASH, "b flash", "Text2Image", {"describe_bokeh": False})
+    return cache
+
+
+def entry_files(cache):
+    return sorted(name for name in os.listdir(cache.cache_dir) if name.endswith(".json"))
+
+
+def test_list_filters(cache):
+    assert {row['gemini_model'] for row in cache.list_entries(media_path="/media/a.png")} == {FLASH, PRO}
+    assert len(cache.list_entries(gemini_model=FLASH)) == 2
+    options_hash = GeminiCache._get_options_hash({"describe_bokeh": False})
+    assert [row['media_path'] for row in cache.list_entries(options_hash=options_hash)] == ["/media/b.png"]
+    assert len(cache.list_entries(limit=1)) == 1
+
+
+def test_purge_deletes_files_and_rows(cache):
+    assert cache.purge(gemini_model=FLASH) == 2
+    assert [row['gemini_model'] for row in cache.list_entries()] == [PRO]
+    assert len(entry_files(cache)) == 1
+    assert cache.get_cache_info()['entries'] == 1
+    assert cache.get("file:/media/b.png:mtime:1:size:10", FLASH, "Text2Image", {"describe_bokeh": False}) is None
+
+
+def test_purge_needs_a_filter(cache):
+    with pytest.raises(ValueError):
+        cache.purge()
+    assert cache.clear() == 3
+    assert entry_files(cache) == []
+    assert cache.get_cache_info()['entries'] == 0
+
+
+def test_existing_files_are_indexed_on_first_open(cache):
+    os.remove(os.path.join(cache.cache_dir, "_index.sqlite3"))
+    reopened = GeminiCache(cache.cache_dir)
+    assert len(reopened.list_entries()) == 3
+    assert reopened.get_cache_info()['entries'] == 3
+
+
+def test_rebuild_adds_missing_rows_and_drops_rows_without_files(cache):
+    # An entry file whose index row was never written, and a row whose file was deleted by hand
+    row = cache.list_entries(media_path="/media/b.png")[0]
+    path = os.path.join(cache.cache_dir, f"{row['cache_key']}.json")
+    with open(path, encoding="utf-8") as f:
+        orphan = json.load(f)
+    orphan['cache_key'] = "f" * 64
+    orphan['media_identifier'] = "file:/media/c.png:mtime:1:size:10"
+    with open(os.path.join(cache.cache_dir, f"{'f' * 64}.json"), "w", encoding="utf-8") as f:
+        json.dump(orphan, f)
+    os.remove(path)
+
+    assert cache.rebuild_index() == 3
+    assert {row['media_path'] for row in cache.list_entries(gemini_model=FLASH)} == {"/media/a.png", "/media/c.png"}
+    assert cache.get_cache_info()['entries'] == 3
@@ -0,0 +1,91 @@
+"""Tests for cancellable, time-bounded calls."""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from utils.cancellation import (CallCancelledError, DeadlineExceededError, on_cancel, remaining_time, request_deadline,
+                                run_cancellable)
+
+
+def test_returns_the_result():
+    assert run_cancellable(lambda a, b=0: a + b, 1, b=2, timeout=5) == 3
+
+
+@pytest.mark.parametrize("timeout", [0, 5])
+def test_reraises_the_calls_own_timeout_error(timeout):
+    # socket.timeout is the builtin TimeoutError, like a concurrent.futures poll timeout
+    def call():
+        raise socket.timeout("read timed out")
+
+    started = time.monotonic()
+    with pytest.raises(socket.timeout, match="read timed out"):
+        run_cancellable(call, timeout=timeout)
+    assert time.monotonic() - started < 1.0
+
+
+def test_deadline_runs_cleanups():
+    cleaned = threading.Event()
+
+    def call():
+        on_cancel(cleaned.set)
+        time.sleep(5)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError) as excinfo:
+        run_cancellable(call, timeout=0.3)
+    assert time.monotonic() - started < 2.0
+    assert excinfo.value.code == 504
+    assert cleaned.is_set()
+
+
+def test_cancel_event_abandons_the_call():
+    cancel = threading.Event()
+    cleaned = threading.Event()
+
+    def call():
+        on_cancel(cleaned.set)
+        cancel.set()
+        time.sleep(5)
+
+    with pytest.raises(CallCancelledError):
+        run_cancellable(call, cancel=cancel)
+    assert cleaned.is_set()
+
+
+def test_cleanup_registered_after_abandon_runs_at_once():
+    cancel = threading.Event()
+    abandoned = threading.Event()
+    cleaned = threading.Event()
+
+    def call():
+        cancel.set()
+        abandoned.wait(5)
+        # E.g. a subprocess started just as the caller gave up
+        on_cancel(cleaned.set)
+
+    with pytest.raises(CallCancelledError):
+        run_cancellable(call, cancel=cancel)
+    abandoned.set()
+    assert cleaned.wait(5)
+
+
+def test_remaining_time_inside_the_call():
+    remaining = run_cancellable(remaining_time, timeout=10)
+    assert 0 < remaining <= 10
+    assert run_cancellable(remaining_time) is None
+
+
+def test_request_deadline(monkeypatch):
+    monkeypatch.delenv("SK_GEMINI_REQUEST_TIMEOUT", raising=False)
+    assert request_deadline("models/gemini-2.5-flash-lite") == 60.0
+    assert request_deadline("models/gemini-2.5-flash") == 120.0
+    assert request_deadline("models/gemini-2.5-pro", video=True) == 600.0
+    assert request_deadline("models/other") == 180.0
+    assert request_deadline("models/gemini-2.5-pro", override=0) == 0.0
+
+    monkeypatch.setenv("SK_GEMINI_REQUEST_TIMEOUT", "30")
+    assert request_deadline("models/gemini-2.5-pro", video=True) == 30.0
+    assert request_deadline("models/gemini-2.5-pro", override=45) == 45.0
@@ -0,0 +1,106 @@
+"""Tests for the directory index: pagination and which directories may be browsed."""
+
+import os
+
+import pytest
+
+from utils import dir_index
+from utils.dir_index import DirectoryIndex, check_browsable
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = DirectoryIndex(str(tmp_path / "directory_index.sqlite3"))
+    monkeypatch.setattr(dir_index, "_global_index", index)
+    return index
+
+
+@pytest.fixture
+def media(tmp_path):
+    root = tmp_path / "media"
+    for name in ["a.png", "b.mp4", "c.png", "sub/d.png", "sub/e.mov", "sub/deep/f.png"]:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 10)
+    return str(root)
+
+
+@pytest.fixture
+def roots(tmp_path, monkeypatch):
+    """ComfyUI's input and output directories, with no browse settings from the environment."""
+    directories = [str(tmp_path / "input"), str(tmp_path / "output")]
+    for directory in directories:
+        os.makedirs(directory)
+    monkeypatch.setattr(dir_index, "comfy_directories", lambda: list(directories))
+    monkeypatch.delenv("SK_GEMINI_BROWSE_ROOTS", raising=False)
+    monkeypatch.delenv("SK_GEMINI_BROWSE_MEDIA_PATHS", raising=False)
+    return directories
+
+
+def test_offset_pages_cover_every_file_once(index, media):
+    index.refresh(media)
+    pages = [index.list(media, offset=offset, limit=4) for offset in (0, 4)]
+    assert [page['total'] for page in pages] == [6, 6]
+    assert [f['path'] for page in pages for f in page['files']] == sorted(
+        os.path.join(*name.split("/")) for name in ["a.png", "b.mp4", "c.png", "sub/d.png", "sub/e.mov",
+                                                    "sub/deep/f.png"])
+    assert pages[1]['next_after'] is None
+
+
+def test_after_cursor_continues_where_the_last_page_stopped(index, media):
+    index.refresh(media)
+    first = index.list(media, limit=2)
+    assert first['next_after'] == "b.mp4"
+    second = index.list(media, limit=2, after=first['next_after'], offset=99)
+    assert [f['path'] for f in second['files']] == ["c.png", os.path.join("sub", "d.png")]
+
+
+def test_filters_subdirectories_and_limit_cap(index, media):
+    index.refresh(media)
+    pngs = index.list(media, extensions=[".png"])
+    assert pngs['total'] == 4
+    assert index.list(media, subdir="sub", recursive=False)['total'] == 2
+    assert index.list(media, subdir="sub", extensions=[".png"])['directories'] == [{'name': "deep", 'files': 1}]
+    assert len(index.list(media, limit=0)['files']) == 1
+    assert len(index.list(media, limit=10 ** 6)['files']) == 6
+    with pytest.raises(ValueError):
+        index.list(media, subdir="../..")
+
+
+def test_only_comfy_directories_are_browsable_by_default(index, roots, media):
+    assert check_browsable(roots[0]) == roots[0]
+    with pytest.raises(PermissionError):
+        check_browsable(media)
+    with pytest.raises(PermissionError):
+        check_browsable(os.path.join(roots[0], "..", ".."))
+
+    # Without the opt-in, queued prompts cannot whitelist directories
+    index.remember_media_path(media)
+    assert index.media_paths() == []
+    with pytest.raises(PermissionError):
+        check_browsable(media)
+
+
+def test_used_media_paths_are_browsable_with_opt_in(index, roots, media, monkeypatch):
+    monkeypatch.setenv("SK_GEMINI_BROWSE_MEDIA_PATHS", "1")
+    index.remember_media_path(media)
+    assert check_browsable(os.path.join(media, "sub")) == os.path.join(media, "sub")
+
+    # Known paths are not written again
+    def fail():
+        raise AssertionError("media_path written again")
+
+    monkeypatch.setattr(index, "connection", fail)
+    index.remember_media_path(media)
+
+
+def test_browse_roots_setting(index, roots, media, monkeypatch):
+    monkeypatch.setenv("SK_GEMINI_BROWSE_ROOTS", media)
+    assert check_browsable(media) == media
+    with pytest.raises(PermissionError):
+        check_browsable(roots[0])
+    with pytest.raises(FileNotFoundError):
+        check_browsable(os.path.join(media, "missing"))
+
+    monkeypatch.setenv("SK_GEMINI_BROWSE_ROOTS", "*")
+    assert check_browsable(roots[0]) == roots[0]
@@ -0,0 +1,63 @@
+"""Tests for atomic writes and advisory file locks."""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from utils.file_lock import TEMP_SUFFIX, atomic_write_bytes, atomic_write_json, file_lock
+
+
+def test_atomic_write_replaces_the_file(tmp_path):
+    path = tmp_path / "entry.json"
+    atomic_write_json(str(path), {"a": 1})
+    atomic_write_json(str(path), {"a": 2}, durable=False)
+    assert json.loads(path.read_text(encoding="utf-8")) == {"a": 2}
+    assert os.listdir(tmp_path) == ["entry.json"]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX permissions")
+def test_atomic_write_honours_the_umask(tmp_path):
+    previous = os.umask(0o027)
+    try:
+        atomic_write_bytes(str(tmp_path / "entry.json"), b"{}")
+    finally:
+        os.umask(previous)
+    assert os.stat(tmp_path / "entry.json").st_mode & 0o777 == 0o640
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    path = tmp_path / "entry.json"
+    atomic_write_json(str(path), {"a": 1})
+
+    def fail_replace(source, target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail_replace)
+    with pytest.raises(OSError, match="disk full"):
+        atomic_write_json(str(path), {"a": 2})
+    monkeypatch.undo()
+    assert json.loads(path.read_text(encoding="utf-8")) == {"a": 1}
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(TEMP_SUFFIX)]
+
+
+def test_exclusive_lock_serializes_writers(tmp_path):
+    lock_path = str(tmp_path / "counter.lock")
+    counter = tmp_path / "counter"
+    counter.write_text("0")
+
+    def increment():
+        for _ in range(20):
+            with file_lock(lock_path):
+                value = int(counter.read_text())
+                time.sleep(0.001)
+                counter.write_text(str(value + 1))
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.read_text() == "80"
@@ -0,0 +1,73 @@
+"""Tests for content-based video fingerprints."""
+
+import os
+import shutil
+
+import pytest
+
+from utils import fingerprint
+from utils.cache import get_file_media_identifier, get_video_media_identifier
+from utils.fingerprint import SAMPLE_COUNT, SAMPLE_SIZE, MediaMetadataStore, compute_video_fingerprint
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = MediaMetadataStore(str(tmp_path / "metadata.sqlite3"))
+    monkeypatch.setattr(fingerprint, "_global_store", store)
+    return store
+
+
+def write_video(path, size, seed=0):
+    data = bytes((i * 31 + seed) % 251 for i in range(size))
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("size", [1000, SAMPLE_SIZE * (SAMPLE_COUNT + 2) * 3])
+def test_rename_copy_and_touch_keep_the_fingerprint(tmp_path, store, size):
+    original = write_video(tmp_path / "clip.mp4", size)
+    value = store.fingerprint(original)
+
+    renamed = str(tmp_path / "renamed.mp4")
+    os.rename(original, renamed)
+    copied = str(tmp_path / "copy" / "clip.mov")
+    os.makedirs(os.path.dirname(copied))
+    shutil.copyfile(renamed, copied)
+    os.utime(copied, (1, 1))
+
+    assert store.fingerprint(renamed) == value
+    assert store.fingerprint(copied) == value
+    assert get_video_media_identifier(renamed) == get_video_media_identifier(copied) == f"video:{value}"
+    # The path-based identifier changes on every rename
+    assert get_file_media_identifier(renamed) != get_file_media_identifier(copied)
+
+
+def test_different_content_changes_the_fingerprint(tmp_path):
+    size = SAMPLE_SIZE * (SAMPLE_COUNT + 2) * 3
+    path = write_video(tmp_path / "clip.mp4", size)
+    value = compute_video_fingerprint(path)
+
+    with open(path, "r+b") as f:
+        f.seek(size - 10)
+        f.write(b"x")
+    assert compute_video_fingerprint(path) != value
+    assert compute_video_fingerprint(write_video(tmp_path / "other.mp4", size, seed=1)) != value
+    assert compute_video_fingerprint(write_video(tmp_path / "longer.mp4", size + 1)) != value
+
+
+def test_fingerprints_are_memoized_across_store_instances(tmp_path, monkeypatch):
+    path = write_video(tmp_path / "clip.mp4", 1000)
+    db_path = str(tmp_path / "metadata.sqlite3")
+    value = MediaMetadataStore(db_path).fingerprint(path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("fingerprint computed again")
+
+    monkeypatch.setattr(fingerprint, "compute_video_fingerprint", fail)
+    assert MediaMetadataStore(db_path).fingerprint(path) == value
+
+
+def test_missing_file_falls_back_to_the_path_identifier(tmp_path, store):
+    missing = str(tmp_path / "missing.mp4")
+    assert get_video_media_identifier(missing) == get_file_media_identifier(missing)
@@ -0,0 +1,103 @@
+"""Tests for hedged requests and the hedge budget."""
+
+import threading
+import time
+import uuid
+
+import pytest
+
+from utils.cancellation import CallCancelledError
+from utils.hedging import HedgePolicy, get_hedge_policy, get_latency_tracker, run_hedged
+
+
+def unique_model():
+    # The latency tracker is global; a fresh model name starts without samples
+    return f"models/test-{uuid.uuid4().hex}"
+
+
+def test_budget_allows_one_hedge_per_hour_at_least():
+    policy = HedgePolicy("Same Model", "", 95.0, 10.0)
+    policy.record_request()
+    assert policy.try_spend()
+    assert not policy.try_spend()
+
+    for _ in range(19):
+        policy.record_request()
+    # 10% of 20 requests
+    assert policy.try_spend()
+    assert not policy.try_spend()
+
+
+def test_zero_budget_never_hedges():
+    policy = HedgePolicy("Same Model", "", 95.0, 0.0)
+    policy.record_request()
+    assert not policy.try_spend()
+
+
+def test_policy_is_kept_per_options_node():
+    options = {"hedge_mode": "Fallback Model", "hedge_id": uuid.uuid4().hex, "hedge_budget": 5}
+    policy = get_hedge_policy(options)
+    assert policy is get_hedge_policy(dict(options, hedge_budget=20))
+    assert policy.budget_percent == 20.0
+    assert get_hedge_policy({"hedge_mode": "Off"}) is None
+
+
+def test_delay_is_a_latency_percentile_once_known():
+    model = unique_model()
+    policy = HedgePolicy("Same Model", "", 90.0, 10.0)
+    assert policy.delay(model, "image", 8.0) == 2.0
+    assert policy.delay(model, "image", 0) is None
+    for i in range(20):
+        get_latency_tracker().record(model, "image", float(i))
+    assert policy.delay(model, "image", 8.0) == 18.0
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    model = unique_model()
+    policy = HedgePolicy("Fallback Model", "models/test-fallback", 95.0, 100.0)
+    cancelled = []
+    primary_cancel = {}
+
+    def call(call_model, cancel):
+        if call_model == model:
+            primary_cancel['event'] = cancel
+            cancel.wait(5)
+            raise CallCancelledError()
+        return "fast"
+
+    # No latency samples yet: hedge after a quarter of the 2s deadline
+    started = time.monotonic()
+    result = run_hedged(call, model, "image", policy, 2.0,
+                        on_cancelled=lambda cancelled_model, seconds: cancelled.append(cancelled_model))
+    assert time.monotonic() - started < 1.5
+    assert result == ("fast", "models/test-fallback", True)
+    assert primary_cancel['event'].is_set()
+    assert cancelled == [model]
+
+
+def test_no_hedge_once_the_budget_is_spent():
+    model = unique_model()
+    policy = HedgePolicy("Same Model", "", 95.0, 10.0)
+    assert policy.try_spend()
+    calls = []
+
+    def call(call_model, cancel):
+        calls.append(threading.current_thread().name)
+        time.sleep(0.8)
+        return "slow"
+
+    assert run_hedged(call, model, "image", policy, 2.0) == ("slow", model, False)
+    assert len(calls) == 1
+
+
+def test_primary_error_before_the_hedge_is_raised():
+    policy = HedgePolicy("Same Model", "", 95.0, 100.0)
+    calls = []
+
+    def call(call_model, cancel):
+        calls.append(call_model)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError, match="bad request"):
+        run_hedged(call, unique_model(), "image", policy, 2.0)
+    assert len(calls) == 1
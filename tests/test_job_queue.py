@@ -0,0 +1,89 @@
+"""Tests for the job queue: leases, expiry and reclaim, attempts and outcomes."""
+
+import time
+
+import pytest
+
+from utils.job_queue import JobQueue, _JobState
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    queue.create(str(tmp_path), "image", {"gemini_model": "models/gemini-2.5-flash", "gemini_api_key": "secret"})
+    queue.enqueue([f"/media/{i}.png" for i in range(4)])
+    return queue
+
+
+def test_settings_drop_the_api_key_and_must_match(queue, tmp_path):
+    assert "gemini_api_key" not in queue.settings()['options']
+    with pytest.raises(ValueError, match="different options"):
+        queue.create(str(tmp_path), "image", {"gemini_model": "models/gemini-2.5-pro"})
+
+
+def test_enqueue_ignores_queued_paths(queue):
+    assert queue.enqueue(["/media/0.png", "/media/new.png"]) == 1
+    assert queue.progress()['total'] == 5
+
+
+def test_workers_claim_disjoint_jobs(queue):
+    first = queue.claim("w1", count=2)
+    second = queue.claim("w2", count=8)
+    assert len(first) == 2 and len(second) == 2
+    assert not {path for _, path in first} & {path for _, path in second}
+    assert queue.claim("w3") == []
+    assert queue.progress()['leased'] == 4
+
+
+def test_expired_lease_is_reclaimed_and_the_old_worker_loses_it(queue):
+    job_id, path = queue.claim("w1", count=1, lease_seconds=0.0)[0]
+    time.sleep(0.01)
+
+    reclaimed = queue.claim("w2", count=8)
+    assert (job_id, path) in reclaimed
+    assert not queue.finish(job_id, "w1", "described")
+    assert queue.finish(job_id, "w2", "described")
+
+
+def test_renewed_lease_is_not_reclaimed(queue):
+    queue.claim("w1", count=4, lease_seconds=0.0)
+    assert queue.renew("w1", lease_seconds=60.0) == 4
+    assert queue.claim("w2") == []
+
+
+def test_job_fails_after_max_attempts_and_can_be_retried(queue):
+    for _ in range(2):
+        assert queue.claim("w1", count=4, lease_seconds=0.0, max_attempts=2)
+        time.sleep(0.01)
+
+    assert queue.claim("w2", max_attempts=2) == []
+    progress = queue.progress()
+    assert progress['failed'] == 4
+    assert "lease expired" in progress['recent_errors'][0]['error']
+
+    assert queue.retry_failed() == 4
+    assert len(queue.claim("w2", max_attempts=2)) == 4
+
+
+def test_release_returns_jobs_without_using_an_attempt(queue):
+    queue.claim("w1", count=4)
+    assert queue.release("w1") == 4
+    assert queue.unfinished() == 4
+    attempts = queue.connection().execute("SELECT MAX(attempts) FROM jobs").fetchone()[0]
+    assert attempts == 0
+
+
+def test_job_state_records_outcomes(queue):
+    state = _JobState(queue, "w1")
+    jobs = queue.claim("w1", count=3)
+    for job_id, path in jobs:
+        state.track(path, job_id)
+
+    state.record(jobs[0][1], 'done')
+    state.record(jobs[1][1], 'blocked', "Prompt feedback: blocked")
+    state.record(jobs[2][1], 'failed', "HTTP 500")
+
+    progress = queue.progress()
+    assert progress['outcomes'] == {'described': 1, 'blocked': 1}
+    assert progress['failed'] == 1
+    assert progress['recent_errors'] == [{'path': jobs[2][1], 'error': "HTTP 500"}]
@@ -0,0 +1,84 @@
+"""Tests for the API key pool: least-loaded selection, quarantine and quotas."""
+
+import pytest
+
+from utils.key_pool import AUTH_QUARANTINE_SECONDS, ApiKeyPool, NoApiKeyAvailableError, mask_key
+
+
+class ApiError(Exception):
+    def __init__(self, code, message="error"):
+        super().__init__(message)
+        self.code = code
+
+
+def stats_by_key(pool):
+    return {row['key']: row for row in pool.stats()}
+
+
+def test_spreads_requests_over_keys():
+    pool = ApiKeyPool([("key-aaaa", 0, 0), ("key-bbbb", 0, 0)])
+    used = [pool.call(lambda key: key) for _ in range(4)]
+    assert sorted(used) == ["key-aaaa", "key-aaaa", "key-bbbb", "key-bbbb"]
+
+
+def test_rate_limited_key_is_quarantined_and_the_call_retried():
+    pool = ApiKeyPool([("key-aaaa", 0, 0), ("key-bbbb", 0, 0)])
+    calls = []
+
+    def call(key):
+        calls.append(key)
+        if key == "key-aaaa":
+            raise ApiError(429, "quota exceeded")
+        return key
+
+    assert pool.call(call) == "key-bbbb"
+    assert pool.call(call) == "key-bbbb"
+    assert calls.count("key-aaaa") == 1
+    quarantined = stats_by_key(pool)[mask_key("key-aaaa")]
+    assert 0 < quarantined['quarantined_for'] <= 30
+    assert quarantined['errors'] == 1
+
+
+def test_invalid_key_is_quarantined_for_an_hour():
+    pool = ApiKeyPool([("key-aaaa", 0, 0), ("key-bbbb", 0, 0)])
+
+    def call(key):
+        if key == "key-aaaa":
+            raise ApiError(400, "API key not valid. Please pass a valid API key.")
+        return key
+
+    for _ in range(2):
+        assert pool.call(call) == "key-bbbb"
+    assert stats_by_key(pool)[mask_key("key-aaaa")]['quarantined_for'] > AUTH_QUARANTINE_SECONDS - 60
+
+
+def test_other_errors_are_raised_without_quarantine():
+    pool = ApiKeyPool([("key-aaaa", 0, 0), ("key-bbbb", 0, 0)])
+
+    def call(key):
+        raise ApiError(500, "internal")
+
+    with pytest.raises(ApiError):
+        pool.call(call)
+    assert all(row['quarantined_for'] == 0 for row in pool.stats())
+    assert sum(row['requests'] for row in pool.stats()) == 1
+
+
+def test_all_keys_quarantined_raises():
+    pool = ApiKeyPool([("key-aaaa", 0, 0), ("key-bbbb", 0, 0)])
+
+    def call(key):
+        raise ApiError(429, "quota exceeded")
+
+    with pytest.raises(ApiError):
+        pool.call(call)
+    with pytest.raises(NoApiKeyAvailableError) as excinfo:
+        pool.call(lambda key: key)
+    assert excinfo.value.code == 429
+
+
+def test_daily_quota_moves_requests_to_other_keys():
+    pool = ApiKeyPool([("key-aaaa", 0, 1), ("key-bbbb", 0, 1)])
+    assert sorted(pool.call(lambda key: key) for _ in range(2)) == ["key-aaaa", "key-bbbb"]
+    with pytest.raises(NoApiKeyAvailableError):
+        pool.call(lambda key: key)
@@ -0,0 +1,79 @@
+"""Tests for perceptual hashes and the BK-tree near-duplicate lookup."""
+
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.cache import GeminiCache
+from utils.cache_index import BKTree, parse_perceptual_hash
+from utils.media import hamming_distance, perceptual_hash
+
+MODEL = "models/gemini-2.5-flash"
+OPTIONS = {"describe_bokeh": True}
+
+
+def test_bk_tree_matches_a_linear_scan():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    # Near copies so that small distances actually occur
+    values += [value ^ (1 << rng.randrange(64)) for value in values[:100]]
+    tree = BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, index)
+
+    for query in values[:20] + [rng.getrandbits(64) for _ in range(5)]:
+        for max_distance in (0, 3, 12):
+            expected = sorted((hamming_distance(query, value), index) for index, value in enumerate(values)
+                              if hamming_distance(query, value) <= max_distance)
+            found = tree.search(query, max_distance)
+            assert sorted(found) == expected
+            assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+
+
+def test_parse_perceptual_hash():
+    assert parse_perceptual_hash("phash:ff00") == ("phash", 0xff00)
+    assert parse_perceptual_hash("phash:not-hex") is None
+    assert parse_perceptual_hash("ff00") is None
+    assert parse_perceptual_hash(None) is None
+
+
+@pytest.mark.parametrize("algorithm", ["phash", "dhash"])
+def test_resized_copy_hashes_close(algorithm):
+    x, y = np.meshgrid(np.linspace(0, 1, 256), np.linspace(0, 1, 256))
+    pixels = (np.stack([x, y, (x * y)], axis=-1) * 255).astype(np.uint8)
+    pixels[64:128, 96:200] = 255
+    original = Image.fromarray(pixels)
+    resized = original.resize((180, 180), Image.BILINEAR)
+    other = Image.fromarray(np.ascontiguousarray(pixels[::-1, ::-1]))
+
+    value = perceptual_hash(original, algorithm)
+    assert hamming_distance(value, perceptual_hash(resized, algorithm)) <= 6
+    assert hamming_distance(value, perceptual_hash(other, algorithm)) > 10
+
+
+def test_cache_lookup_is_limited_to_the_same_model_and_options(tmp_path):
+    cache = GeminiCache(str(tmp_path / "cache"))
+    value = 0x0123456789abcdef
+    cache.set("original", MODEL, "A description", "Text2Image", OPTIONS,
+              extra_data={'perceptual_hash': f"phash:{value:016x}"})
+    cache.set("other options", MODEL, "Other", "Text2Image", {"describe_bokeh": False},
+              extra_data={'perceptual_hash': f"phash:{value:016x}"})
+    near = f"phash:{value ^ 0b111:016x}"
+
+    entry, distance = cache.find_near_duplicate(near, MODEL, "Text2Image", OPTIONS, max_distance=4)
+    assert (entry['description'], distance) == ("A description", 3)
+    assert cache.find_near_duplicate(near, MODEL, "Text2Image", OPTIONS, max_distance=2) is None
+    assert cache.find_near_duplicate(near, "models/gemini-2.5-pro", "Text2Image", OPTIONS, max_distance=4) is None
+    assert cache.find_near_duplicate(f"dhash:{value:016x}", MODEL, "Text2Image", OPTIONS, max_distance=4) is None
+    assert cache.find_near_duplicate(near, MODEL, "Text2Image", OPTIONS, max_distance=0) is None
+
+
+def test_entries_with_the_top_bit_set_survive_sqlite(tmp_path):
+    cache = GeminiCache(str(tmp_path / "cache"))
+    value = 0xfedcba9876543210
+    cache.set("original", MODEL, "A description", "Text2Image", OPTIONS,
+              extra_data={'perceptual_hash': f"phash:{value:016x}"})
+    entry, distance = cache.find_near_duplicate(f"phash:{value:016x}", MODEL, "Text2Image", OPTIONS, max_distance=1)
+    assert distance == 0
@@ -0,0 +1,85 @@
+"""Tests for negative caching of empty or blocked Gemini responses."""
+
+import time
+
+import numpy as np
+import pytest
+
+from utils import cache as cache_module
+from utils import nodes
+from utils import scheduler as scheduler_module
+from utils.cache import GeminiCache, negative_cache_ttl
+from utils.file_lock import atomic_write_json
+from utils.gemini_backend import GeminiBackend, ReplayResponse, set_backend
+
+MODEL = "models/gemini-2.5-flash"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GeminiCache(str(tmp_path / "cache"))
+
+
+def test_ttl_from_node_and_environment(monkeypatch):
+    monkeypatch.setenv("SK_GEMINI_NEGATIVE_CACHE_HOURS", "2")
+    assert negative_cache_ttl() == 7200
+    assert negative_cache_ttl(-1) == 7200
+    assert negative_cache_ttl(0.5) == 1800
+    assert negative_cache_ttl(0) == 0
+    monkeypatch.setenv("SK_GEMINI_NEGATIVE_CACHE_HOURS", "not a number")
+    assert negative_cache_ttl() > 0
+
+
+def test_negative_entry_expires_at_read_time(cache):
+    cache.set_negative("media", MODEL, "Prompt feedback: blocked", "Text2Image", {})
+    entry = cache.get_negative("media", MODEL, "Text2Image", {}, ttl=3600)
+    assert entry['reason'] == "Prompt feedback: blocked"
+    # Normal lookups never return negative entries
+    assert cache.get("media", MODEL, "Text2Image", {}) is None
+
+    assert cache.get_negative("media", MODEL, "Text2Image", {}, ttl=0) is None
+    entry_path = cache._get_cache_file_path(entry['cache_key'])
+    stored = cache.get_entry(entry['cache_key'])
+    stored['timestamp'] = time.time() - 7200
+    atomic_write_json(entry_path, stored)
+    assert cache.get_negative("media", MODEL, "Text2Image", {}, ttl=3600) is None
+
+
+def test_success_replaces_negative_entry(cache):
+    cache.set_negative("media", MODEL, "blocked", "Text2Image", {})
+    cache.set("media", MODEL, "A description", "Text2Image", {})
+    assert cache.get_negative("media", MODEL, "Text2Image", {}, ttl=3600) is None
+    assert cache.get("media", MODEL, "Text2Image", {})['description'] == "A description"
+
+
+class BlockingBackend(GeminiBackend):
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, api_key, model, contents, config=None):
+        self.calls += 1
+        return ReplayResponse(None, prompt_feedback={'block_reason': "SAFETY"})
+
+
+def test_refused_image_fails_before_it_is_prepared(tmp_path, monkeypatch, cache):
+    monkeypatch.setattr(cache_module, "_global_cache", cache)
+    monkeypatch.setattr(scheduler_module, "_global_scheduler",
+                        scheduler_module.RequestScheduler(1, heartbeat_dir=str(tmp_path / "scheduler")))
+    backend = BlockingBackend()
+    set_backend(backend)
+    image = np.random.default_rng(0).random((1, 64, 64, 3), dtype=np.float32)
+    try:
+        node = nodes.GeminiMediaDescribe()
+        with pytest.raises(Exception, match="empty response"):
+            node.describe_media("Upload Media", "image", 0, image=image)
+        assert backend.calls == 1
+
+        def no_preparation(*args, **kwargs):
+            raise AssertionError("the image was prepared")
+
+        monkeypatch.setattr(nodes, "run_cpu", no_preparation)
+        with pytest.raises(Exception, match="Skipping until"):
+            node.describe_media("Upload Media", "image", 0, image=image)
+        assert backend.calls == 1
+    finally:
+        set_backend(None)
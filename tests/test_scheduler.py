@@ -0,0 +1,122 @@
+"""Tests for the request scheduler: priority classes, tenant fairness and bounded queues."""
+
+import threading
+import time
+
+import pytest
+
+from utils.cancellation import CallCancelledError, DeadlineExceededError
+from utils.scheduler import RequestScheduler, SchedulerBusyError, request_schedule
+
+
+def make_scheduler(tmp_path, shared=1, interactive=0, depth=16):
+    return RequestScheduler(shared, interactive, depth, heartbeat_dir=str(tmp_path))
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def queued(scheduler, priority):
+    return scheduler.stats()['classes'][priority]['queued']
+
+
+def start_waiter(scheduler, order, priority, tenant, name=None):
+    """Queue one request; once granted it records its name and releases the slot."""
+    before = queued(scheduler, priority)
+
+    def run():
+        with scheduler.slot((priority, tenant)):
+            order.append(name or tenant)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    wait_until(lambda: queued(scheduler, priority) > before)
+    return thread
+
+
+def test_request_schedule_defaults():
+    assert request_schedule(None) == ("interactive", "default")
+    assert request_schedule({"request_priority": "Batch", "scheduler_tenant": " team-a "}) == ("batch", "team-a")
+    assert request_schedule({"request_priority": "bogus"}) == ("interactive", "default")
+
+
+def test_interactive_requests_start_before_waiting_batch_requests(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    scheduler.acquire("batch", "holder")
+    order = []
+    threads = [start_waiter(scheduler, order, "batch", "b"), start_waiter(scheduler, order, "interactive", "i")]
+
+    scheduler.release("batch", "holder")
+    for thread in threads:
+        thread.join(5)
+    assert order == ["i", "b"]
+
+
+def test_reserved_interactive_slot_is_not_used_by_batch(tmp_path):
+    scheduler = make_scheduler(tmp_path, shared=1, interactive=1)
+    scheduler.acquire("batch")
+
+    assert scheduler.acquire("interactive", timeout=1) == 0.0
+    with pytest.raises(DeadlineExceededError):
+        scheduler.acquire("batch", timeout=0.2)
+    assert queued(scheduler, "batch") == 0
+
+
+def test_tenants_take_turns(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    scheduler.acquire("batch", "holder")
+    order = []
+    threads = [start_waiter(scheduler, order, "batch", "a", f"a{i}") for i in range(3)]
+    threads.append(start_waiter(scheduler, order, "batch", "b", "b0"))
+
+    scheduler.release("batch", "holder")
+    for thread in threads:
+        thread.join(5)
+    # Tenant b does not wait behind all of tenant a's requests
+    assert order == ["a0", "b0", "a1", "a2"]
+
+
+def test_full_queue_rejects_at_once(tmp_path):
+    scheduler = make_scheduler(tmp_path, depth=1)
+    scheduler.acquire("batch")
+    order = []
+    thread = start_waiter(scheduler, order, "batch", "a")
+
+    started = time.monotonic()
+    with pytest.raises(SchedulerBusyError) as excinfo:
+        scheduler.acquire("batch")
+    assert time.monotonic() - started < 1.0
+    assert excinfo.value.code == 429
+    assert scheduler.stats()['classes']['batch']['rejected'] == 1
+
+    scheduler.release("batch")
+    thread.join(5)
+    assert order == ["a"]
+
+
+def test_cancelled_waiter_leaves_the_queue(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    scheduler.acquire("interactive")
+    cancel = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            scheduler.acquire("interactive", cancel=cancel)
+        except CallCancelledError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    wait_until(lambda: queued(scheduler, "interactive") == 1)
+    cancel.set()
+    thread.join(5)
+
+    assert len(errors) == 1
+    assert queued(scheduler, "interactive") == 0
+    scheduler.release("interactive")
+    assert scheduler.acquire("interactive", timeout=1) == 0.0
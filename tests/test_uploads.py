@@ -0,0 +1,88 @@
+"""Tests for content-addressed, resumable uploads."""
+
+import hashlib
+import os
+
+import pytest
+
+from utils.uploads import CHUNK_SIZE, ChunkedUploads, UploadError
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    return ChunkedUploads(str(tmp_path / "input"))
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_interrupted_upload_resumes_from_the_bytes_received(uploads):
+    digest = sha256(DATA)
+    assert uploads.begin("image", digest, len(DATA), "photo.PNG") == {
+        'status': 'partial', 'received': 0, 'chunk_size': CHUNK_SIZE}
+    assert uploads.write_chunk("image", digest, len(DATA), 0, DATA[:4000]) == 4000
+
+    # A new session (page reload, restart) continues where the last one stopped
+    assert ChunkedUploads(uploads.input_dir).begin("image", digest, len(DATA), "photo.PNG")['received'] == 4000
+    with pytest.raises(UploadError) as excinfo:
+        uploads.write_chunk("image", digest, len(DATA), 0, DATA[:4000])
+    assert (excinfo.value.status, excinfo.value.received) == (409, 4000)
+
+    uploads.write_chunk("image", digest, len(DATA), 4000, DATA[4000:])
+    result = uploads.complete("image", digest, len(DATA), "photo.PNG")
+    assert result == {'status': 'complete', 'name': f"{digest}.png", 'subfolder': "gemini_images", 'type': "input"}
+    with open(os.path.join(uploads.input_dir, "gemini_images", f"{digest}.png"), "rb") as f:
+        assert f.read() == DATA
+
+
+def test_known_content_is_not_transferred_again(uploads):
+    digest = sha256(DATA)
+    uploads.begin("image", digest, len(DATA), "a.png")
+    uploads.write_chunk("image", digest, len(DATA), 0, DATA)
+    uploads.complete("image", digest, len(DATA), "a.png")
+
+    result = uploads.begin("image", digest, len(DATA), "copy.png")
+    assert (result['status'], result['name']) == ("exists", f"{digest}.png")
+
+
+def test_sha256_mismatch_discards_the_upload(uploads):
+    claimed = sha256(DATA)
+    corrupted = DATA[:-1] + b"\x00"
+    uploads.begin("image", claimed, len(DATA), "a.png")
+    uploads.write_chunk("image", claimed, len(DATA), 0, corrupted)
+
+    with pytest.raises(UploadError) as excinfo:
+        uploads.complete("image", claimed, len(DATA), "a.png")
+    assert (excinfo.value.status, excinfo.value.received) == (422, 0)
+    assert uploads.begin("image", claimed, len(DATA), "a.png")['received'] == 0
+    assert not os.path.exists(os.path.join(uploads.input_dir, "gemini_images", f"{claimed}.png"))
+
+
+def test_incomplete_upload_cannot_complete(uploads):
+    digest = sha256(DATA)
+    uploads.write_chunk("image", digest, len(DATA), 0, DATA[:100])
+    with pytest.raises(UploadError) as excinfo:
+        uploads.complete("image", digest, len(DATA), "a.png")
+    assert (excinfo.value.status, excinfo.value.received) == (409, 100)
+
+
+@pytest.mark.parametrize("media_type, digest, size, name", [
+    ("audio", sha256(DATA), len(DATA), "a.png"),
+    ("image", "ABC", len(DATA), "a.png"),
+    ("image", sha256(DATA), -1, "a.png"),
+    ("image", sha256(DATA), len(DATA), "a.exe"),
+    ("image", sha256(DATA), len(DATA), ""),
+])
+def test_invalid_requests_are_rejected(uploads, media_type, digest, size, name):
+    with pytest.raises(UploadError) as excinfo:
+        uploads.complete(media_type, digest, size, name)
+    assert excinfo.value.status == 400
+
+
+def test_chunks_past_the_declared_size_are_rejected(uploads):
+    digest = sha256(DATA)
+    with pytest.raises(UploadError):
+        uploads.write_chunk("image", digest, 10, 0, DATA[:11])
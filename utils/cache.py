@@ -4,13 +4,71 @@ Cache utility for Gemini media descriptions.
 Provides transparent caching of Gemini API responses based on media content and prompts.
 Cache keys combine media identifiers with configurable option flags to ensure unique storage
 per media+prompt combination.
+
+Negative entries record requests that Gemini answered without text (e.g. safety blocks), so
+identical requests can fail fast instead of paying for another upload and generation. They
+share the key space with normal entries, are ignored by get(), and expire after a TTL
+(SK_GEMINI_NEGATIVE_CACHE_HOURS, default 24; overridable per Options node).
 """
 
 import os
 import json
 import hashlib
 import time
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from .file_lock import atomic_write_bytes, file_lock
+from .cache_index import CacheIndex, INDEX_FILENAME, parse_perceptual_hash
+from .remote_cache import RemoteCacheClient, create_remote_client_from_env
+from .fingerprint import get_video_fingerprint
+
+DEFAULT_NEGATIVE_CACHE_HOURS = 24.0
+
+# A remote miss is remembered briefly so get() followed by get_negative() costs one round trip
+REMOTE_MISS_MEMO_SECONDS = 5.0
+
+
+def negative_cache_ttl(hours: Optional[float] = None) -> float:
+    """
+    Negative cache TTL in seconds.
+
+    Args:
+        hours: Per-node override; None or a negative value uses SK_GEMINI_NEGATIVE_CACHE_HOURS
+
+    Returns:
+        TTL in seconds (0 disables negative caching)
+    """
+    if hours is None or hours < 0:
+        try:
+            hours = float(os.environ.get("SK_GEMINI_NEGATIVE_CACHE_HOURS", DEFAULT_NEGATIVE_CACHE_HOURS))
+        except ValueError:
+            hours = DEFAULT_NEGATIVE_CACHE_HOURS
+    return max(hours, 0.0) * 3600
+
+
+def near_duplicate_distance(distance: Optional[int] = None) -> int:
+    """
+    Maximum Hamming distance for reusing a near-duplicate image's description.
+
+    Args:
+        distance: Per-node override; None or a negative value uses SK_GEMINI_NEAR_DUPLICATE_DISTANCE
+
+    Returns:
+        Distance in bits out of 64 (0 disables near-duplicate lookups, the default)
+    """
+    if distance is None or distance < 0:
+        try:
+            distance = int(os.environ.get("SK_GEMINI_NEAR_DUPLICATE_DISTANCE", "0"))
+        except ValueError:
+            distance = 0
+    return max(int(distance), 0)
+
+
+def perceptual_hash_algorithm() -> str:
+    """Perceptual hash used for near-duplicate lookups (SK_GEMINI_PERCEPTUAL_HASH: phash or dhash)."""
+    algorithm = os.environ.get("SK_GEMINI_PERCEPTUAL_HASH", "phash").strip().lower()
+    return algorithm if algorithm in ("phash", "dhash") else "phash"
 
 
 class GeminiCache:
@@ -25,18 +83,45 @@ class GeminiCache:
     - options_hash is an MD5 hash of the JSON-serialized options dictionary
 
     This design scales to unlimited options without requiring code changes.
+
+    When a remote store is given, the local directory acts as a near-cache in front of it:
+    local misses are looked up remotely (and copied locally on a hit), and new entries are
+    sent to the remote store in the background.
     """
 
-    def __init__(self, cache_dir: Optional[str] = None):
-        """Initialize cache with specified directory."""
+    def __init__(self, cache_dir: Optional[str] = None, remote: Optional[RemoteCacheClient] = None):
+        """Initialize cache with specified directory and optional shared remote store."""
         if cache_dir is None:
             # Use a cache directory in the same location as this module
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             cache_dir = os.path.join(base_dir, "cache", "gemini_descriptions")
 
         self.cache_dir = cache_dir
+        self.remote = remote
+        self._index: Optional[CacheIndex] = None
+        # Lookup counters since this process started
+        self._counters = {'hits': 0, 'remote_hits': 0, 'near_hits': 0, 'misses': 0}
+        self._counters_lock = threading.Lock()
+        self._remote_misses: Dict[str, float] = {}
         os.makedirs(cache_dir, exist_ok=True)
 
+    @property
+    def index(self) -> CacheIndex:
+        """Secondary index over entries, opened on first use (and built from disk if new)."""
+        if self._index is None:
+            index = CacheIndex(os.path.join(self.cache_dir, INDEX_FILENAME))
+            if index.created:
+                count = self._rebuild(index)
+                if count:
+                    print(f"[CACHE] Indexed {count} existing cache entries")
+            self._index = index
+        return self._index
+
+    def _rebuild(self, index: CacheIndex) -> int:
+        # One rebuild at a time across processes sharing the cache directory
+        with file_lock(os.path.join(self.cache_dir, INDEX_FILENAME + ".lock")):
+            return index.rebuild(self.cache_dir, self._get_options_hash)
+
     def _get_file_identifier(self, file_path: str) -> str:
         """Get unique identifier for a file based on path and modification time."""
         if not os.path.exists(file_path):
@@ -53,15 +138,19 @@ class GeminiCache:
         hash_obj = hashlib.sha256(tensor_str.encode('utf-8'))
         return f"tensor:{hash_obj.hexdigest()[:16]}"
 
-    def _get_cache_key(self, media_identifier: str, gemini_model: str, 
-                      model_type: str = "", options: Dict[str, Any] = None) -> str:
-        """Generate cache key from media identifier and configurable option settings."""
-        # Hash the options dict for scalable cache keys
+    @staticmethod
+    def _get_options_hash(options: Optional[Dict[str, Any]] = None) -> str:
+        """Hash the options dict for scalable cache keys."""
         if options is None:
             options = {}
 
         # Sort keys to ensure deterministic hashing regardless of dict order
-        options_hash = hashlib.md5(json.dumps(options, sort_keys=True).encode()).hexdigest()[:8]
+        return hashlib.md5(json.dumps(options, sort_keys=True).encode()).hexdigest()[:8]
+
+    def _get_cache_key(self, media_identifier: str, gemini_model: str, 
+                      model_type: str = "", options: Dict[str, Any] = None) -> str:
+        """Generate cache key from media identifier and configurable option settings."""
+        options_hash = self._get_options_hash(options)
 
         key_components = [
             media_identifier,
@@ -92,30 +181,218 @@ class GeminiCache:
             Cached result dictionary or None if not found
         """
         cache_key = self._get_cache_key(media_identifier, gemini_model, model_type, options)
-        cache_file = self._get_cache_file_path(cache_key)
 
-        if not os.path.exists(cache_file):
+        cached_data = self.get_entry(cache_key)
+        if cached_data is None:
+            cached_data = self._get_remote(cache_key, self._get_cache_file_path(cache_key))
+            counter = 'remote_hits'
+        else:
+            counter = 'hits'
+
+        if cached_data is None or cached_data.get('negative'):
+            # Negative entries are only visible through get_negative()
+            self._count('misses')
             return None
 
-        try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cached_data = json.load(f)
+        self._count(counter)
+        return cached_data
+
+    def get_with_legacy(self, media_identifier: str, legacy_identifier: str, gemini_model: str,
+                        model_type: str = "", options: Dict[str, Any] = None,
+                        extra_data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        get() that falls back to an older identifier for the same media, migrating hits.
 
-            # Verify cache entry has required fields
-            if not all(key in cached_data for key in ['description', 'timestamp', 'cache_key']):
-                return None
+        Used when the identity scheme changes (e.g. videos moving from path+mtime to content
+        fingerprints): an entry found under the legacy identifier is copied to the new one,
+        so existing caches keep working and later lookups are direct hits.
 
+        Args:
+            media_identifier: Current identifier for the media
+            legacy_identifier: Previous identifier for the same media
+            gemini_model: The Gemini model being used
+            model_type: The model type (e.g., "Text2Image", "ImageEdit")
+            options: Dictionary of configurable options
+            extra_data: Additional data to store with a migrated entry (e.g., media_path)
+
+        Returns:
+            Cached result dictionary or None if not found under either identifier
+        """
+        cached_data = self.get(media_identifier, gemini_model, model_type, options)
+        if cached_data is not None or legacy_identifier == media_identifier:
             return cached_data
 
-        except (json.JSONDecodeError, IOError) as e:
-            # If cache file is corrupted, remove it
+        legacy = self.get(legacy_identifier, gemini_model, model_type, options)
+        if legacy is None:
+            return None
+
+        carried = {key: value for key, value in legacy.items()
+                   if key not in ('cache_key', 'media_identifier', 'gemini_model', 'model_type', 'options',
+                                  'description', 'timestamp', 'human_timestamp')}
+        self.set(media_identifier, gemini_model, legacy['description'], model_type, options,
+                 extra_data={**carried, **(extra_data or {}), 'migrated_from': legacy_identifier})
+        return legacy
+
+    def get_negative(self, media_identifier: str, gemini_model: str, model_type: str = "",
+                     options: Dict[str, Any] = None, ttl: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve an unexpired negative entry (a request Gemini previously answered without text).
+
+        Args:
+            media_identifier: Unique identifier for the media
+            gemini_model: The Gemini model being used
+            model_type: The model type (e.g., "Text2Image", "ImageEdit")
+            options: Dictionary of configurable options
+            ttl: Maximum age in seconds (default: negative_cache_ttl()); evaluated at read time,
+                so a shorter per-node TTL also applies to entries written with a longer one
+
+        Returns:
+            Negative entry dictionary (with 'reason') or None
+        """
+        if ttl is None:
+            ttl = negative_cache_ttl()
+        if ttl <= 0:
+            return None
+
+        cache_key = self._get_cache_key(media_identifier, gemini_model, model_type, options)
+        cached_data = self.get_entry(cache_key)
+        if cached_data is None:
+            cached_data = self._get_remote(cache_key, self._get_cache_file_path(cache_key))
+
+        if cached_data is None or not cached_data.get('negative'):
+            return None
+        if time.time() - cached_data['timestamp'] >= ttl:
+            return None
+        return cached_data
+
+    def find_near_duplicate(self, perceptual_hash: str, gemini_model: str, model_type: str = "",
+                            options: Dict[str, Any] = None, max_distance: int = 0) -> Optional[Tuple[Dict[str, Any], int]]:
+        """
+        Find the closest cached description of a perceptually similar image.
+
+        Only entries stored with a perceptual hash of the same algorithm, for the same model,
+        model type and options are considered.
+
+        Args:
+            perceptual_hash: ``algorithm:hex`` string, e.g. "phash:c3d1..."
+            gemini_model: The Gemini model being used
+            model_type: The model type (e.g., "Text2Image", "ImageEdit")
+            options: Dictionary of configurable options
+            max_distance: Maximum Hamming distance in bits (0 disables the lookup)
+
+        Returns:
+            (cached entry, Hamming distance) or None
+        """
+        parsed = parse_perceptual_hash(perceptual_hash)
+        if parsed is None or max_distance <= 0:
+            return None
+
+        algorithm, value = parsed
+        for distance, cache_key in self.index.near_duplicates(algorithm, value, gemini_model, model_type,
+                                                               self._get_options_hash(options), max_distance):
+            entry = self.get_entry(cache_key)
+            if entry is not None and not entry.get('negative'):
+                self._count('near_hits')
+                return entry, distance
+        return None
+
+    def set_negative(self, media_identifier: str, gemini_model: str, reason: str,
+                     model_type: str = "", options: Dict[str, Any] = None,
+                     extra_data: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Record that Gemini answered this request without text.
+
+        A later successful set() for the same request replaces the negative entry.
+
+        Args:
+            media_identifier: Unique identifier for the media
+            gemini_model: The Gemini model being used
+            reason: Feedback summary (e.g., prompt_feedback block reason)
+            model_type: The model type (e.g., "Text2Image", "ImageEdit")
+            options: Dictionary of configurable options
+            extra_data: Additional data to store
+        """
+        self.set(media_identifier, gemini_model, "", model_type, options,
+                 extra_data={**(extra_data or {}), 'negative': True, 'reason': reason})
+
+    def get_entry(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Read a local entry by cache key (as returned by list_entries), or None if missing or invalid."""
+        cache_file = self._get_cache_file_path(cache_key)
+
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached_data = json.load(f)
+        except FileNotFoundError:
+            # Missing, or purged by another process between lookup and open
+            return None
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            # Writes are atomic, so a file that fails to parse is genuinely corrupted
             print(f"[CACHE] Corrupted cache file {cache_file}, removing: {e}")
             try:
                 os.remove(cache_file)
             except OSError:
                 pass
+            self.index.remove([cache_key])
+            return None
+        except OSError as e:
+            # Unreadable (e.g. owned by another user) is not corrupted; leave it in place
+            print(f"[CACHE] Could not read cache file {cache_file}: {e}")
+            return None
+
+        # Verify cache entry has required fields
+        if not all(key in cached_data for key in ['description', 'timestamp', 'cache_key']):
+            return None
+
+        return cached_data
+
+    def _count(self, counter: str) -> None:
+        with self._counters_lock:
+            self._counters[counter] += 1
+
+    def _get_remote(self, cache_key: str, cache_file: str) -> Optional[Dict[str, Any]]:
+        """Look up a local miss in the remote store and keep a local copy of any hit."""
+        if self.remote is None:
+            return None
+
+        now = time.monotonic()
+        missed_at = self._remote_misses.get(cache_key)
+        if missed_at is not None and now - missed_at < REMOTE_MISS_MEMO_SECONDS:
+            return None
+
+        payload = self.remote.get(cache_key)
+        if payload is None:
+            if len(self._remote_misses) > 10000:
+                self._remote_misses.clear()
+            self._remote_misses[cache_key] = now
+            return None
+        self._remote_misses.pop(cache_key, None)
+
+        try:
+            cached_data = json.loads(payload)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"[CACHE] Ignoring corrupted remote entry {cache_key}: {e}")
+            return None
+
+        if not all(key in cached_data for key in ['description', 'timestamp', 'cache_key']):
             return None
 
+        self._write_entry(cache_file, cached_data, durable=False)
+        return cached_data
+
+    def _write_entry(self, cache_file: str, cache_entry: Dict[str, Any], durable: bool = True) -> Optional[bytes]:
+        """Write an entry file and its index row. Returns the serialized entry, or None on failure."""
+        index = self.index  # Opened (and built from existing files) before this entry lands on disk
+        data = json.dumps(cache_entry, indent=2, ensure_ascii=False).encode('utf-8')
+        try:
+            # Temp file + fsync + rename: concurrent readers in other processes never see a partial entry
+            atomic_write_bytes(cache_file, data, durable=durable)
+        except (IOError, OSError) as e:
+            print(f"[CACHE] Failed to write cache file {cache_file}: {e}")
+            return None
+
+        index.upsert(cache_entry, self._get_options_hash(cache_entry.get('options')), len(data))
+        return data
+
     def set(self, media_identifier: str, gemini_model: str, description: str,
             model_type: str = "", options: Dict[str, Any] = None,
             extra_data: Optional[Dict[str, Any]] = None) -> None:
@@ -151,34 +428,104 @@ class GeminiCache:
         if extra_data:
             cache_entry.update(extra_data)
 
-        try:
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_entry, f, indent=2, ensure_ascii=False)
-        except IOError as e:
-            print(f"[CACHE] Failed to write cache file {cache_file}: {e}")
+        data = self._write_entry(cache_file, cache_entry)
+
+        if self.remote is not None and data is not None:
+            # Batched and sent by a background thread, so set() never waits on the network
+            self.remote.set(cache_key, data)
+
+    def list_entries(self, gemini_model: Optional[str] = None, media_identifier: Optional[str] = None,
+                     media_path: Optional[str] = None, options: Optional[Dict[str, Any]] = None,
+                     options_hash: Optional[str] = None, model_type: Optional[str] = None,
+                     older_than: Optional[float] = None, newer_than: Optional[float] = None,
+                     limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        List cache entries matching all given filters, using the secondary index.
+
+        Args:
+            gemini_model: Exact model name (e.g., "models/gemini-2.5-pro")
+            media_identifier: Exact media identifier
+            media_path: File path, matching every version of that file
+            options: Options dict (hashed the same way as for cache keys)
+            options_hash: Precomputed options hash (alternative to options)
+            model_type: Exact model type (e.g., "Text2Image")
+            older_than: Only entries created before this Unix time
+            newer_than: Only entries created at or after this Unix time
+            limit: Maximum number of entries
+
+        Returns:
+            List of index rows (cache_key, gemini_model, model_type, media_identifier, media_path,
+            options_hash, timestamp, size), newest first
+        """
+        if options is not None:
+            options_hash = self._get_options_hash(options)
+        return self.index.query(gemini_model=gemini_model, media_identifier=media_identifier,
+                                media_path=media_path, options_hash=options_hash, model_type=model_type,
+                                older_than=older_than, newer_than=newer_than, limit=limit)
+
+    def purge(self, **filters: Any) -> int:
+        """
+        Delete all cache entries matching the filters (same arguments as list_entries).
+
+        At least one filter is required; use clear() to empty the cache. Entries are also
+        removed from the remote store when one is configured.
+
+        Returns:
+            Number of entries deleted
+        """
+        if not any(value is not None for value in filters.values()):
+            raise ValueError("purge() needs at least one filter; use clear() to remove everything")
+
+        cache_keys = [row['cache_key'] for row in self.list_entries(**filters)]
+        return self._delete_keys(cache_keys)
+
+    def clear(self) -> int:
+        """Delete every cache entry. Returns the number of entries deleted."""
+        return self._delete_keys([row['cache_key'] for row in self.index.query()])
+
+    def _delete_keys(self, cache_keys: List[str]) -> int:
+        for cache_key in cache_keys:
+            try:
+                os.remove(self._get_cache_file_path(cache_key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[CACHE] Failed to remove cache entry {cache_key}: {e}")
+        self.index.remove(cache_keys)
+        if self.remote is not None and cache_keys:
+            self.remote.delete_many(cache_keys)
+        return len(cache_keys)
+
+    def rebuild_index(self) -> int:
+        """
+        Bring the secondary index in line with the entry files, e.g. after a crash between writing
+        an entry and its index row. Returns the number of entries indexed.
+        """
+        return self._rebuild(self.index)
 
     def get_cache_info(self) -> Dict[str, Any]:
-        """Get information about the cache."""
-        if not os.path.exists(self.cache_dir):
-            return {'cache_dir': self.cache_dir, 'entries': 0, 'total_size': 0}
-
-        entries = 0
-        total_size = 0
-
-        for filename in os.listdir(self.cache_dir):
-            if filename.endswith('.json'):
-                entries += 1
-                file_path = os.path.join(self.cache_dir, filename)
-                try:
-                    total_size += os.path.getsize(file_path)
-                except OSError:
-                    pass
+        """
+        Get information about the cache.
+
+        Entry count and size come from running counters in the index, so this is constant time
+        regardless of cache size. Hit/miss counters cover lookups made by this process.
+        """
+        stats = self.index.stats()
+        with self._counters_lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['remote_hits'] + counters['misses']
 
         return {
             'cache_dir': self.cache_dir,
-            'entries': entries,
-            'total_size': total_size,
-            'total_size_mb': round(total_size / (1024 * 1024), 2)
+            'remote': self.remote.store.name if self.remote is not None else None,
+            'entries': stats['entries'],
+            'total_size': stats['total_size'],
+            'total_size_mb': round(stats['total_size'] / (1024 * 1024), 2),
+            'hits': counters['hits'],
+            'remote_hits': counters['remote_hits'],
+            'near_duplicate_hits': counters['near_hits'],
+            'misses': counters['misses'],
+            'hit_rate': round((counters['hits'] + counters['remote_hits']) / lookups, 4) if lookups else None,
         }
 
 
@@ -189,12 +536,40 @@ def get_file_media_identifier(file_path: str) -> str:
     return cache._get_file_identifier(file_path)
 
 
+def get_video_media_identifier(file_path: str) -> str:
+    """
+    Get a content-based media identifier for a video file.
+
+    Survives renames, copies, touches and re-uploads of identical files. The fingerprint is
+    computed once per file version (see utils.fingerprint).
+    """
+    if not os.path.exists(file_path):
+        return get_file_media_identifier(file_path)
+    return f"video:{get_video_fingerprint(file_path)}"
+
+
 def get_tensor_media_identifier(tensor_data: Any) -> str:
     """Get media identifier for tensor data."""
     cache = GeminiCache()
     return cache._get_tensor_identifier(tensor_data)
 
 
+def get_frames_media_identifier(frames: Any, frame_rate: float) -> str:
+    """
+    Get media identifier for an IMAGE frame batch described as a video.
+
+    Hashes the full pixel data one frame at a time, together with the shape and frame rate,
+    so only identical clips played at the same speed share an entry.
+    """
+    hash_obj = hashlib.sha256(f"frames:v1:{tuple(frames.shape)}:{frame_rate:g}\n".encode())
+    for index in range(len(frames)):
+        frame = frames[index]
+        if hasattr(frame, 'cpu'):
+            frame = frame.cpu().numpy()
+        hash_obj.update(frame.tobytes())
+    return f"frames:{hash_obj.hexdigest()[:32]}"
+
+
 # Global cache instance
 _global_cache = None
 
@@ -203,5 +578,5 @@ def get_cache() -> GeminiCache:
     """Get the global cache instance."""
     global _global_cache
     if _global_cache is None:
-        _global_cache = GeminiCache()
+        _global_cache = GeminiCache(remote=create_remote_client_from_env())
     return _global_cache
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+Command line management for the Gemini description cache.
+
+Usage (from the sk_custom_nodes directory):
+
+    python -m utils.cache_admin list --model models/gemini-2.5-pro
+    python -m utils.cache_admin purge --path /data/clips/shot_012.mp4
+    python -m utils.cache_admin purge --model models/gemini-2.5-flash --older-than-days 30 --dry-run
+    python -m utils.cache_admin rebuild-index
+
+List and purge use the secondary index, so they cost time proportional to the matches.
+"""
+
+import sys
+import json
+import time
+import argparse
+from typing import Optional, Dict, Any, List
+
+from .cache import GeminiCache
+
+
+def _add_filters(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--model", help="Exact gemini_model, e.g. models/gemini-2.5-pro")
+    parser.add_argument("--model-type", choices=["Text2Image", "ImageEdit"], help="Image model type")
+    parser.add_argument("--media", help="Exact media identifier")
+    parser.add_argument("--path", help="Media file path (all versions of the file)")
+    parser.add_argument("--options", help="Options JSON as stored in entries, e.g. '{\"describe_clothing\": false, ...}'")
+    parser.add_argument("--options-hash", help="Options hash as listed by this tool")
+    parser.add_argument("--older-than-days", type=float, help="Only entries older than this many days")
+    parser.add_argument("--newer-than-days", type=float, help="Only entries newer than this many days")
+
+
+def _filters(args: argparse.Namespace) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        'gemini_model': args.model,
+        'model_type': args.model_type,
+        'media_identifier': args.media,
+        'media_path': args.path,
+        'options': json.loads(args.options) if args.options else None,
+        'options_hash': args.options_hash,
+        'older_than': now - args.older_than_days * 86400 if args.older_than_days is not None else None,
+        'newer_than': now - args.newer_than_days * 86400 if args.newer_than_days is not None else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the Gemini description cache")
+    parser.add_argument("--cache-dir", help="Cache directory (default: cache/gemini_descriptions)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="List matching entries")
+    _add_filters(list_parser)
+    list_parser.add_argument("--limit", type=int, default=100, help="Maximum entries to show (0 = all)")
+    list_parser.add_argument("--json", action="store_true", help="Print JSON lines instead of a table")
+
+    purge_parser = subparsers.add_parser("purge", help="Delete matching entries")
+    _add_filters(purge_parser)
+    purge_parser.add_argument("--all", action="store_true", help="Delete every entry")
+    purge_parser.add_argument("--dry-run", action="store_true", help="Only report how many entries would be deleted")
+
+    subparsers.add_parser("rebuild-index", help="Re-create the secondary index from the entry files")
+
+    args = parser.parse_args(argv)
+    cache = GeminiCache(args.cache_dir)
+
+    if args.command == "rebuild-index":
+        count = cache.rebuild_index()
+        print(f"[CACHE] Indexed {count} entries in {cache.cache_dir}")
+        return 0
+
+    filters = _filters(args)
+
+    if args.command == "list":
+        rows = cache.list_entries(limit=args.limit or None, **filters)
+        for row in rows:
+            if args.json:
+                print(json.dumps(row))
+            else:
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['timestamp']))
+                print(f"{row['cache_key'][:16]}  {stamp}  {row['gemini_model']:<28} {row['options_hash']}  {row['media_identifier']}")
+        if not args.json:
+            print(f"{len(rows)} entries")
+        return 0
+
+    if not args.all and not any(value is not None for value in filters.values()):
+        parser.error("purge needs at least one filter, or --all")
+
+    if args.dry_run:
+        count = len(cache.list_entries(**filters))
+        print(f"[CACHE] Would delete {count} entries")
+        return 0
+
+    count = cache.clear() if args.all else cache.purge(**filters)
+    print(f"[CACHE] Deleted {count} entries")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Secondary index for the Gemini description cache.
+
+Cache files are named by an opaque SHA-256 key, so questions like "all entries for
+gemini-2.5-pro" or "everything for this video" would otherwise require opening every JSON
+file. This module keeps one SQLite row per cache entry with the fields worth filtering on,
+indexed so list and purge operations cost time proportional to the number of matches.
+Entry count and total size are kept as running counters by triggers, so stats are O(1).
+
+Entries that carry a perceptual hash are also searchable by Hamming distance through an
+in-memory BK-tree per (algorithm, model, model type, options) group, loaded incrementally
+from the perceptual_hashes table so entries written by other processes are picked up.
+
+SQLite runs in WAL mode with a busy timeout, so several ComfyUI workers sharing one cache
+directory can update the index concurrently.
+
+An entry file and its index row are not written atomically together, so a crash in between
+leaves the index behind the files until `python -m utils.cache_admin rebuild-index` runs.
+A rebuild upserts a row for every entry file and drops only rows whose file is gone, so rows
+that other processes add while it runs are kept.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, List, Iterable, Tuple
+
+INDEX_FILENAME = "_index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    cache_key TEXT PRIMARY KEY,
+    gemini_model TEXT NOT NULL,
+    model_type TEXT NOT NULL DEFAULT '',
+    media_identifier TEXT NOT NULL,
+    media_path TEXT,
+    options_hash TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_entries_model ON entries (gemini_model);
+CREATE INDEX IF NOT EXISTS idx_entries_media ON entries (media_identifier);
+CREATE INDEX IF NOT EXISTS idx_entries_path ON entries (media_path);
+CREATE INDEX IF NOT EXISTS idx_entries_options ON entries (options_hash);
+CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries (timestamp);
+
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    total_size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats (id, entries, total_size)
+    SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries;
+CREATE TRIGGER IF NOT EXISTS trg_entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE stats SET entries = entries + 1, total_size = total_size + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE stats SET total_size = total_size + NEW.size - OLD.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE stats SET entries = entries - 1, total_size = total_size - OLD.size WHERE id = 0;
+    DELETE FROM perceptual_hashes WHERE cache_key = OLD.cache_key;
+END;
+
+CREATE TABLE IF NOT EXISTS perceptual_hashes (
+    cache_key TEXT PRIMARY KEY,
+    algorithm TEXT NOT NULL,
+    phash INTEGER NOT NULL,
+    gemini_model TEXT NOT NULL,
+    model_type TEXT NOT NULL DEFAULT '',
+    options_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_phash_group ON perceptual_hashes (algorithm, gemini_model, model_type, options_hash);
+"""
+
+_COLUMNS = ['cache_key', 'gemini_model', 'model_type', 'media_identifier', 'media_path', 'options_hash', 'timestamp', 'size']
+
+# Upsert rather than INSERT OR REPLACE: REPLACE deletes without firing the delete trigger
+_UPSERT = (
+    f"INSERT INTO entries ({', '.join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(cache_key) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in _COLUMNS[1:])
+)
+
+
+def _to_signed64(value: int) -> int:
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def parse_perceptual_hash(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Split an ``algorithm:hex`` perceptual hash string into (algorithm, int)."""
+    if not value or ":" not in value:
+        return None
+    algorithm, digest = value.split(":", 1)
+    try:
+        return algorithm, int(digest, 16)
+    except ValueError:
+        return None
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes for Hamming-distance range queries."""
+
+    def __init__(self):
+        # Node: [hash, values, {distance: child}]
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int, item: Any) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = bin(value ^ node[0]).count("1")
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """All (distance, item) pairs within max_distance of value, nearest first."""
+        results: List[Tuple[int, Any]] = []
+        if self._root is None:
+            return results
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = bin(value ^ node[0]).count("1")
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            # Triangle inequality: only children within [d - max, d + max] can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda pair: pair[0])
+        return results
+
+
+def media_path_from_identifier(media_identifier: str) -> Optional[str]:
+    """Extract the file path from a ``file:{path}:mtime:...`` or ``missing:{path}`` identifier."""
+    if media_identifier.startswith("file:") and ":mtime:" in media_identifier:
+        return media_identifier[len("file:"):].rsplit(":mtime:", 1)[0]
+    if media_identifier.startswith("missing:"):
+        return media_identifier[len("missing:"):]
+    return None
+
+
+class CacheIndex:
+    """SQLite index over cache entries, one connection per thread."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.created = not os.path.exists(db_path)
+        # (algorithm, gemini_model, model_type, options_hash) -> [BKTree, last loaded rowid]
+        self._trees: Dict[Tuple[str, str, str, str], list] = {}
+        self._trees_lock = threading.Lock()
+        with self._connection() as conn:
+            # Indexes created before perceptual hashes existed have a delete trigger without the cleanup
+            if "perceptual_hashes" not in (conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE name = 'trg_entries_delete'").fetchone() or [""])[0]:
+                conn.execute("DROP TRIGGER IF EXISTS trg_entries_delete")
+            conn.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_for(entry: Dict[str, Any], options_hash: str, size: int) -> tuple:
+        media_identifier = entry.get('media_identifier', '')
+        return (
+            entry['cache_key'],
+            entry.get('gemini_model', ''),
+            entry.get('model_type', '') or '',
+            media_identifier,
+            entry.get('media_path') or media_path_from_identifier(media_identifier),
+            options_hash,
+            float(entry.get('timestamp', 0.0)),
+            size,
+        )
+
+    @staticmethod
+    def _phash_row_for(entry: Dict[str, Any], options_hash: str) -> Optional[tuple]:
+        parsed = parse_perceptual_hash(entry.get('perceptual_hash'))
+        if parsed is None or entry.get('negative'):
+            return None
+        algorithm, value = parsed
+        return (entry['cache_key'], algorithm, _to_signed64(value), entry.get('gemini_model', ''),
+                entry.get('model_type', '') or '', options_hash)
+
+    def upsert(self, entry: Dict[str, Any], options_hash: str, size: int = 0) -> None:
+        """Add or replace the index row for a cache entry."""
+        phash_row = self._phash_row_for(entry, options_hash)
+        with self._connection() as conn:
+            conn.execute(_UPSERT, self._row_for(entry, options_hash, size))
+            if phash_row is not None:
+                conn.execute("INSERT OR REPLACE INTO perceptual_hashes VALUES (?, ?, ?, ?, ?, ?)", phash_row)
+            else:
+                conn.execute("DELETE FROM perceptual_hashes WHERE cache_key = ?", (entry['cache_key'],))
+
+    def near_duplicates(self, algorithm: str, value: int, gemini_model: str, model_type: str, options_hash: str,
+                        max_distance: int) -> List[Tuple[int, str]]:
+        """
+        Cache keys whose perceptual hash is within max_distance bits of value, nearest first.
+
+        Only entries with the same algorithm, model, model type and options are considered, since
+        a description written for other options is not a valid answer. Keys may belong to entries
+        that were deleted since the tree was loaded; callers verify the entry still exists.
+        """
+        group = (algorithm, gemini_model, model_type or '', options_hash)
+        with self._trees_lock:
+            tree_state = self._trees.setdefault(group, [BKTree(), 0])
+            tree, last_rowid = tree_state
+            # Pick up rows added since the last query (including by other processes)
+            rows = self._connection().execute(
+                "SELECT rowid, cache_key, phash FROM perceptual_hashes WHERE algorithm = ? AND gemini_model = ? "
+                "AND model_type = ? AND options_hash = ? AND rowid > ? ORDER BY rowid",
+                (*group, last_rowid),
+            ).fetchall()
+            for row in rows:
+                tree.add(_to_unsigned64(row['phash']), row['cache_key'])
+                tree_state[1] = row['rowid']
+            return tree.search(value, max_distance)
+
+    def remove(self, cache_keys: Iterable[str]) -> None:
+        """Drop index rows for the given cache keys."""
+        keys = [(key,) for key in cache_keys]
+        if keys:
+            with self._connection() as conn:
+                conn.executemany("DELETE FROM entries WHERE cache_key = ?", keys)
+
+    def query(self, gemini_model: Optional[str] = None, media_identifier: Optional[str] = None,
+              media_path: Optional[str] = None, options_hash: Optional[str] = None,
+              model_type: Optional[str] = None, older_than: Optional[float] = None,
+              newer_than: Optional[float] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Return index rows matching all given filters, newest first.
+
+        Args:
+            gemini_model: Exact model name (e.g., "models/gemini-2.5-pro")
+            media_identifier: Exact media identifier
+            media_path: File path, matching every mtime/size version of that file
+            options_hash: Options hash as produced by GeminiCache._get_options_hash
+            model_type: Exact model type (e.g., "Text2Image")
+            older_than: Only entries with timestamp < this Unix time
+            newer_than: Only entries with timestamp >= this Unix time
+            limit: Maximum number of rows
+
+        Returns:
+            List of row dictionaries
+        """
+        clauses = []
+        params: List[Any] = []
+        for column, value in (('gemini_model', gemini_model), ('media_identifier', media_identifier),
+                              ('media_path', media_path), ('options_hash', options_hash),
+                              ('model_type', model_type)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if older_than is not None:
+            clauses.append("timestamp < ?")
+            params.append(older_than)
+        if newer_than is not None:
+            clauses.append("timestamp >= ?")
+            params.append(newer_than)
+
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM entries"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        return [dict(row) for row in self._connection().execute(sql, params)]
+
+    def rebuild(self, cache_dir: str, options_hasher) -> int:
+        """
+        Bring the index in line with the cache files on disk.
+
+        Every entry file gets an up-to-date row. Rows without a file are dropped, unless the file
+        appeared while the directory was being read (written by another process meanwhile).
+
+        Args:
+            cache_dir: Directory containing ``{cache_key}.json`` entries
+            options_hasher: Callable mapping an options dict to its options hash
+
+        Returns:
+            Number of entries indexed
+        """
+        rows = []
+        phash_rows = []
+        plain_keys = []
+        with os.scandir(cache_dir) as it:
+            for dir_entry in it:
+                if not dir_entry.name.endswith('.json'):
+                    continue
+                try:
+                    with open(dir_entry.path, 'r', encoding='utf-8') as f:
+                        entry = json.load(f)
+                    size = dir_entry.stat().st_size
+                except (json.JSONDecodeError, UnicodeDecodeError, IOError, OSError):
+                    continue
+                if 'cache_key' not in entry:
+                    continue
+                options_hash = options_hasher(entry.get('options') or {})
+                rows.append(self._row_for(entry, options_hash, size))
+                phash_row = self._phash_row_for(entry, options_hash)
+                if phash_row is not None:
+                    phash_rows.append(phash_row)
+                else:
+                    plain_keys.append((entry['cache_key'],))
+
+        indexed = {row[0] for row in rows}
+        with self._connection() as conn:
+            conn.executemany(_UPSERT, rows)
+            conn.executemany("INSERT OR REPLACE INTO perceptual_hashes VALUES (?, ?, ?, ?, ?, ?)", phash_rows)
+            conn.executemany("DELETE FROM perceptual_hashes WHERE cache_key = ?", plain_keys)
+            stale = [(key,) for (key,) in conn.execute("SELECT cache_key FROM entries")
+                     if key not in indexed and not os.path.exists(os.path.join(cache_dir, f"{key}.json"))]
+            conn.executemany("DELETE FROM entries WHERE cache_key = ?", stale)
+            # Recount rather than trusting the triggers across a bulk reload
+            conn.execute("UPDATE stats SET entries = (SELECT COUNT(*) FROM entries), "
+                         "total_size = (SELECT COALESCE(SUM(size), 0) FROM entries) WHERE id = 0")
+        with self._trees_lock:
+            self._trees.clear()
+        return len(rows)
+
+    def stats(self) -> Dict[str, int]:
+        """Entry count and total entry size, maintained by triggers (constant time)."""
+        row = self._connection().execute("SELECT entries, total_size FROM stats WHERE id = 0").fetchone()
+        return {'entries': row['entries'], 'total_size': row['total_size']} if row else {'entries': 0, 'total_size': 0}
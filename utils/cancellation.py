@@ -0,0 +1,219 @@
+"""
+Cancellable, time-bounded Gemini calls.
+
+A blocking generate_content call ignores ComfyUI's "Cancel" button and has no timeout of its
+own, so a stuck request holds the queue for minutes. run_cancellable runs the call on a
+daemon thread and waits in short slices, checking ComfyUI's interrupt flag
+(comfy.model_management) and a deadline between slices. On cancel or timeout the node raises
+immediately. The abandoned call keeps running on its thread, but the live backend derives
+its HTTP timeout from the same deadline, so it ends on its own soon after.
+
+A hedged request (see hedging.py) cancels the losing call through the same mechanism: the
+waiter raises CallCancelledError and runs the call's registered cleanups, which close the
+live backend's HTTP client so the abandoned request stops as well.
+
+Deadlines are per model profile (see request_deadline). SK_GEMINI_REQUEST_TIMEOUT overrides
+them for every model, and the Options node's request_timeout overrides them per node.
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import Future, wait
+from typing import Any, Callable, List, Optional
+
+POLL_INTERVAL = 0.1
+
+# Seconds per model family for image requests; videos get VIDEO_TIMEOUT_FACTOR times as long
+DEFAULT_REQUEST_TIMEOUTS = {
+    "flash-lite": 60.0,
+    "flash": 120.0,
+    "pro": 300.0,
+}
+FALLBACK_REQUEST_TIMEOUT = 180.0
+VIDEO_TIMEOUT_FACTOR = 2.0
+
+_call_context = threading.local()
+
+
+class DeadlineExceededError(RuntimeError):
+    """A Gemini call did not finish before its deadline (transient, like an HTTP 504)."""
+
+    code = 504
+
+    def __init__(self, timeout: float):
+        super().__init__(f"Gemini request exceeded its {timeout:g}s deadline")
+        self.timeout = timeout
+
+
+class CallCancelledError(RuntimeError):
+    """The call was cancelled by its caller, e.g. the slower half of a hedged request."""
+
+    def __init__(self) -> None:
+        super().__init__("Gemini request cancelled")
+
+
+class InterruptedByUserError(RuntimeError):
+    """Raised outside ComfyUI, where comfy.model_management's exception type is unavailable."""
+
+
+def _model_management() -> Any:
+    try:
+        import comfy.model_management as model_management
+        return model_management
+    except ImportError:
+        return None
+
+
+def processing_interrupted() -> bool:
+    """True once the operator cancelled the current ComfyUI prompt (always False outside ComfyUI)."""
+    model_management = _model_management()
+    return bool(model_management and model_management.processing_interrupted())
+
+
+def interrupt_exception() -> BaseException:
+    """The exception ComfyUI expects from an interrupted node (marks the prompt cancelled, not failed)."""
+    model_management = _model_management()
+    if model_management is not None:
+        return model_management.InterruptProcessingException()
+    return InterruptedByUserError("Processing interrupted")
+
+
+def is_interrupt(error: BaseException) -> bool:
+    """Whether error signals a user interrupt, which must not be wrapped as a node failure."""
+    model_management = _model_management()
+    if model_management is not None and isinstance(error, model_management.InterruptProcessingException):
+        return True
+    return isinstance(error, InterruptedByUserError)
+
+
+def throw_if_interrupted() -> None:
+    if processing_interrupted():
+        raise interrupt_exception()
+
+
+def request_deadline(model: str, video: bool = False, override: Optional[float] = None) -> float:
+    """
+    Deadline in seconds for one Gemini call (0 = no deadline).
+
+    Args:
+        model: Gemini model name; the default deadline depends on its family (flash-lite, flash, pro)
+        video: Video requests get VIDEO_TIMEOUT_FACTOR times the default
+        override: Per-node override; None or a negative value uses SK_GEMINI_REQUEST_TIMEOUT,
+            then the model default
+    """
+    if override is not None and override >= 0:
+        return float(override)
+    try:
+        configured = float(os.environ.get("SK_GEMINI_REQUEST_TIMEOUT", "-1"))
+    except ValueError:
+        configured = -1.0
+    if configured >= 0:
+        return configured
+
+    name = model.rsplit("/", 1)[-1]
+    timeout = FALLBACK_REQUEST_TIMEOUT
+    # Longest family name first, so "flash-lite" wins over "flash"
+    for family in sorted(DEFAULT_REQUEST_TIMEOUTS, key=len, reverse=True):
+        if family in name:
+            timeout = DEFAULT_REQUEST_TIMEOUTS[family]
+            break
+    return timeout * VIDEO_TIMEOUT_FACTOR if video else timeout
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left for the call running on this thread under run_cancellable (None = unbounded)."""
+    deadline = getattr(_call_context, 'deadline', None)
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+
+class _Cleanups:
+    """Cleanups of one run_cancellable call. Once the call is abandoned, new ones run at once."""
+
+    def __init__(self) -> None:
+        self._callbacks: List[Callable[[], Any]] = []
+        self._abandoned = False
+        self._lock = threading.Lock()
+
+    def add(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            if not self._abandoned:
+                self._callbacks.append(callback)
+                return
+        # Registered after the waiter gave up, e.g. a subprocess started just as the prompt was cancelled
+        _run_cleanup(callback)
+
+    def run(self) -> None:
+        with self._lock:
+            self._abandoned = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            _run_cleanup(callback)
+
+
+def _run_cleanup(callback: Callable[[], Any]) -> None:
+    try:
+        callback()
+    except Exception:
+        pass
+
+
+def on_cancel(callback: Callable[[], Any]) -> None:
+    """
+    Register a cleanup for the call running on this thread under run_cancellable. It runs
+    (on the waiting thread, before the waiter raises) if the call is interrupted, cancelled or
+    exceeds its deadline, or right away if that already happened.
+    """
+    cleanups = getattr(_call_context, 'cleanups', None)
+    if cleanups is not None:
+        cleanups.add(callback)
+
+
+def _abandon(cleanups: _Cleanups, error: BaseException) -> BaseException:
+    cleanups.run()
+    return error
+
+
+def run_cancellable(func: Callable[..., Any], *args: Any, timeout: Optional[float] = None,
+                    cancel: Optional[threading.Event] = None, **kwargs: Any) -> Any:
+    """
+    Run func(*args, **kwargs) on a daemon thread and wait for it, raising as soon as ComfyUI
+    is interrupted or the deadline passes.
+
+    A dedicated thread (not a shared pool) is used so callers that already run on a pool
+    worker, such as segmented video chunks, can never deadlock waiting for a free worker.
+
+    Args:
+        func: Blocking call, e.g. a backend's generate_content
+        timeout: Deadline in seconds (None or 0 = no deadline)
+        cancel: Event the caller sets to abandon the call
+
+    Raises:
+        DeadlineExceededError: the deadline passed
+        CallCancelledError: cancel was set
+        comfy.model_management.InterruptProcessingException: the operator cancelled the prompt
+    """
+    throw_if_interrupted()
+    deadline = time.monotonic() + timeout if timeout else None
+    future: Future = Future()
+    cleanups = _Cleanups()
+
+    def target() -> None:
+        _call_context.deadline = deadline
+        _call_context.cleanups = cleanups
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, name="sk-gemini-call", daemon=True).start()
+    # Poll with wait() rather than result(timeout=...): the call's own TimeoutError (e.g. a
+    # socket timeout) is the same class as a poll timeout and must not be mistaken for one
+    while not wait([future], timeout=POLL_INTERVAL).done:
+        if processing_interrupted():
+            raise _abandon(cleanups, interrupt_exception())
+        if cancel is not None and cancel.is_set():
+            raise _abandon(cleanups, CallCancelledError())
+        if deadline is not None and time.monotonic() >= deadline:
+            raise _abandon(cleanups, DeadlineExceededError(timeout))
+    return future.result()
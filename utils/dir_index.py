@@ -0,0 +1,386 @@
+"""
+Persistent directory index for browsing media_path trees.
+
+Listing a 300k-file tree with os.walk takes seconds, and the frontend needs counts and pages
+of files on every keystroke. This index keeps one SQLite row per file (size, mtime,
+extension) and per directory (its mtime). A refresh stats every known directory, but only
+lists the directories whose mtime changed, i.e. where entries were added, removed or renamed.
+Refreshing an unchanged tree costs one stat per directory, and queries are index range scans
+over path prefixes. File counts per directory and extension are kept in a small table, so
+counting a tree filtered by media type sums one row per directory instead of one per file.
+
+A directory's mtime does not change when a file inside it is rewritten in place, so size and
+mtime of such files are updated the next time their directory changes. Hidden files and
+directories (names starting with ".") are skipped, like in find_media_files, and symlinked
+directories are not descended into, so link cycles cannot make a refresh run forever.
+
+The database (cache/directory_index.sqlite3) runs in WAL mode and is shared by all processes.
+
+Only some directories may be browsed over HTTP, since a request for "/" would otherwise index
+the whole filesystem and list every file on the host to any client. By default these are
+ComfyUI's input and output directories. Since anyone who can queue a prompt chooses the
+media_path, the directories the Media Describe node picks files from only become browsable
+when that is turned on explicitly (recorded in the same database).
+
+SK_GEMINI_BROWSE_ROOTS: os.pathsep-separated directories that may be browsed instead of the
+    defaults, or "*" for any directory (the same reach as the media_path input)
+SK_GEMINI_BROWSE_MEDIA_PATHS: "1" to also allow every media_path the node has picked a file from
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+INDEX_DB_FILENAME = "directory_index.sqlite3"
+REFRESH_INTERVAL = 2.0  # Seconds during which a refreshed root is not stat'ed again
+MAX_PAGE_SIZE = 1000
+MAX_DIRECTORIES = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL,
+    scanned REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir);
+CREATE TABLE IF NOT EXISTS dir_exts (
+    dir TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    PRIMARY KEY (dir, ext)
+);
+CREATE TABLE IF NOT EXISTS media_paths (
+    path TEXT PRIMARY KEY,
+    used REAL NOT NULL
+);
+"""
+
+
+def _prefix_range(directory: str) -> Tuple[str, str]:
+    """Bounds of the paths strictly below directory, for a range scan on the primary key."""
+    prefix = directory.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def comfy_directories() -> List[str]:
+    """ComfyUI's input and output directories (<sk_custom_nodes>/input and output outside ComfyUI)."""
+    try:
+        import folder_paths
+        return [folder_paths.get_input_directory(), folder_paths.get_output_directory()]
+    except ImportError:
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return [os.path.join(base_dir, "input"), os.path.join(base_dir, "output")]
+
+
+def browse_media_paths() -> bool:
+    """Whether media_path directories the node has used become browsable (SK_GEMINI_BROWSE_MEDIA_PATHS)."""
+    return os.environ.get("SK_GEMINI_BROWSE_MEDIA_PATHS", "").strip().lower() in ("1", "true", "yes")
+
+
+def browse_roots() -> Optional[List[str]]:
+    """Directories that may be browsed (None = any, with SK_GEMINI_BROWSE_ROOTS=*)."""
+    value = os.environ.get("SK_GEMINI_BROWSE_ROOTS", "").strip()
+    if value == "*":
+        return None
+    if value:
+        roots = [root for root in value.split(os.pathsep) if root.strip()]
+    else:
+        roots = comfy_directories()
+        if browse_media_paths():
+            roots += get_directory_index().media_paths()
+    return [os.path.abspath(os.path.expanduser(root)) for root in roots]
+
+
+def check_browsable(path: str) -> str:
+    """Absolute path of a browsable directory; PermissionError outside the roots, ValueError if empty."""
+    if not path:
+        raise ValueError("path is required")
+    path = os.path.abspath(os.path.expanduser(path))
+    roots = browse_roots()
+    if roots is not None and not any(os.path.commonpath([root, path]) == root for root in roots):
+        if os.environ.get("SK_GEMINI_BROWSE_ROOTS", "").strip():
+            raise PermissionError(f"{path} is outside SK_GEMINI_BROWSE_ROOTS")
+        if browse_media_paths():
+            raise PermissionError(f"{path} may not be browsed: it is not below ComfyUI's input or output directory "
+                                  "or a media_path the node has used (see SK_GEMINI_BROWSE_ROOTS)")
+        raise PermissionError(f"{path} may not be browsed: it is not below ComfyUI's input or output directory "
+                              "(see SK_GEMINI_BROWSE_ROOTS and SK_GEMINI_BROWSE_MEDIA_PATHS)")
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"Directory not found: {path}")
+    return path
+
+
+class DirectoryIndex:
+    """SQLite index of the files below browsed directories, refreshed incrementally."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        if db_path is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            db_path = os.path.join(base_dir, "cache", INDEX_DB_FILENAME)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._refresh_lock = threading.Lock()
+        self._refreshed: Dict[str, float] = {}
+        self._known_media_paths: Set[str] = set()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                with conn:
+                    conn.executescript(_SCHEMA)
+                self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def remember_media_path(self, path: str) -> None:
+        """
+        Record a media_path the node picked a file from, which makes it browsable with
+        SK_GEMINI_BROWSE_MEDIA_PATHS. Does nothing without it, and writes each path once per
+        process. Never raises: a failure only means the directory cannot be browsed.
+        """
+        if not browse_media_paths():
+            return
+        path = os.path.abspath(path)
+        if path in self._known_media_paths:
+            return
+        try:
+            conn = self.connection()
+            with conn:
+                conn.execute("INSERT INTO media_paths (path, used) VALUES (?, ?) "
+                             "ON CONFLICT (path) DO UPDATE SET used = excluded.used", (path, time.time()))
+        except (sqlite3.Error, OSError) as e:
+            print(f"[BROWSE] Could not record {path}: {e}")
+            return
+        self._known_media_paths.add(path)
+
+    def media_paths(self) -> List[str]:
+        return [row['path'] for row in self.connection().execute("SELECT path FROM media_paths")]
+
+    def refresh(self, root: str, force: bool = False) -> Dict[str, int]:
+        """
+        Bring the index for the tree below root up to date.
+
+        Returns:
+            {'directories': stat'ed, 'rescanned': listed again, 'files_changed': rows written or deleted}
+        """
+        root = os.path.abspath(root)
+        with self._refresh_lock:
+            if not force and time.monotonic() - self._refreshed.get(root, float('-inf')) < REFRESH_INTERVAL:
+                return {'directories': 0, 'rescanned': 0, 'files_changed': 0}
+            conn = self.connection()
+            low, high = _prefix_range(root)
+            known: Dict[str, int] = {}
+            children: Dict[str, List[str]] = {}
+            for row in conn.execute("SELECT path, parent, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                                    (root, low, high)):
+                known[row['path']] = row['mtime_ns']
+                children.setdefault(row['parent'], []).append(row['path'])
+
+            stats = {'directories': 0, 'rescanned': 0, 'files_changed': 0}
+            with conn:
+                stack = [(root, os.path.dirname(root))]
+                while stack:
+                    directory, parent = stack.pop()
+                    stats['directories'] += 1
+                    try:
+                        mtime_ns = os.stat(directory).st_mtime_ns
+                    except OSError:
+                        stats['files_changed'] += self._forget(conn, directory)
+                        continue
+                    if known.get(directory) == mtime_ns:
+                        stack.extend((child, directory) for child in children.get(directory, ()))
+                        continue
+                    stats['rescanned'] += 1
+                    subdirs, changed = self._rescan(conn, directory, parent, mtime_ns, children.get(directory, ()))
+                    stats['files_changed'] += changed
+                    stack.extend((subdir, directory) for subdir in subdirs)
+            self._refreshed[root] = time.monotonic()
+        if stats['rescanned']:
+            print(f"[BROWSE] Indexed {root}: {stats['rescanned']} of {stats['directories']} directories changed, "
+                  f"{stats['files_changed']} files updated")
+        return stats
+
+    def _rescan(self, conn: sqlite3.Connection, directory: str, parent: str, mtime_ns: int,
+                known_subdirs: List[str]) -> Tuple[List[str], int]:
+        """List one directory and update its rows. Returns (subdirectories, file rows changed)."""
+        files: Dict[str, Tuple[str, int, float]] = {}
+        subdirs: List[str] = []
+        try:
+            with os.scandir(directory) as scan:
+                for entry in scan:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            files[entry.path] = (os.path.splitext(entry.name)[1].lower(), stat.st_size, stat.st_mtime)
+                    except OSError:
+                        continue
+        except OSError:
+            return [], self._forget(conn, directory)
+
+        existing = {row['path']: (row['ext'], row['size'], row['mtime'])
+                    for row in conn.execute("SELECT path, ext, size, mtime FROM files WHERE dir = ?", (directory,))}
+        removed = [(path,) for path in existing if path not in files]
+        upserts = [(path, directory, *values) for path, values in files.items() if existing.get(path) != values]
+        conn.executemany("DELETE FROM files WHERE path = ?", removed)
+        conn.executemany("INSERT OR REPLACE INTO files (path, dir, ext, size, mtime) VALUES (?, ?, ?, ?, ?)", upserts)
+
+        counts: Dict[str, int] = {}
+        for ext, _, _ in files.values():
+            counts[ext] = counts.get(ext, 0) + 1
+        conn.execute("DELETE FROM dir_exts WHERE dir = ?", (directory,))
+        conn.executemany("INSERT INTO dir_exts (dir, ext, files) VALUES (?, ?, ?)",
+                         [(directory, ext, count) for ext, count in counts.items()])
+
+        changed = len(removed) + len(upserts)
+        current = set(subdirs)
+        for subdir in known_subdirs:
+            if subdir not in current:
+                changed += self._forget(conn, subdir)
+        conn.execute("INSERT OR REPLACE INTO dirs (path, parent, mtime_ns, scanned) VALUES (?, ?, ?, ?)",
+                     (directory, parent, mtime_ns, time.time()))
+        return subdirs, changed
+
+    @staticmethod
+    def _forget(conn: sqlite3.Connection, directory: str) -> int:
+        """Drop a directory and everything below it. Returns the file rows deleted."""
+        low, high = _prefix_range(directory)
+        deleted = conn.execute("DELETE FROM files WHERE path >= ? AND path < ?", (low, high)).rowcount
+        conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (directory, low, high))
+        conn.execute("DELETE FROM dir_exts WHERE dir = ? OR (dir >= ? AND dir < ?)", (directory, low, high))
+        return deleted
+
+    def _count(self, directory: str, recursive: bool, extensions: Optional[List[str]], filters: List[str],
+               params: List[Any]) -> int:
+        """Number of files below directory matching the filters."""
+        conn = self.connection()
+        low, high = _prefix_range(directory)
+        if len(filters) == (1 if extensions else 0):
+            # Only an extension filter: sum the per-directory counts
+            where = "(dir = ? OR (dir >= ? AND dir < ?))" if recursive else "dir = ?"
+            where_params: List[Any] = [directory, low, high] if recursive else [directory]
+            if extensions:
+                where += f" AND ext IN ({', '.join('?' * len(extensions))})"
+                where_params += extensions
+            return conn.execute(f"SELECT COALESCE(SUM(files), 0) FROM dir_exts WHERE {where}",
+                                where_params).fetchone()[0]
+        scope, scope_params = ("path >= ? AND path < ?", [low, high]) if recursive else ("dir = ?", [directory])
+        return conn.execute(f"SELECT COUNT(*) FROM files WHERE {' AND '.join([scope] + filters)}",
+                            scope_params + params).fetchone()[0]
+
+    def list(self, root: str, subdir: str = "", recursive: bool = True, extensions: Optional[List[str]] = None,
+             mtime_after: Optional[float] = None, mtime_before: Optional[float] = None, name: str = "",
+             offset: int = 0, limit: int = 100, after: str = "") -> Dict[str, Any]:
+        """
+        One page of the files below root/subdir, sorted by path, with the total match count.
+
+        Args:
+            root: Browsed directory (already checked and refreshed)
+            subdir: Directory relative to root to list
+            recursive: Include files in subdirectories
+            extensions: Lowercase extensions with dot, e.g. [".mp4", ".mov"] (None = all)
+            mtime_after / mtime_before: Modification time range (epoch seconds)
+            name: Case-insensitive substring of the file name
+            offset / limit: Page position and size (limit capped at MAX_PAGE_SIZE)
+            after: Return files after this relative path instead of using offset (stable cursor)
+
+        Returns:
+            {'root', 'subdir', 'total', 'offset', 'files': [{'path', 'size', 'mtime'}],
+             'next_after': cursor for the next page or None,
+             'directories': [{'name', 'files'}] immediate subdirectories with their match counts}
+        """
+        root = os.path.abspath(root)
+        directory = os.path.normpath(os.path.join(root, subdir)) if subdir else root
+        if os.path.commonpath([root, directory]) != root:
+            raise ValueError("subdir must stay inside the browsed directory")
+        limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+
+        filters, params = self._filters(extensions, mtime_after, mtime_before, name)
+        if recursive:
+            low, high = _prefix_range(directory)
+            scope, scope_params = "path >= ? AND path < ?", [low, high]
+        else:
+            scope, scope_params = "dir = ?", [directory]
+        where = " AND ".join([scope] + filters)
+        conn = self.connection()
+        total = self._count(directory, recursive, extensions, filters, params)
+
+        page_where, page_params = where, scope_params + params
+        if after:
+            page_where += " AND path > ?"
+            page_params = page_params + [os.path.join(root, after)]
+            offset = 0
+        rows = conn.execute(f"SELECT path, size, mtime FROM files WHERE {page_where} ORDER BY path LIMIT ? OFFSET ?",
+                            page_params + [limit, max(int(offset), 0)]).fetchall()
+        files = [{'path': os.path.relpath(row['path'], root), 'size': row['size'], 'mtime': row['mtime']}
+                 for row in rows]
+
+        directories = []
+        for row in conn.execute("SELECT path FROM dirs WHERE parent = ? ORDER BY path LIMIT ?",
+                                (directory, MAX_DIRECTORIES)):
+            directories.append({'name': os.path.basename(row['path']),
+                                'files': self._count(row['path'], True, extensions, filters, params)})
+
+        return {
+            'root': root,
+            'subdir': os.path.relpath(directory, root) if directory != root else "",
+            'total': total,
+            'offset': 0 if after else max(int(offset), 0),
+            'files': files,
+            'next_after': files[-1]['path'] if len(files) == limit else None,
+            'directories': directories,
+        }
+
+    @staticmethod
+    def _filters(extensions: Optional[List[str]], mtime_after: Optional[float], mtime_before: Optional[float],
+                 name: str) -> Tuple[List[str], List[Any]]:
+        filters: List[str] = []
+        params: List[Any] = []
+        if extensions:
+            filters.append(f"ext IN ({', '.join('?' * len(extensions))})")
+            params.extend(extensions)
+        if mtime_after is not None:
+            filters.append("mtime >= ?")
+            params.append(mtime_after)
+        if mtime_before is not None:
+            filters.append("mtime < ?")
+            params.append(mtime_before)
+        if name:
+            # Match the file name only, not the directory part of the path
+            filters.append("substr(path, length(dir) + 2) LIKE ? ESCAPE '\\'")
+            escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        return filters, params
+
+
+# Global directory index instance
+_global_index: Optional[DirectoryIndex] = None
+
+
+def get_directory_index() -> DirectoryIndex:
+    """Get the global directory index instance."""
+    global _global_index
+    if _global_index is None:
+        _global_index = DirectoryIndex()
+    return _global_index
@@ -0,0 +1,113 @@
+"""
+Multi-process safe file helpers.
+
+- atomic_write_json: write to a temp file in the same directory, fsync, then rename over the
+  target, so readers in other processes only ever see the old or the new complete file
+- file_lock: advisory lock (fcntl.flock on POSIX, msvcrt.locking on Windows) for metadata
+  that is read-modify-written by several ComfyUI workers sharing one directory
+"""
+
+import os
+import json
+import secrets
+from contextlib import contextmanager
+from typing import Any, Iterator, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+try:
+    import msvcrt
+except ImportError:  # POSIX
+    msvcrt = None  # type: ignore[assignment]
+
+TEMP_SUFFIX = ".tmp"
+# Temp files are created with this mode and the kernel applies the umask, so atomic writes
+# get the permissions a plain open() would (mkstemp would create them 0600)
+FILE_MODE = 0o666
+_TEMP_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+
+
+def _fsync_directory(directory: str) -> None:
+    """Persist the rename itself (POSIX only; directories cannot be opened on Windows)."""
+    if os.name != 'posix':
+        return
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def _create_temp_file(directory: str, prefix: str) -> Tuple[int, str]:
+    """Create a new temp file in directory, like tempfile.mkstemp but honouring the umask."""
+    while True:
+        temp_path = os.path.join(directory, f"{prefix}{secrets.token_hex(8)}{TEMP_SUFFIX}")
+        try:
+            return os.open(temp_path, _TEMP_FLAGS, FILE_MODE), temp_path
+        except FileExistsError:
+            continue
+
+
+def atomic_write_bytes(path: str, data: bytes, durable: bool = True) -> None:
+    """Atomically replace ``path`` with ``data``."""
+    directory = os.path.dirname(os.path.abspath(path))
+    # The temp name never ends in the target's extension, so directory scans ignore it
+    fd, temp_path = _create_temp_file(directory, f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            if durable:
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if durable:
+        _fsync_directory(directory)
+
+
+def atomic_write_json(path: str, data: Any, durable: bool = True, **json_kwargs: Any) -> None:
+    """Atomically replace ``path`` with the JSON serialization of ``data``."""
+    json_kwargs.setdefault('indent', 2)
+    json_kwargs.setdefault('ensure_ascii', False)
+    atomic_write_bytes(path, json.dumps(data, **json_kwargs).encode('utf-8'), durable=durable)
+
+
+@contextmanager
+def file_lock(lock_path: str, shared: bool = False) -> Iterator[None]:
+    """
+    Hold an advisory lock on ``lock_path`` (created if missing) for the duration of the block.
+
+    Shared locks allow concurrent readers; exclusive locks serialize writers. On Windows all
+    locks are exclusive. Locks are advisory: only code that also takes the lock is excluded.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
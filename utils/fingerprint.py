@@ -0,0 +1,263 @@
+"""
+Content fingerprints for media files.
+
+Path+mtime+size identifiers miss the cache whenever a clip is copied, touched or uploaded
+again under a new name. A video fingerprint instead hashes the file size plus a fixed set of
+sampled byte ranges (head, tail and evenly spaced ranges in between, which covers container
+metadata at either end), optionally along with a few decoded frames. Reading ~640 KB is enough
+to tell clips apart without hashing multi-GB files.
+
+Fingerprints are memoized per (device, inode, mtime_ns, size) in memory and in a small SQLite
+database shared by all processes (cache/media_metadata.sqlite3), so each file version is only
+fingerprinted once. The same database caches video probe results (frame count, fps, size,
+duration) and scene changes keyed by fingerprint, so a clip is probed and scanned for scenes
+once no matter how often it is described.
+
+SK_GEMINI_VIDEO_FINGERPRINT_FRAMES: number of decoded frames to include (default 0, bytes only).
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Optional, Dict, Tuple, List, Any
+
+FINGERPRINT_VERSION = 1
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_COUNT = 8  # Evenly spaced ranges in addition to the head and the tail
+
+METADATA_DB_FILENAME = "media_metadata.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    path TEXT,
+    PRIMARY KEY (dev, inode, mtime_ns, size, kind)
+);
+CREATE TABLE IF NOT EXISTS probes (
+    fingerprint TEXT PRIMARY KEY,
+    prober TEXT NOT NULL,
+    data TEXT NOT NULL,
+    probe_seconds REAL NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scenes (
+    fingerprint TEXT NOT NULL,
+    threshold REAL NOT NULL,
+    data TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (fingerprint, threshold)
+);
+"""
+
+
+def _hash_frames(file_path: str, frames: int, hash_obj) -> None:
+    """Feed ``frames`` evenly spaced decoded frames (downscaled to 32x32 grayscale) into hash_obj."""
+    import cv2
+
+    cap = cv2.VideoCapture(file_path)
+    try:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count <= 0:
+            return
+        for i in range(frames):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_count * i / frames))
+            ok, frame = cap.read()
+            if not ok:
+                break
+            small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 32), interpolation=cv2.INTER_AREA)
+            hash_obj.update(small.tobytes())
+    finally:
+        cap.release()
+
+
+def compute_video_fingerprint(file_path: str, frames: int = 0) -> str:
+    """
+    Fingerprint a video from its size and sampled byte ranges (not memoized).
+
+    Files up to (SAMPLE_COUNT + 2) * SAMPLE_SIZE bytes are hashed whole.
+
+    Args:
+        file_path: Video file
+        frames: Also hash this many evenly spaced decoded frames (0 = bytes only)
+
+    Returns:
+        32-character hex fingerprint
+    """
+    size = os.path.getsize(file_path)
+    hash_obj = hashlib.sha256(f"video:v{FINGERPRINT_VERSION}:{size}:{SAMPLE_SIZE}:{SAMPLE_COUNT}:{frames}\n".encode())
+
+    with open(file_path, 'rb') as f:
+        if size <= SAMPLE_SIZE * (SAMPLE_COUNT + 2):
+            hash_obj.update(f.read())
+        else:
+            span = size - SAMPLE_SIZE
+            offsets = [0] + [span * i // (SAMPLE_COUNT + 1) for i in range(1, SAMPLE_COUNT + 1)] + [span]
+            for offset in offsets:
+                f.seek(offset)
+                hash_obj.update(f.read(SAMPLE_SIZE))
+
+    if frames > 0:
+        _hash_frames(file_path, frames, hash_obj)
+
+    return hash_obj.hexdigest()[:32]
+
+
+class MediaMetadataStore:
+    """SQLite store for per-file-version media metadata, shared across processes."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        if db_path is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            db_path = os.path.join(base_dir, "cache", METADATA_DB_FILENAME)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._memo: Dict[Tuple[int, int, int, int, str], str] = {}
+        self._probe_memo: Dict[str, Dict[str, Any]] = {}
+        self._memo_lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                with conn:
+                    conn.executescript(_SCHEMA)
+                self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def fingerprint(self, file_path: str, frames: int = 0) -> str:
+        """Memoized compute_video_fingerprint for the current version of file_path."""
+        stat = os.stat(file_path)
+        kind = f"video:v{FINGERPRINT_VERSION}:f{frames}"
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size, kind)
+
+        with self._memo_lock:
+            cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        conn = self.connection()
+        row = conn.execute(
+            "SELECT fingerprint FROM fingerprints WHERE dev = ? AND inode = ? AND mtime_ns = ? AND size = ? AND kind = ?",
+            key,
+        ).fetchone()
+        if row is not None:
+            fingerprint = row['fingerprint']
+        else:
+            fingerprint = compute_video_fingerprint(file_path, frames)
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (*key, fingerprint, os.path.abspath(file_path)))
+
+        with self._memo_lock:
+            if len(self._memo) > 100000:
+                self._memo.clear()
+            self._memo[key] = fingerprint
+        return fingerprint
+
+    def probe(self, file_path: str, frames: int = 0) -> Dict[str, Any]:
+        """
+        Video probe (frame_count, fps, width, height, duration), cached by content fingerprint.
+
+        Copies and re-uploads of a clip share the cached result, and describing the same clip
+        with different options never re-probes it.
+        """
+        from .media import probe_video, video_prober
+
+        fingerprint = self.fingerprint(file_path, frames)
+        with self._memo_lock:
+            cached = self._probe_memo.get(fingerprint)
+        if cached is not None:
+            return dict(cached)
+
+        conn = self.connection()
+        row = conn.execute("SELECT data FROM probes WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        if row is not None:
+            info = json.loads(row['data'])
+        else:
+            prober = video_prober()
+            started = time.perf_counter()
+            info = probe_video(file_path, prober)
+            elapsed = time.perf_counter() - started
+            # An unreadable file probes as all zeros; don't pin that result
+            if info.get('frame_count') or info.get('duration'):
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?)",
+                                 (fingerprint, prober, json.dumps(info), elapsed, time.time()))
+
+        with self._memo_lock:
+            if len(self._probe_memo) > 100000:
+                self._probe_memo.clear()
+            self._probe_memo[fingerprint] = info
+        return dict(info)
+
+    def scene_changes(self, file_path: str, threshold: float, frames: int = 0) -> List[float]:
+        """
+        Scene change timestamps of a video, cached by content fingerprint and threshold.
+
+        Scene detection decodes the whole clip, so re-running a segmented description would
+        otherwise cost a full decode before any chunk could be found in the cache.
+        """
+        from .media import detect_scene_changes
+
+        fingerprint = self.fingerprint(file_path, frames)
+        conn = self.connection()
+        row = conn.execute("SELECT data FROM scenes WHERE fingerprint = ? AND threshold = ?",
+                           (fingerprint, threshold)).fetchone()
+        if row is not None:
+            return json.loads(row['data'])
+
+        scenes = detect_scene_changes(file_path, threshold)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO scenes VALUES (?, ?, ?, ?)",
+                         (fingerprint, threshold, json.dumps(scenes), time.time()))
+        return scenes
+
+
+# Global metadata store instance
+_global_store = None
+
+
+def get_metadata_store() -> MediaMetadataStore:
+    """Get the global media metadata store."""
+    global _global_store
+    if _global_store is None:
+        _global_store = MediaMetadataStore()
+    return _global_store
+
+
+def video_fingerprint_frames() -> int:
+    """Decoded frames included in video fingerprints (SK_GEMINI_VIDEO_FINGERPRINT_FRAMES)."""
+    try:
+        return max(int(os.environ.get("SK_GEMINI_VIDEO_FINGERPRINT_FRAMES", "0")), 0)
+    except ValueError:
+        return 0
+
+
+def get_video_fingerprint(file_path: str) -> str:
+    """Content fingerprint of a video file, computed once per file version."""
+    return get_metadata_store().fingerprint(file_path, video_fingerprint_frames())
+
+
+def get_video_probe(file_path: str) -> Dict[str, Any]:
+    """Probe results for a video file, cached across executions and processes."""
+    return get_metadata_store().probe(file_path, video_fingerprint_frames())
+
+
+def get_video_scene_changes(file_path: str, threshold: float) -> List[float]:
+    """Scene change timestamps of a video file, cached across executions and processes."""
+    return get_metadata_store().scene_changes(file_path, threshold, video_fingerprint_frames())
@@ -0,0 +1,348 @@
+"""
+Pluggable backend for Gemini ``generate_content`` calls.
+
+Three modes are available, selected with the SK_GEMINI_BACKEND environment variable:
+
+- live (default): call the Gemini API, exactly as the nodes always have
+- record: call the Gemini API and save each response under a fingerprint of the request
+- replay: serve recorded responses without any network access, optionally with simulated
+  latency, random errors and bursts of 429 (RESOURCE_EXHAUSTED) responses
+
+Request fingerprints cover the model, the contents (media bytes and prompt text) and the
+generation config. The API key is deliberately excluded, so recordings are portable between keys.
+
+Replay settings (environment variables):
+
+- SK_GEMINI_RECORDINGS_DIR: where recordings live (default: <sk_custom_nodes>/cache/gemini_recordings)
+- SK_GEMINI_REPLAY_LATENCY: base simulated latency in seconds (default: 0)
+- SK_GEMINI_REPLAY_JITTER: extra uniformly distributed latency in seconds (default: 0)
+- SK_GEMINI_REPLAY_RECORDED_LATENCY: "1" to sleep for the latency observed while recording
+- SK_GEMINI_REPLAY_ERROR_RATE: probability (0-1) of a simulated 503 error (default: 0)
+- SK_GEMINI_REPLAY_429_EVERY / SK_GEMINI_REPLAY_429_BURST: after every N requests, fail the
+  next M requests with 429 (default: disabled)
+- SK_GEMINI_REPLAY_SEED: seed for the simulated latency/error generator
+- SK_GEMINI_REPLAY_FALLBACK_TEXT: text served when no recording matches (default: unset, which
+  raises ReplayMissError instead)
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Optional, Dict, Any, List
+
+from .file_lock import atomic_write_json
+from .cancellation import remaining_time, on_cancel
+
+BACKEND_MODES = ("live", "record", "replay")
+
+
+class ReplayAPIError(Exception):
+    """Simulated API error. Carries ``code`` and ``status`` like google.genai.errors.APIError."""
+
+    def __init__(self, code: int, status: str, message: str):
+        super().__init__(f"{code} {status}. {message}")
+        self.code = code
+        self.status = status
+        self.message = message
+
+
+class ReplayMissError(KeyError):
+    """Raised in replay mode when no recording matches the request fingerprint."""
+
+
+class EmptyResponseError(RuntimeError):
+    """Gemini answered without text, e.g. a safety block. ``reason`` holds the feedback summary."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _default_recordings_dir() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "cache", "gemini_recordings")
+
+
+def _update_fingerprint(hash_obj: Any, value: Any) -> None:
+    """Feed a (possibly nested) request value into a hash in a type-tagged, order-stable way."""
+    if value is None:
+        hash_obj.update(b"n;")
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        # Hash large media payloads separately so the tag/length framing stays unambiguous
+        hash_obj.update(b"b" + hashlib.sha256(bytes(value)).digest() + b";")
+    elif isinstance(value, bool):
+        hash_obj.update(b"t1;" if value else b"t0;")
+    elif isinstance(value, (int, float)):
+        hash_obj.update(f"d{value!r};".encode())
+    elif isinstance(value, str):
+        encoded = value.encode('utf-8')
+        hash_obj.update(f"s{len(encoded)}:".encode() + encoded)
+    elif isinstance(value, dict):
+        hash_obj.update(b"{")
+        for key in sorted(value, key=str):
+            if value[key] is None:
+                continue
+            _update_fingerprint(hash_obj, str(key))
+            _update_fingerprint(hash_obj, value[key])
+        hash_obj.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        hash_obj.update(b"[")
+        for item in value:
+            _update_fingerprint(hash_obj, item)
+        hash_obj.update(b"]")
+    elif hasattr(value, 'model_dump'):
+        # google.genai types are pydantic models; bytes survive model_dump() in python mode
+        _update_fingerprint(hash_obj, value.model_dump(exclude_none=True))
+    else:
+        _update_fingerprint(hash_obj, str(value))
+
+
+def request_fingerprint(model: str, contents: Any, config: Any = None) -> str:
+    """Fingerprint a generate_content request (model + contents + config, never the API key)."""
+    hash_obj = hashlib.sha256()
+    _update_fingerprint(hash_obj, model)
+    _update_fingerprint(hash_obj, contents)
+    _update_fingerprint(hash_obj, config)
+    return hash_obj.hexdigest()
+
+
+def _jsonable(value: Any) -> Any:
+    """Best-effort conversion of SDK response fields into JSON-serializable data."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if hasattr(value, 'model_dump'):
+        return value.model_dump(mode='json', exclude_none=True)
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return str(value)
+
+
+def _to_namespace(value: Any) -> Any:
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _to_namespace(v) for k, v in value.items()})
+    return value
+
+
+class ReplayResponse:
+    """Minimal stand-in for GenerateContentResponse, exposing the fields the nodes read."""
+
+    def __init__(self, text: Optional[str], prompt_feedback: Any = None, candidates_count: int = 0,
+                 usage_metadata: Optional[Dict[str, Any]] = None):
+        self.text = text
+        self.prompt_feedback = _to_namespace(prompt_feedback)
+        self.candidates: List[Any] = [SimpleNamespace() for _ in range(candidates_count)]
+        self.usage_metadata = _to_namespace(usage_metadata) if usage_metadata else None
+
+
+class GeminiBackend:
+    """Interface for anything that can answer a generate_content request."""
+
+    mode = "live"
+
+    def generate_content(self, api_key: str, model: str, contents: Any, config: Any = None) -> Any:
+        raise NotImplementedError
+
+
+class LiveBackend(GeminiBackend):
+    """Calls the Gemini API (today's behavior)."""
+
+    mode = "live"
+
+    def generate_content(self, api_key: str, model: str, contents: Any, config: Any = None) -> Any:
+        from google import genai
+        from google.genai import types
+
+        # Under run_cancellable the HTTP request ends with the call's deadline, even once abandoned
+        remaining = remaining_time()
+        http_options = types.HttpOptions(timeout=max(int(remaining * 1000), 1)) if remaining is not None else None
+        client = genai.Client(api_key=api_key, http_options=http_options)
+        # Closing the client aborts the request when the caller abandons it (e.g. a losing hedge)
+        on_cancel(client.close)
+        return client.models.generate_content(model=model, contents=contents, config=config)
+
+
+class RecordingBackend(GeminiBackend):
+    """Calls another backend (live by default) and saves every response or API error it sees."""
+
+    mode = "record"
+
+    def __init__(self, recordings_dir: Optional[str] = None, inner: Optional[GeminiBackend] = None):
+        self.recordings_dir = recordings_dir or _default_recordings_dir()
+        self.inner = inner or LiveBackend()
+        os.makedirs(self.recordings_dir, exist_ok=True)
+
+    def generate_content(self, api_key: str, model: str, contents: Any, config: Any = None) -> Any:
+        fingerprint = request_fingerprint(model, contents, config)
+        started = time.perf_counter()
+        try:
+            response = self.inner.generate_content(api_key, model, contents, config)
+        except Exception as e:
+            code = getattr(e, 'code', None)
+            # Only API errors are worth replaying; network failures are environment specific
+            if isinstance(code, int):
+                self._save(fingerprint, model, time.perf_counter() - started, {
+                    'error': {'code': code, 'status': str(getattr(e, 'status', '') or ''), 'message': str(e)}
+                })
+            raise
+
+        candidates = getattr(response, 'candidates', None) or []
+        self._save(fingerprint, model, time.perf_counter() - started, {
+            'response': {
+                'text': response.text,
+                'prompt_feedback': _jsonable(getattr(response, 'prompt_feedback', None)),
+                'candidates_count': len(candidates),
+                'usage_metadata': _jsonable(getattr(response, 'usage_metadata', None)),
+            }
+        })
+        return response
+
+    def _save(self, fingerprint: str, model: str, latency: float, payload: Dict[str, Any]) -> None:
+        recording = {
+            'fingerprint': fingerprint,
+            'model': model,
+            'latency': round(latency, 4),
+            'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        recording.update(payload)
+        path = os.path.join(self.recordings_dir, f"{fingerprint}.json")
+        try:
+            atomic_write_json(path, recording)
+        except (IOError, OSError) as e:
+            print(f"[BACKEND] Failed to save recording {path}: {e}")
+
+
+class ReplayBackend(GeminiBackend):
+    """Serves recorded responses with configurable simulated latency, errors and 429 bursts."""
+
+    mode = "replay"
+
+    def __init__(self, recordings_dir: Optional[str] = None, latency: float = 0.0, jitter: float = 0.0,
+                 use_recorded_latency: bool = False, error_rate: float = 0.0, burst_every: int = 0,
+                 burst_length: int = 0, seed: Optional[int] = None, fallback_text: Optional[str] = None):
+        self.recordings_dir = recordings_dir or _default_recordings_dir()
+        self.latency = latency
+        self.jitter = jitter
+        self.use_recorded_latency = use_recorded_latency
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.fallback_text = fallback_text
+        self.request_count = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recordings: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def _load(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        if fingerprint not in self._recordings:
+            path = os.path.join(self.recordings_dir, f"{fingerprint}.json")
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._recordings[fingerprint] = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._recordings[fingerprint] = None
+        return self._recordings[fingerprint]
+
+    def generate_content(self, api_key: str, model: str, contents: Any, config: Any = None) -> Any:
+        fingerprint = request_fingerprint(model, contents, config)
+        recording = self._load(fingerprint)
+
+        with self._lock:
+            self.request_count += 1
+            position = self.request_count
+            roll = self._rng.random()
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+
+        if self.use_recorded_latency and recording is not None:
+            delay = float(recording.get('latency', 0.0))
+        if delay > 0:
+            time.sleep(delay)
+
+        # The first burst starts after burst_every requests: 1..N succeed, N+1..N+M get 429
+        if self.burst_every > 0 and self.burst_length > 0:
+            cycle = self.burst_every + self.burst_length
+            if (position - 1) % cycle >= self.burst_every:
+                raise ReplayAPIError(429, "RESOURCE_EXHAUSTED", "Simulated quota burst (replay backend)")
+        if self.error_rate > 0 and roll < self.error_rate:
+            raise ReplayAPIError(503, "UNAVAILABLE", "Simulated transient error (replay backend)")
+
+        if recording is None:
+            if self.fallback_text is not None:
+                return ReplayResponse(self.fallback_text, candidates_count=1)
+            raise ReplayMissError(f"No recording for request {fingerprint[:16]} (model {model}) in {self.recordings_dir}")
+
+        if 'error' in recording:
+            error = recording['error']
+            raise ReplayAPIError(int(error.get('code', 500)), error.get('status', ''), error.get('message', ''))
+
+        response = recording.get('response', {})
+        return ReplayResponse(
+            text=response.get('text'),
+            prompt_feedback=response.get('prompt_feedback'),
+            candidates_count=int(response.get('candidates_count', 0)),
+            usage_metadata=response.get('usage_metadata'),
+        )
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def create_backend_from_env() -> GeminiBackend:
+    """Build the backend selected by SK_GEMINI_BACKEND (live, record or replay)."""
+    mode = os.environ.get("SK_GEMINI_BACKEND", "live").strip().lower() or "live"
+    recordings_dir = os.environ.get("SK_GEMINI_RECORDINGS_DIR") or None
+
+    if mode == "record":
+        return RecordingBackend(recordings_dir)
+    if mode == "replay":
+        seed = os.environ.get("SK_GEMINI_REPLAY_SEED")
+        return ReplayBackend(
+            recordings_dir,
+            latency=_env_float("SK_GEMINI_REPLAY_LATENCY", 0.0),
+            jitter=_env_float("SK_GEMINI_REPLAY_JITTER", 0.0),
+            use_recorded_latency=os.environ.get("SK_GEMINI_REPLAY_RECORDED_LATENCY", "") == "1",
+            error_rate=_env_float("SK_GEMINI_REPLAY_ERROR_RATE", 0.0),
+            burst_every=_env_int("SK_GEMINI_REPLAY_429_EVERY", 0),
+            burst_length=_env_int("SK_GEMINI_REPLAY_429_BURST", 0),
+            seed=int(seed) if seed else None,
+            fallback_text=os.environ.get("SK_GEMINI_REPLAY_FALLBACK_TEXT"),
+        )
+    if mode != "live":
+        print(f"[BACKEND] Unknown SK_GEMINI_BACKEND '{mode}', falling back to live")
+    return LiveBackend()
+
+
+# Global backend instance
+_global_backend: Optional[GeminiBackend] = None
+
+
+def get_backend() -> GeminiBackend:
+    """Get the global backend instance."""
+    global _global_backend
+    if _global_backend is None:
+        _global_backend = create_backend_from_env()
+        if _global_backend.mode != "live":
+            print(f"[BACKEND] Using {_global_backend.mode} backend")
+    return _global_backend
+
+
+def set_backend(backend: Optional[GeminiBackend]) -> None:
+    """Install a backend explicitly (e.g. from benchmarks). None re-reads the environment on next use."""
+    global _global_backend
+    _global_backend = backend
@@ -0,0 +1,238 @@
+"""
+Hedged Gemini requests to cut tail latency.
+
+Most Gemini calls return in a few seconds, but an occasional one takes minutes and dominates
+p99. With hedging enabled on a GeminiUtilOptions node, a call that has not returned after the
+hedge delay is duplicated: a second request goes to the same model, or to a faster fallback
+model such as gemini-2.5-flash-lite. Whichever answers first is used and the other call is
+cancelled. The cache entry records the model that actually produced the text
+(produced_by_model).
+
+The hedge delay is a percentile (hedge_percentile, e.g. 95) of recent successful latencies for
+the same model and media kind, so only the slowest few percent of calls are hedged. Until
+MIN_SAMPLES latencies are known, the delay is a quarter of the request deadline.
+
+Hedges cost extra requests, so each Options node has a spend cap (hedge_budget): hedged
+requests in the last hour may not exceed that percentage of its requests in the last hour
+(at least one hedge per hour is always allowed). The cancelled request was billed for its
+prompt too, so it is reported to the caller and added to the usage ledger (usage.py).
+"""
+
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from .cancellation import is_interrupt
+
+HEDGE_MODES = ("Off", "Same Model", "Fallback Model")
+DEFAULT_HEDGE_FALLBACK_MODEL = "models/gemini-2.5-flash-lite"
+DEFAULT_HEDGE_PERCENTILE = 95.0
+DEFAULT_HEDGE_BUDGET = 10.0
+
+MIN_SAMPLES = 20
+MAX_SAMPLES = 500
+BUDGET_WINDOW = 3600.0
+# Hedge delay before MIN_SAMPLES latencies are known, as a fraction of the request deadline
+INITIAL_DELAY_FRACTION = 0.25
+
+
+def new_hedge_id() -> str:
+    """Identifier of one Options node instance, so each node has its own hedge budget."""
+    return uuid.uuid4().hex
+
+
+class LatencyTracker:
+    """Recent successful Gemini latencies per (model, media kind)."""
+
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        self.max_samples = max_samples
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, kind: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault((model, kind), deque(maxlen=self.max_samples)).append(seconds)
+
+    def percentile(self, model: str, kind: str, percentile: float) -> Optional[float]:
+        """Latency percentile in seconds, or None with fewer than MIN_SAMPLES samples."""
+        with self._lock:
+            samples = sorted(self._samples.get((model, kind), ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        index = min(int(len(samples) * percentile / 100.0), len(samples) - 1)
+        return samples[index]
+
+
+# Global latency tracker instance
+_global_tracker: Optional[LatencyTracker] = None
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """Get the global latency tracker instance."""
+    global _global_tracker
+    if _global_tracker is None:
+        _global_tracker = LatencyTracker()
+    return _global_tracker
+
+
+class HedgePolicy:
+    """Hedge settings of one Options node, with its spend cap."""
+
+    def __init__(self, mode: str, fallback_model: str, percentile: float, budget_percent: float):
+        self.mode = mode
+        self.fallback_model = fallback_model
+        self.percentile = percentile
+        self.budget_percent = budget_percent
+        self._requests: Deque[float] = deque()
+        self._hedges: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def hedge_model(self, model: str) -> str:
+        """Model the hedged request goes to."""
+        return self.fallback_model if self.mode == "Fallback Model" else model
+
+    def delay(self, model: str, kind: str, timeout: Optional[float]) -> Optional[float]:
+        """Seconds to wait before hedging (None = never hedge this call)."""
+        delay = get_latency_tracker().percentile(model, kind, self.percentile)
+        if delay is None:
+            if not timeout:
+                return None
+            delay = timeout * INITIAL_DELAY_FRACTION
+        return delay
+
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._hedges):
+            while events and now - events[0] >= BUDGET_WINDOW:
+                events.popleft()
+
+    def record_request(self) -> None:
+        with self._lock:
+            now = time.time()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        """Reserve one hedged request if the spend cap allows it."""
+        with self._lock:
+            now = time.time()
+            self._trim(now)
+            allowed = max(1, int(len(self._requests) * self.budget_percent / 100.0))
+            if self.budget_percent <= 0 or len(self._hedges) >= allowed:
+                return False
+            self._hedges.append(now)
+            return True
+
+
+# Hedge policies per Options node (hedge_id)
+_policies: Dict[str, HedgePolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_hedge_policy(gemini_options: Dict[str, Any]) -> Optional[HedgePolicy]:
+    """
+    Hedge policy for a gemini_options dict, or None when hedging is off. Policies are kept per
+    Options node, so the spend cap survives between executions.
+    """
+    mode = gemini_options.get("hedge_mode", "Off")
+    if mode not in HEDGE_MODES[1:]:
+        return None
+    settings = (
+        mode,
+        gemini_options.get("hedge_fallback_model", DEFAULT_HEDGE_FALLBACK_MODEL),
+        float(gemini_options.get("hedge_percentile", DEFAULT_HEDGE_PERCENTILE)),
+        float(gemini_options.get("hedge_budget", DEFAULT_HEDGE_BUDGET)),
+    )
+    hedge_id = gemini_options.get("hedge_id") or repr(settings)
+    with _policies_lock:
+        policy = _policies.get(hedge_id)
+        if policy is None:
+            policy = _policies[hedge_id] = HedgePolicy(*settings)
+        else:
+            policy.mode, policy.fallback_model, policy.percentile, policy.budget_percent = settings
+        return policy
+
+
+def run_hedged(call: Callable[[str, threading.Event], Any], model: str, kind: str, policy: HedgePolicy,
+               timeout: Optional[float],
+               on_cancelled: Optional[Callable[[str, float], None]] = None) -> Tuple[Any, str, bool]:
+    """
+    Run call(model, cancel_event) and hedge it with call(hedge model, cancel_event) if it has
+    not returned after the policy's delay.
+
+    Args:
+        call: Makes one request; must stop with an error once its cancel event is set
+        model: Primary model
+        kind: Media kind for latency statistics ("image", "video" or "text")
+        policy: Hedge settings and spend cap
+        timeout: Deadline of the whole call in seconds (None or 0 = none); the hedged request
+            only gets the time left
+        on_cancelled: Called with (model, seconds it ran) for the request that lost to the other
+            one and was cancelled; it was still billed for its prompt
+
+    Returns:
+        (response, model that produced it, whether the hedged request answered first)
+    """
+    started = time.monotonic()
+    results: "queue.Queue[Tuple[str, Any, Optional[BaseException]]]" = queue.Queue()
+    cancels: Dict[str, threading.Event] = {}
+    starts: Dict[str, float] = {}
+
+    def attempt(name: str, attempt_model: str) -> None:
+        try:
+            results.put((name, call(attempt_model, cancels[name]), None))
+        except BaseException as e:
+            results.put((name, None, e))
+
+    def start(name: str, attempt_model: str) -> None:
+        cancels[name] = threading.Event()
+        starts[name] = time.monotonic()
+        threading.Thread(target=attempt, args=(name, attempt_model), name=f"sk-gemini-{name}", daemon=True).start()
+
+    policy.record_request()
+    models = {'primary': model, 'hedge': policy.hedge_model(model)}
+    start('primary', model)
+    delay = policy.delay(model, kind, timeout)
+
+    pending = {'primary'}
+    first_error: Optional[BaseException] = None
+    while pending:
+        wait = None
+        if 'hedge' not in cancels and delay is not None:
+            wait = max(delay - (time.monotonic() - started), 0.0)
+        try:
+            name, response, error = results.get(timeout=wait)
+        except queue.Empty:
+            remaining = timeout - (time.monotonic() - started) if timeout else None
+            if (remaining is None or remaining > 1.0) and policy.try_spend():
+                print(f"[HEDGE] {model} has not answered after {delay:.1f}s; hedging with {models['hedge']}")
+                start('hedge', models['hedge'])
+                pending.add('hedge')
+            else:
+                delay = None
+            continue
+
+        pending.discard(name)
+        if error is None:
+            for other in pending:
+                cancels[other].set()
+                if on_cancelled is not None:
+                    on_cancelled(models[other], time.monotonic() - starts[other])
+            # When the hedge wins, the primary took at least this long, which keeps the tail visible
+            get_latency_tracker().record(model, kind, time.monotonic() - started)
+            if name == 'hedge':
+                print(f"[HEDGE] Hedged request to {models['hedge']} answered first")
+            return response, models[name], name == 'hedge'
+
+        if is_interrupt(error):
+            for other in pending:
+                cancels[other].set()
+            raise error
+        first_error = first_error or error
+        if 'hedge' not in cancels:
+            # The primary failed before any hedge started; errors are not hedged
+            break
+
+    raise first_error
@@ -0,0 +1,467 @@
+"""
+Distributed batch captioning over an SQLite job table.
+
+For media sets too large for one machine's warm-up, a coordinator enumerates the files into a
+job table once. Any number of worker processes, on this host or others sharing the filesystem,
+then claim jobs and run them through the warm-up pipeline (utils/warmup.py): media preparation
+in a process pool, rate-limited Gemini calls, negative and near-duplicate caching, and results
+stored in GeminiCache. No broker is needed.
+
+- Claims are leases. A worker renews the leases of the jobs it holds every third of the lease
+  duration. If a worker dies, its leases expire and other workers claim the jobs again.
+- A job whose lease expired max_attempts times is marked failed instead of being retried again.
+- A job that fails inside the pipeline is marked failed with its error. `retry-failed` puts the
+  failed jobs back in the queue. A file Gemini answers without text is done with outcome
+  'blocked', like one that is still negatively cached, so it is not sent again.
+- `status` reports counts, per-worker activity, throughput over the last 10 minutes and an ETA.
+
+Usage (from the sk_custom_nodes directory; the queue file must be on a filesystem every worker
+can reach, and media must be mounted at the same path on every host):
+
+    python -m utils.job_queue create /shared/captions.sqlite3 /data/dataset --media-type image --options options.json
+    python -m utils.job_queue work /shared/captions.sqlite3 --concurrency 8      # on each render node
+    python -m utils.job_queue status /shared/captions.sqlite3
+    python -m utils.job_queue retry-failed /shared/captions.sqlite3
+
+Each worker writes to its own host's cache unless the hosts share one through
+SK_GEMINI_CACHE_REMOTE (see utils/remote_cache.py). The API key is not stored in the job
+table: workers use their own key pool, --api-key or $GEMINI_API_KEY.
+
+The table uses SQLite's rollback journal instead of WAL, because WAL needs shared memory and
+does not work across hosts. Every change is a short transaction on one row or on a batch of
+claimed rows.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+JOB_STATUSES = ("pending", "leased", "done", "failed")
+DEFAULT_LEASE_SECONDS = 120.0
+DEFAULT_MAX_ATTEMPTS = 3
+CLAIM_BATCH = 8
+POLL_INTERVAL = 5.0
+THROUGHPUT_WINDOW = 600.0
+ENQUEUE_BATCH = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    outcome TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, lease_expires);
+CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs (updated);
+"""
+
+
+class JobQueue:
+    """Job table of one captioning run: its settings and one row per media file."""
+
+    def __init__(self, db_path: str):
+        self.db_path = os.path.abspath(db_path)
+        self._local = threading.local()
+        self._schema_ready = False
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit; writes use explicit BEGIN IMMEDIATE transactions
+            conn = sqlite3.connect(self.db_path, timeout=60.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=DELETE")
+            if not self._schema_ready:
+                conn.executescript(_SCHEMA)
+                self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def settings(self) -> Dict[str, Any]:
+        """Run settings stored by create(): media_dir, media_type, options, max_duration, max_attempts."""
+        rows = self.connection().execute("SELECT key, value FROM meta").fetchall()
+        if not rows:
+            raise ValueError(f"{self.db_path} is not a job queue; create it first")
+        return {row['key']: json.loads(row['value']) for row in rows}
+
+    def create(self, media_dir: str, media_type: str, options: Dict[str, Any], max_duration: float = 5.0,
+               max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> None:
+        """Store the run settings. Re-creating an existing queue requires the same media and options."""
+        settings = {
+            'media_dir': os.path.abspath(media_dir),
+            'media_type': media_type,
+            # Workers bring their own key
+            'options': {key: value for key, value in options.items() if key != "gemini_api_key"},
+            'max_duration': max_duration,
+            'max_attempts': max_attempts,
+        }
+        with self._transaction() as conn:
+            existing = {row['key']: json.loads(row['value']) for row in conn.execute("SELECT key, value FROM meta")}
+            if existing:
+                changed = sorted(key for key in ('media_dir', 'media_type', 'options', 'max_duration')
+                                 if existing.get(key) != settings[key])
+                if changed:
+                    raise ValueError(f"{self.db_path} was created with different {', '.join(changed)}")
+                return
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                             [(key, json.dumps(value)) for key, value in settings.items()])
+
+    def enqueue(self, paths: List[str]) -> int:
+        """Add a job per path not queued yet. Returns the number added."""
+        added = 0
+        now = time.time()
+        for start in range(0, len(paths), ENQUEUE_BATCH):
+            with self._transaction() as conn:
+                added += conn.executemany("INSERT OR IGNORE INTO jobs (path, updated) VALUES (?, ?)",
+                                          [(path, now) for path in paths[start:start + ENQUEUE_BATCH]]).rowcount
+        return added
+
+    def claim(self, worker: str, count: int = CLAIM_BATCH, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+              max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> List[Tuple[int, str]]:
+        """
+        Lease up to count pending jobs, or jobs whose lease expired, to worker.
+
+        Returns:
+            [(job id, media path)]
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            abandoned = conn.execute(
+                "UPDATE jobs SET status = 'failed', worker = NULL, updated = ?, "
+                "error = 'lease expired ' || attempts || ' times (worker stopped or stalled)' "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, max_attempts)).rowcount
+            rows = conn.execute(
+                "SELECT id, path, status FROM jobs WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT ?", (now, count)).fetchall()
+            if rows:
+                conn.execute(
+                    f"UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                    f"updated = ? WHERE id IN ({', '.join('?' * len(rows))})",
+                    [worker, now + lease_seconds, now] + [row['id'] for row in rows])
+        expired = sum(1 for row in rows if row['status'] == 'leased')
+        if expired or abandoned:
+            print(f"[JOBS] {worker} reclaimed {expired} jobs with expired leases; {abandoned} gave up after "
+                  f"{max_attempts} attempts")
+        return [(row['id'], row['path']) for row in rows]
+
+    def renew(self, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> int:
+        """Extend every lease held by worker. Returns the number of jobs it holds."""
+        with self._transaction() as conn:
+            return conn.execute("UPDATE jobs SET lease_expires = ? WHERE status = 'leased' AND worker = ?",
+                                (time.time() + lease_seconds, worker)).rowcount
+
+    def finish(self, job_id: int, worker: str, outcome: str) -> bool:
+        """
+        Mark a leased job done ('described', 'cached' or 'blocked'). Returns False when the lease
+        was lost to another worker, whose result then counts instead.
+        """
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'done', outcome = ?, error = NULL, worker = ?, lease_expires = NULL, "
+                "updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (outcome, worker, time.time(), job_id, worker)).rowcount > 0
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        """Mark a leased job failed. Returns False when the lease was lost to another worker."""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (error[:1000], time.time(), job_id, worker)).rowcount > 0
+
+    def release(self, worker: str) -> int:
+        """Return the jobs leased by a stopping worker to the queue. Returns the number released."""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'pending', worker = NULL, lease_expires = NULL, attempts = attempts - 1, "
+                "updated = ? WHERE status = 'leased' AND worker = ?", (time.time(), worker)).rowcount
+
+    def retry_failed(self) -> int:
+        """Put failed jobs back in the queue with a fresh attempt count. Returns the number requeued."""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, worker = NULL, error = NULL, updated = ? "
+                "WHERE status = 'failed'", (time.time(),)).rowcount
+
+    def unfinished(self) -> int:
+        """Jobs pending or leased by any worker."""
+        return self.connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+    def progress(self) -> Dict[str, Any]:
+        """
+        Returns:
+            {'total', 'pending', 'leased', 'done', 'failed', 'outcomes': {outcome: count},
+             'workers': {worker: {'leased', 'done_recently'}}, 'rate_per_minute', 'eta_seconds',
+             'recent_errors': [{'path', 'error'}]}
+        """
+        conn = self.connection()
+        now = time.time()
+        counts = {status: 0 for status in JOB_STATUSES}
+        for row in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row['status']] = row['n']
+        outcomes = {row['outcome']: row['n'] for row in conn.execute(
+            "SELECT outcome, COUNT(*) AS n FROM jobs WHERE status = 'done' GROUP BY outcome")}
+
+        workers: Dict[str, Dict[str, int]] = {}
+        for row in conn.execute("SELECT worker, COUNT(*) AS n FROM jobs WHERE status = 'leased' GROUP BY worker"):
+            workers.setdefault(row['worker'], {'leased': 0, 'done_recently': 0})['leased'] = row['n']
+        recent = 0
+        first = now
+        for row in conn.execute("SELECT worker, COUNT(*) AS n, MIN(updated) AS first FROM jobs "
+                                "WHERE status = 'done' AND updated >= ? GROUP BY worker", (now - THROUGHPUT_WINDOW,)):
+            workers.setdefault(row['worker'], {'leased': 0, 'done_recently': 0})['done_recently'] = row['n']
+            recent += row['n']
+            first = min(first, row['first'])
+
+        # Over the window, or since the first completion when the run is younger than that
+        rate = recent / max(now - first, 10.0) * 60
+        remaining = counts['pending'] + counts['leased']
+        errors = [{'path': row['path'], 'error': row['error']} for row in conn.execute(
+            "SELECT path, error FROM jobs WHERE status = 'failed' ORDER BY updated DESC LIMIT 5")]
+        return dict(counts, total=sum(counts.values()), outcomes=outcomes, workers=workers,
+                    rate_per_minute=round(rate, 1), eta_seconds=round(remaining / rate * 60) if rate > 0 else None,
+                    recent_errors=errors)
+
+
+def format_progress(progress: Dict[str, Any]) -> str:
+    eta = progress['eta_seconds']
+    eta_text = "n/a" if eta is None else f"{eta // 3600}h{eta % 3600 // 60:02d}m" if eta >= 3600 else f"{eta}s"
+    return (f"{progress['done']}/{progress['total']} done | leased {progress['leased']} | pending {progress['pending']} | "
+            f"failed {progress['failed']} | {len(progress['workers'])} workers | "
+            f"{progress['rate_per_minute']:.1f} jobs/min | ETA {eta_text}")
+
+
+class _JobState:
+    """WarmupRunner state that records outcomes in the job table."""
+
+    def __init__(self, queue: JobQueue, worker: str):
+        self.path = queue.db_path
+        self.queue = queue
+        self.worker = worker
+        self.done: Set[str] = set()
+        self.failed: Dict[str, str] = {}
+        self.jobs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def track(self, file_path: str, job_id: int) -> None:
+        """Remember which job a file handed to the pipeline belongs to."""
+        with self._lock:
+            self.jobs[file_path] = job_id
+
+    def record(self, file_path: str, status: str, error: str = "") -> None:
+        with self._lock:
+            job_id = self.jobs.pop(file_path, None)
+        if job_id is None:
+            return
+        if status == 'done':
+            self.queue.finish(job_id, self.worker, 'described')
+        elif status == 'blocked':
+            # Gemini's answer, not an error: retrying the job would only be refused again
+            self.queue.finish(job_id, self.worker, 'blocked')
+        else:
+            self.queue.fail(job_id, self.worker, error)
+
+
+class JobWorker:
+    """Claims jobs from a queue and runs them through the warm-up pipeline until the queue is empty."""
+
+    def __init__(self, queue: JobQueue, worker_id: Optional[str] = None, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 workers: Optional[int] = None, concurrency: Optional[int] = None, rpm: float = 0.0,
+                 overrides: Optional[Dict[str, Any]] = None, progress_interval: float = 30.0):
+        from .warmup import WarmupRunner
+
+        settings = queue.settings()
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = max(lease_seconds, 10.0)
+        self.max_attempts = settings.get('max_attempts', DEFAULT_MAX_ATTEMPTS)
+        self.progress_interval = progress_interval
+        self.state = _JobState(queue, self.worker_id)
+        options = dict(settings['options'])
+        options.update({key: value for key, value in (overrides or {}).items() if value is not None})
+        options.setdefault("gemini_api_key", "")
+        options.setdefault("scheduler_tenant", f"jobs:{os.path.basename(queue.db_path)}")
+        self.runner = WarmupRunner(settings['media_dir'], settings['media_type'], options,
+                                   max_duration=settings['max_duration'], workers=workers, concurrency=concurrency,
+                                   rpm=rpm, progress_interval=float('inf'), state=self.state)
+        self._stopped = threading.Event()
+
+    def _claimed_files(self) -> Iterator[str]:
+        """Media paths of claimed jobs, in claim order; ends when no job is pending or leased."""
+        buffered: Deque[Tuple[int, str]] = deque()
+        while True:
+            if not buffered:
+                buffered.extend(self.queue.claim(self.worker_id, CLAIM_BATCH, self.lease_seconds, self.max_attempts))
+                if not buffered:
+                    # Other workers' leases may still expire and need a retry
+                    if self.queue.unfinished() == 0:
+                        return
+                    self._stopped.wait(POLL_INTERVAL)
+                    continue
+            job_id, file_path = buffered.popleft()
+            self.runner.add_to_total()
+            try:
+                if not os.path.exists(file_path):
+                    raise FileNotFoundError("file not found")
+                skipped = self.runner.skip_reason(file_path)
+            except Exception as e:
+                self.queue.fail(job_id, self.worker_id, str(e))
+                self.runner.record_outcome('failed')
+                continue
+            if skipped is not None:
+                self.queue.finish(job_id, self.worker_id, skipped)
+                self.runner.record_outcome(skipped)
+                continue
+            self.state.track(file_path, job_id)
+            yield file_path
+
+    def _keep_leases(self) -> None:
+        """Renew this worker's leases and report progress until the worker stops."""
+        last_report = time.monotonic()
+        while not self._stopped.wait(self.lease_seconds / 3):
+            try:
+                self.queue.renew(self.worker_id, self.lease_seconds)
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    print(f"[JOBS] {format_progress(self.queue.progress())}")
+            except sqlite3.Error as e:
+                print(f"[JOBS] Could not renew leases: {e}")
+
+    def run(self) -> Dict[str, int]:
+        """Process jobs until none is left. Returns this worker's counts."""
+        print(f"[JOBS] Worker {self.worker_id} on {self.queue.db_path} "
+              f"({self.runner.media_type}, {self.runner.concurrency} concurrent requests)")
+        keeper = threading.Thread(target=self._keep_leases, name="sk-gemini-job-leases", daemon=True)
+        keeper.start()
+        self.runner.start()
+        try:
+            self.runner.process(self._claimed_files())
+        finally:
+            self._stopped.set()
+            released = self.queue.release(self.worker_id)
+            if released:
+                print(f"[JOBS] Released {released} unfinished jobs")
+        self.runner.report(force=True)
+        print(f"[JOBS] {format_progress(self.queue.progress())}")
+        return dict(self.runner.counts)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .warmup import load_options
+    from .scheduler import REQUEST_PRIORITIES
+
+    parser = argparse.ArgumentParser(description="Distributed Gemini captioning over an SQLite job table")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="Create a queue (or add new files to it) from a media directory")
+    create.add_argument("queue", help="Job table file, on a filesystem shared by all workers")
+    create.add_argument("media_dir", help="Directory to walk (including subdirectories)")
+    create.add_argument("--media-type", choices=["image", "video"], default="image")
+    create.add_argument("--options", help="JSON file with Gemini Util - Options values")
+    create.add_argument("--model", help="Overrides gemini_model")
+    create.add_argument("--model-type", choices=["Text2Image", "ImageEdit"], help="Overrides model_type (images only)")
+    create.add_argument("--near-duplicate-distance", type=int, help="Overrides near_duplicate_distance (images only)")
+    create.add_argument("--max-duration", type=float, default=5.0, help="Trim videos to this many seconds (0 = full video)")
+    create.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="Claims per job before an expired lease marks it failed")
+
+    work = commands.add_parser("work", help="Claim and process jobs until the queue is empty")
+    work.add_argument("queue")
+    work.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"),
+                      help="Gemini API key (default: $GEMINI_API_KEY; ignored when a key pool is configured)")
+    work.add_argument("--workers", type=int, default=None, help="Media preparation processes (default: CPU count)")
+    work.add_argument("--concurrency", type=int, default=None, help="Concurrent Gemini requests (default: 4 per API key)")
+    work.add_argument("--rpm", type=float, default=0.0, help="Maximum Gemini requests per minute (0 = unlimited)")
+    work.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS, help="Lease duration in seconds")
+    work.add_argument("--worker-id", help="Name in status reports (default: <hostname>-<pid>)")
+    work.add_argument("--priority", choices=list(REQUEST_PRIORITIES), default="Batch", help="Scheduler class (default: Batch)")
+    work.add_argument("--tenant", help="Scheduler tenant (default: jobs:<queue file name>)")
+    work.add_argument("--progress-interval", type=float, default=30.0, help="Seconds between progress reports")
+
+    status = commands.add_parser("status", help="Show progress")
+    status.add_argument("queue")
+    status.add_argument("--json", action="store_true", help="Print the full progress report as JSON")
+    status.add_argument("--watch", type=float, default=0.0, help="Repeat every this many seconds until done")
+
+    retry = commands.add_parser("retry-failed", help="Put failed jobs back in the queue")
+    retry.add_argument("queue")
+
+    args = parser.parse_args(argv)
+    queue = JobQueue(args.queue)
+
+    if args.command == "create":
+        from .media import find_media_files
+
+        if not os.path.isdir(args.media_dir):
+            parser.error(f"Media directory does not exist: {args.media_dir}")
+        options = load_options(args.options, {
+            "gemini_model": args.model,
+            "model_type": args.model_type,
+            "near_duplicate_distance": args.near_duplicate_distance,
+        })
+        try:
+            queue.create(args.media_dir, args.media_type, options, args.max_duration, args.max_attempts)
+        except ValueError as e:
+            parser.error(str(e))
+        files = sorted(set(os.path.abspath(path) for path in find_media_files(args.media_dir, args.media_type)))
+        added = queue.enqueue(files)
+        print(f"[JOBS] Found {len(files)} {args.media_type} files; queued {added} new jobs in {queue.db_path}")
+        return 0
+
+    if args.command == "work":
+        try:
+            worker = JobWorker(queue, args.worker_id, args.lease, args.workers, args.concurrency, args.rpm,
+                               {"gemini_api_key": args.api_key, "request_priority": args.priority,
+                                "scheduler_tenant": args.tenant}, args.progress_interval)
+        except ValueError as e:
+            parser.error(str(e))
+        counts = worker.run()
+        return 1 if counts['failed'] else 0
+
+    if args.command == "retry-failed":
+        print(f"[JOBS] Requeued {queue.retry_failed()} failed jobs")
+        return 0
+
+    while True:
+        progress = queue.progress()
+        print(json.dumps(progress, indent=2) if args.json else format_progress(progress))
+        if args.watch <= 0 or not (progress['pending'] or progress['leased']):
+            return 0
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
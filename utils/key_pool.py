@@ -0,0 +1,268 @@
+"""
+Pool of Gemini API keys with per-key rate and quota tracking.
+
+A single gemini_api_key caps a host at one key's quota. When a pool is configured, every
+Gemini call takes the least-loaded available key (fewest requests in flight, then fewest in
+the last minute) instead of the Options node's key. Keys that return 429 are quarantined
+with exponential backoff, and keys rejected as invalid or unauthorized are quarantined for an
+hour. The failed call is retried at once on another key. Which key answered a request never
+affects cache keys, so entries are shared no matter which key produced them.
+
+Keys are read from the environment or a file, never from a widget:
+
+SK_GEMINI_API_KEYS: comma or newline separated keys
+SK_GEMINI_API_KEYS_FILE: file with one key per line, optionally followed by per-key limits,
+    e.g. "AIza... rpm=15 rpd=1500"; blank lines and lines starting with # are ignored
+SK_GEMINI_KEY_RPM / SK_GEMINI_KEY_RPD: default requests per minute / per day for every key
+    (0 = unlimited, the default)
+
+The file is re-read when it changes, so keys can be added without restarting ComfyUI.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+RATE_WINDOW = 60.0
+QUOTA_WINDOW = 86400.0
+QUARANTINE_BASE_SECONDS = 30.0
+QUARANTINE_MAX_SECONDS = 900.0
+AUTH_QUARANTINE_SECONDS = 3600.0
+WAIT_SLICE = 0.1
+
+
+class NoApiKeyAvailableError(RuntimeError):
+    """Every key in the pool is quarantined or over its daily quota (transient, like an HTTP 429)."""
+
+    code = 429
+
+
+def mask_key(api_key: str) -> str:
+    """Key as shown in logs and status text."""
+    return '*' * (len(api_key) - 4) + api_key[-4:] if len(api_key) >= 4 else '****'
+
+
+def _is_auth_error(error: BaseException) -> bool:
+    code = getattr(error, 'code', None)
+    message = str(error).lower()
+    return code in (401, 403) or (code == 400 and ("api key not valid" in message or "api_key_invalid" in message))
+
+
+class _KeyState:
+    """Usage of one key in this process."""
+
+    def __init__(self, api_key: str, rpm: int = 0, rpd: int = 0):
+        self.api_key = api_key
+        self.rpm = rpm
+        self.rpd = rpd
+        self.in_flight = 0
+        self.recent: Deque[float] = deque()  # Request start times within QUOTA_WINDOW
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_429 = 0
+        self.quarantined_until = 0.0
+        self.last_error = ""
+
+    def _trim(self, now: float) -> None:
+        while self.recent and now - self.recent[0] >= QUOTA_WINDOW:
+            self.recent.popleft()
+
+    def last_minute(self, now: float) -> int:
+        count = 0
+        for started in reversed(self.recent):
+            if now - started >= RATE_WINDOW:
+                break
+            count += 1
+        return count
+
+    def next_slot(self, now: float) -> float:
+        """Earliest time this key may start a request (now if it may start one right away)."""
+        self._trim(now)
+        ready = self.quarantined_until
+        if self.rpd > 0 and len(self.recent) >= self.rpd:
+            ready = max(ready, self.recent[-self.rpd] + QUOTA_WINDOW)
+        if self.rpm > 0 and self.last_minute(now) >= self.rpm:
+            ready = max(ready, self.recent[-self.rpm] + RATE_WINDOW)
+        return max(ready, now)
+
+
+class ApiKeyPool:
+    """Least-loaded selection over several API keys, with quarantine of failing keys."""
+
+    def __init__(self, keys: List[Tuple[str, int, int]]):
+        """
+        Args:
+            keys: (api_key, requests per minute, requests per day) tuples; 0 = unlimited
+        """
+        self._states = [_KeyState(api_key, rpm, rpd) for api_key, rpm, rpd in keys]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _acquire(self) -> _KeyState:
+        """Take the least-loaded key, waiting while every usable key is at its rate limit."""
+        from .cancellation import throw_if_interrupted
+
+        while True:
+            with self._lock:
+                now = time.time()
+                slots = [(state.next_slot(now), state) for state in self._states]
+                ready = [state for slot, state in slots if slot <= now]
+                if ready:
+                    state = min(ready, key=lambda s: (s.in_flight, s.last_minute(now)))
+                    state.in_flight += 1
+                    state.requests += 1
+                    state.recent.append(now)
+                    return state
+                earliest = min(slot for slot, _ in slots)
+
+            # Quarantined keys are not waited for; rate limits clear within a minute
+            if all(state.quarantined_until > now or (state.rpd > 0 and len(state.recent) >= state.rpd)
+                   for state in self._states):
+                until = time.strftime('%H:%M:%S', time.localtime(earliest))
+                raise NoApiKeyAvailableError(
+                    f"All {len(self._states)} Gemini API keys are quarantined or over quota until {until}"
+                )
+            throw_if_interrupted()
+            time.sleep(min(max(earliest - now, 0.0), WAIT_SLICE))
+
+    def _release(self, state: _KeyState, error: Optional[BaseException]) -> bool:
+        """Record the outcome of a request. Returns True if the key was quarantined."""
+        with self._lock:
+            state.in_flight -= 1
+            if error is None:
+                state.consecutive_429 = 0
+                return False
+
+            state.errors += 1
+            state.last_error = str(error)[:200]
+            if getattr(error, 'code', None) == 429:
+                state.consecutive_429 += 1
+                duration = min(QUARANTINE_BASE_SECONDS * 2 ** (state.consecutive_429 - 1), QUARANTINE_MAX_SECONDS)
+            elif _is_auth_error(error):
+                duration = AUTH_QUARANTINE_SECONDS
+            else:
+                return False
+            state.quarantined_until = time.time() + duration
+
+        print(f"[KEYS] Quarantined {mask_key(state.api_key)} for {duration:.0f}s: {state.last_error}")
+        return True
+
+    def call(self, func: Callable[[str], Any]) -> Any:
+        """
+        Call func(api_key) with the least-loaded key. A 429 or authentication error quarantines
+        the key and retries on another one, trying each key at most once.
+        """
+        for attempt in range(len(self._states)):
+            state = self._acquire()
+            try:
+                result = func(state.api_key)
+            except BaseException as e:
+                quarantined = self._release(state, e)
+                if quarantined and attempt < len(self._states) - 1:
+                    continue
+                raise
+            self._release(state, None)
+            return result
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-key usage since this process started (keys masked)."""
+        with self._lock:
+            now = time.time()
+            return [{
+                'key': mask_key(state.api_key),
+                'in_flight': state.in_flight,
+                'requests': state.requests,
+                'last_minute': state.last_minute(now),
+                'last_day': len(state.recent),
+                'rpm': state.rpm,
+                'rpd': state.rpd,
+                'errors': state.errors,
+                'quarantined_for': max(round(state.quarantined_until - now, 1), 0.0),
+                'last_error': state.last_error,
+            } for state in self._states]
+
+
+def _env_int(name: str) -> int:
+    try:
+        return max(int(os.environ.get(name, "0")), 0)
+    except ValueError:
+        return 0
+
+
+def load_api_keys() -> List[Tuple[str, int, int]]:
+    """Keys from SK_GEMINI_API_KEYS and SK_GEMINI_API_KEYS_FILE, deduplicated, in order."""
+    default_rpm = _env_int("SK_GEMINI_KEY_RPM")
+    default_rpd = _env_int("SK_GEMINI_KEY_RPD")
+    keys: Dict[str, Tuple[str, int, int]] = {}
+
+    for api_key in os.environ.get("SK_GEMINI_API_KEYS", "").replace("\n", ",").split(","):
+        if api_key.strip():
+            keys.setdefault(api_key.strip(), (api_key.strip(), default_rpm, default_rpd))
+
+    keys_file = os.environ.get("SK_GEMINI_API_KEYS_FILE", "").strip()
+    if keys_file and os.path.exists(keys_file):
+        with open(keys_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if not fields or fields[0].startswith("#"):
+                    continue
+                limits = dict(field.split("=", 1) for field in fields[1:] if "=" in field)
+                try:
+                    rpm = int(limits.get("rpm", default_rpm))
+                    rpd = int(limits.get("rpd", default_rpd))
+                except ValueError:
+                    print(f"[KEYS] Ignoring invalid limits for {mask_key(fields[0])} in {keys_file}")
+                    rpm, rpd = default_rpm, default_rpd
+                keys.setdefault(fields[0], (fields[0], rpm, rpd))
+
+    return list(keys.values())
+
+
+# Global key pool instance
+_global_pool: Optional[ApiKeyPool] = None
+_global_pool_source: Optional[Tuple[Any, ...]] = None
+_global_pool_lock = threading.Lock()
+
+
+def _pool_source() -> Tuple[Any, ...]:
+    keys_file = os.environ.get("SK_GEMINI_API_KEYS_FILE", "").strip()
+    try:
+        mtime = os.path.getmtime(keys_file) if keys_file else None
+    except OSError:
+        mtime = None
+    return (os.environ.get("SK_GEMINI_API_KEYS", ""), keys_file, mtime,
+            os.environ.get("SK_GEMINI_KEY_RPM", ""), os.environ.get("SK_GEMINI_KEY_RPD", ""))
+
+
+def get_key_pool() -> Optional[ApiKeyPool]:
+    """Get the global key pool, or None when no keys are configured (use the Options node's key)."""
+    global _global_pool, _global_pool_source
+    source = _pool_source()
+    with _global_pool_lock:
+        if source != _global_pool_source:
+            keys = load_api_keys()
+            _global_pool = ApiKeyPool(keys) if keys else None
+            _global_pool_source = source
+            if keys:
+                print(f"[KEYS] Loaded {len(keys)} Gemini API keys")
+        return _global_pool
+
+
+def call_with_api_key(default_key: str, func: Callable[[str], Any]) -> Any:
+    """Call func(api_key) with a pooled key when a pool is configured, else with default_key."""
+    pool = get_key_pool()
+    if pool is None:
+        return func(default_key)
+    return pool.call(func)
+
+
+def api_key_label(default_key: str) -> str:
+    """How the key used for requests is shown in node status text."""
+    pool = get_key_pool()
+    if pool is None:
+        return mask_key(default_key)
+    return f"pool of {len(pool)} keys"
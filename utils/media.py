@@ -0,0 +1,555 @@
+"""
+Media preparation helpers shared by the Gemini nodes.
+
+These are plain functions (no node state) so they can be benchmarked in isolation and
+submitted to worker pools.
+
+OpenCV, numpy and Pillow are imported inside the functions that use them, so importing the
+node pack at ComfyUI startup does not pay for them.
+"""
+
+import os
+import io
+import re
+import glob
+import json
+import shutil
+import subprocess
+import threading
+from typing import TYPE_CHECKING, List, Tuple, Dict, Any, Optional
+
+from .cancellation import on_cancel
+
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image
+
+IMAGE_EXTENSIONS = ["*.jpg", "*.jpeg", "*.png", "*.bmp", "*.gif", "*.tiff", "*.webp"]
+VIDEO_EXTENSIONS = ["*.mp4", "*.avi", "*.mov", "*.mkv", "*.wmv", "*.flv", "*.webm"]
+
+
+def media_extensions(media_type: str) -> List[str]:
+    """Glob patterns for the supported extensions of a media type ("image" or "video")."""
+    return IMAGE_EXTENSIONS if media_type == "image" else VIDEO_EXTENSIONS
+
+
+def find_media_files(media_path: str, media_type: str) -> List[str]:
+    """Find all media files of the given type in media_path, including subdirectories."""
+    all_files: List[str] = []
+    for ext in media_extensions(media_type):
+        # Search in root directory
+        all_files.extend(glob.glob(os.path.join(media_path, ext)))
+        all_files.extend(glob.glob(os.path.join(media_path, ext.upper())))
+        # Search in subdirectories recursively
+        all_files.extend(glob.glob(os.path.join(media_path, "**", ext), recursive=True))
+        all_files.extend(glob.glob(os.path.join(media_path, "**", ext.upper()), recursive=True))
+    return all_files
+
+
+def encode_jpeg(pil_image: "Image.Image") -> bytes:
+    """Encode a PIL image as JPEG bytes."""
+    img_byte_arr = io.BytesIO()
+    pil_image.save(img_byte_arr, format='JPEG')
+    return img_byte_arr.getvalue()
+
+
+def image_from_tensor(image: Any) -> "Image.Image":
+    """
+    Convert a ComfyUI IMAGE tensor (or numpy array) to a PIL image.
+
+    Only the first image of a batch is used.
+    """
+    import numpy as np
+    from PIL import Image
+
+    # Convert ComfyUI IMAGE tensor to image data
+    if hasattr(image, 'cpu'):
+        image_np = image.cpu().numpy()
+    else:
+        image_np = image
+
+    # Take the first image from the batch if multiple images
+    if len(image_np.shape) == 4:
+        image_array = image_np[0]
+    else:
+        image_array = image_np
+
+    # Convert from 0-1 float to 0-255 uint8
+    if image_array.dtype == np.float32 or image_array.dtype == np.float64:
+        image_array = (image_array * 255).astype(np.uint8)
+
+    # Convert numpy array to PIL Image
+    if len(image_array.shape) == 3 and image_array.shape[2] == 3:
+        return Image.fromarray(image_array, 'RGB')
+    elif len(image_array.shape) == 3 and image_array.shape[2] == 4:
+        return Image.fromarray(image_array, 'RGBA')
+    return Image.fromarray(image_array).convert('RGB')
+
+
+def image_from_file(file_path: str) -> "Image.Image":
+    """Open an image file as an RGB PIL image."""
+    from PIL import Image
+
+    pil_image = Image.open(file_path)
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    return pil_image
+
+
+def encode_image_tensor(image: Any) -> Tuple[bytes, Tuple[int, int]]:
+    """
+    Convert a ComfyUI IMAGE tensor (or numpy array) to JPEG bytes.
+
+    Only the first image of a batch is used.
+
+    Returns:
+        (jpeg_bytes, (width, height))
+    """
+    pil_image = image_from_tensor(image)
+    return encode_jpeg(pil_image), pil_image.size
+
+
+def encode_image_file(file_path: str) -> Tuple[bytes, Tuple[int, int]]:
+    """
+    Read an image file and re-encode it as RGB JPEG bytes.
+
+    Returns:
+        (jpeg_bytes, (width, height))
+    """
+    pil_image = image_from_file(file_path)
+    return encode_jpeg(pil_image), pil_image.size
+
+
+def first_image_array(image: Any) -> "np.ndarray":
+    """
+    First image of a ComfyUI IMAGE batch as a numpy array, which is much cheaper to send to a
+    worker process than the whole tensor.
+    """
+    import numpy as np
+
+    if len(image.shape) == 4:
+        image = image[0]
+    return image.cpu().numpy() if hasattr(image, 'cpu') else np.asarray(image)
+
+
+def image_dimensions(image: Any = None, file_path: Optional[str] = None) -> Tuple[int, int]:
+    """(width, height) of an IMAGE tensor/array or an image file, without decoding pixels."""
+    if image is not None:
+        height, width = (image.shape[1], image.shape[2]) if len(image.shape) == 4 else (image.shape[0], image.shape[1])
+        return int(width), int(height)
+    from PIL import Image
+
+    with Image.open(file_path) as pil_image:
+        return pil_image.size
+
+
+def prepare_image(source: Any, phash_algorithm: Optional[str] = None) -> Tuple[bytes, Tuple[int, int], Optional[str]]:
+    """
+    Worker-pool task: decode an image file or array and re-encode it as JPEG exactly like the
+    Media Describe node, plus its perceptual hash when near-duplicate reuse is enabled.
+
+    Args:
+        source: Image file path, or an image array (see first_image_array)
+        phash_algorithm: Perceptual hash algorithm, or None to skip hashing
+
+    Returns:
+        (jpeg_bytes, (width, height), "algorithm:hex" perceptual hash or None)
+    """
+    pil_image = image_from_file(source) if isinstance(source, str) else image_from_tensor(source)
+    image_phash = f"{phash_algorithm}:{perceptual_hash(pil_image, phash_algorithm):016x}" if phash_algorithm else None
+    return encode_jpeg(pil_image), pil_image.size, image_phash
+
+
+def read_file(file_path: str) -> bytes:
+    """Worker-pool task: read a whole file."""
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+PERCEPTUAL_HASH_ALGORITHMS = ("phash", "dhash")
+
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+_dct_matrix = None
+
+
+def _get_dct_matrix() -> "np.ndarray":
+    """Orthonormal DCT-II basis for 32x32 inputs (computed once)."""
+    global _dct_matrix
+    if _dct_matrix is None:
+        import numpy as np
+
+        n = np.arange(_DCT_SIZE)
+        matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * _DCT_SIZE))
+        matrix[0, :] *= 1 / np.sqrt(2)
+        _dct_matrix = matrix * np.sqrt(2 / _DCT_SIZE)
+    return _dct_matrix
+
+
+def perceptual_hash(pil_image: "Image.Image", algorithm: str = "phash") -> int:
+    """
+    64-bit perceptual hash of an image. Resized, re-saved and re-compressed copies of the
+    same image hash to values a few bits apart (compare with hamming_distance).
+
+    Args:
+        pil_image: Image to hash
+        algorithm: "phash" (DCT-based, robust to scaling and compression) or "dhash" (gradient-based, faster)
+
+    Returns:
+        Hash as an unsigned 64-bit integer
+    """
+    import numpy as np
+    from PIL import Image
+
+    gray = pil_image.convert('L')
+    if algorithm == "dhash":
+        pixels = np.asarray(gray.resize((_HASH_SIZE + 1, _HASH_SIZE), Image.LANCZOS), dtype=np.float32)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    elif algorithm == "phash":
+        pixels = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+        dct = _get_dct_matrix()
+        coefficients = (dct @ pixels @ dct.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+        # Median without the DC term, which only reflects overall brightness
+        bits = coefficients > np.median(coefficients[1:])
+    else:
+        raise ValueError(f"Unknown perceptual hash algorithm: {algorithm}")
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+def probe_video_cv2(file_path: str) -> Dict[str, Any]:
+    """Read frame count, fps, dimensions and duration of a video using OpenCV."""
+    import cv2
+
+    cap = cv2.VideoCapture(file_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    return {
+        'frame_count': frame_count,
+        'fps': fps,
+        'width': width,
+        'height': height,
+        'duration': frame_count / fps if fps > 0 else 0,
+    }
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """Parse an ffprobe rational like "30000/1001"."""
+    if not rate:
+        return 0.0
+    numerator, _, denominator = rate.partition("/")
+    try:
+        return float(numerator) / float(denominator or 1) if float(denominator or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+
+def probe_video_ffprobe(file_path: str) -> Dict[str, Any]:
+    """
+    Read frame count, fps, dimensions and duration of a video using ffprobe.
+
+    Only container and stream headers are read, which is faster than OpenCV for containers
+    where OpenCV has to scan the file. Raises RuntimeError if ffprobe fails.
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,avg_frame_rate,r_frame_rate,nb_frames,duration:format=duration',
+        '-of', 'json',
+        file_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        probe = json.loads(result.stdout)
+    except (subprocess.CalledProcessError, json.JSONDecodeError) as e:
+        raise RuntimeError(f"ffprobe failed for {file_path}: {getattr(e, 'stderr', e)}")
+
+    streams = probe.get('streams') or [{}]
+    stream = streams[0]
+    fps = _parse_rate(stream.get('avg_frame_rate')) or _parse_rate(stream.get('r_frame_rate'))
+    duration = float(stream.get('duration') or probe.get('format', {}).get('duration') or 0)
+    frame_count = int(stream['nb_frames']) if str(stream.get('nb_frames', '')).isdigit() else int(round(duration * fps))
+    return {
+        'frame_count': frame_count,
+        'fps': fps,
+        'width': int(stream.get('width') or 0),
+        'height': int(stream.get('height') or 0),
+        # Same definition as the OpenCV probe, so cached results don't depend on the prober
+        'duration': frame_count / fps if fps > 0 else duration,
+    }
+
+
+def video_prober() -> str:
+    """
+    Prober used by probe_video: SK_GEMINI_PROBE=ffprobe|cv2, or auto (default), which prefers
+    ffprobe when it is installed.
+    """
+    choice = os.environ.get("SK_GEMINI_PROBE", "auto").strip().lower()
+    if choice in ("ffprobe", "cv2"):
+        return choice
+    return "ffprobe" if shutil.which("ffprobe") else "cv2"
+
+
+def probe_video(file_path: str, prober: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read frame count, fps, dimensions and duration of a video (uncached).
+
+    Args:
+        file_path: Video file
+        prober: "ffprobe" or "cv2" (default: video_prober()); ffprobe falls back to cv2 on failure
+    """
+    prober = prober or video_prober()
+    if prober == "ffprobe":
+        try:
+            return probe_video_ffprobe(file_path)
+        except (RuntimeError, FileNotFoundError) as e:
+            print(f"[MEDIA] {e}; falling back to OpenCV probe")
+    return probe_video_cv2(file_path)
+
+
+def run_ffmpeg(cmd: List[str]) -> None:
+    """
+    Run an ffmpeg command like subprocess.run(check=True), but cancellable: when it runs under
+    run_cancellable and the call is abandoned, the process is killed and reaped before the
+    waiter raises, so the caller can safely remove its output file.
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    def stop() -> None:
+        process.kill()
+        process.wait()
+
+    on_cancel(stop)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+
+
+def trim_video(input_path: str, output_path: str, duration: float) -> bool:
+    """
+    Trim video to specified duration from the beginning using ffmpeg
+
+    Args:
+        input_path: Path to input video file
+        output_path: Path to output trimmed video file
+        duration: Duration in seconds from the beginning
+    """
+    return extract_video_segment(input_path, output_path, 0.0, duration)
+
+
+def extract_video_segment(input_path: str, output_path: str, start: float, duration: float) -> bool:
+    """
+    Cut [start, start + duration) out of a video using ffmpeg
+
+    Streams are copied without re-encoding for speed, so a cut that does not start at 0 snaps
+    to the preceding keyframe; if copying fails the segment is re-encoded. Under run_cancellable,
+    a cancel kills ffmpeg (see run_ffmpeg).
+
+    Args:
+        input_path: Path to input video file
+        output_path: Path to output video file
+        start: Start time in seconds
+        duration: Duration in seconds from start
+    """
+    # Seeking before -i is fast (keyframe-based); it is omitted for trims from the beginning
+    seek = ['-ss', str(start)] if start > 0 else []
+
+    try:
+        cmd = [
+            'ffmpeg',
+            *seek,
+            '-i', input_path,
+            '-t', str(duration),
+            '-c', 'copy',  # Copy streams without re-encoding for speed
+            '-avoid_negative_ts', 'make_zero',
+            '-y',  # Overwrite output file if it exists
+            output_path
+        ]
+
+        run_ffmpeg(cmd)
+        return True
+
+    except subprocess.CalledProcessError as e:
+        if e.returncode < 0:
+            return False  # Killed by a cancel (see run_ffmpeg)
+        print(f"FFmpeg error: {e.stderr}")
+        # Fallback: try with re-encoding if copy fails
+        try:
+            cmd = [
+                'ffmpeg',
+                *seek,
+                '-i', input_path,
+                '-t', str(duration),
+                '-c:v', 'libx264',
+                '-c:a', 'aac',
+                '-y',
+                output_path
+            ]
+            run_ffmpeg(cmd)
+            return True
+        except subprocess.CalledProcessError as e2:
+            print(f"FFmpeg re-encoding also failed: {e2.stderr}")
+            return False
+    except FileNotFoundError:
+        print("FFmpeg not found. Please install ffmpeg to use duration trimming.")
+        return False
+
+
+def detect_scene_changes(file_path: str, threshold: float = 0.3) -> List[float]:
+    """
+    Timestamps (seconds) of scene changes in a video, using ffmpeg's scene score.
+
+    Frames are downscaled before scoring, which is much faster and hardly changes the result.
+    Raises RuntimeError if ffmpeg is missing or fails.
+
+    Args:
+        file_path: Video file
+        threshold: Minimum scene score (0-1) for a frame to count as a scene change
+    """
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats',
+        '-i', file_path,
+        '-an',
+        '-vf', f"scale=320:-2,select='gt(scene,{threshold})',showinfo",
+        '-f', 'null', '-'
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except FileNotFoundError:
+        raise RuntimeError("FFmpeg not found. Please install ffmpeg to use scene detection.")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg scene detection failed for {file_path}: {e.stderr}")
+    return [float(t) for t in re.findall(r"pts_time:\s*([0-9.]+)", result.stderr)]
+
+
+def read_video_frames(file_path: str, timestamps: List[float]) -> List["np.ndarray"]:
+    """
+    Decode the frames at the given timestamps (seconds) as RGB arrays.
+
+    Uses OpenCV, or ffmpeg (one seek per frame) when OpenCV cannot open the file. Frames that
+    cannot be decoded are skipped, so the result may be shorter than timestamps.
+    """
+    import cv2
+    import numpy as np
+    from PIL import Image
+
+    frames = []
+    cap = cv2.VideoCapture(file_path)
+    try:
+        if cap.isOpened():
+            for timestamp in timestamps:
+                cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000.0)
+                ok, frame = cap.read()
+                if ok:
+                    frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    finally:
+        cap.release()
+    if frames:
+        return frames
+
+    for timestamp in timestamps:
+        cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-ss', str(timestamp), '-i', file_path,
+               '-frames:v', '1', '-f', 'image2pipe', '-vcodec', 'png', '-']
+        try:
+            result = subprocess.run(cmd, capture_output=True, check=True)
+        except FileNotFoundError:
+            break
+        except subprocess.CalledProcessError:
+            continue
+        if result.stdout:
+            frames.append(np.asarray(Image.open(io.BytesIO(result.stdout)).convert('RGB')))
+    return frames
+
+
+def frame_to_rgb24(frame: Any) -> "np.ndarray":
+    """Convert one ComfyUI IMAGE frame (H, W, C float 0-1, tensor or array) to contiguous uint8 RGB."""
+    import numpy as np
+
+    if hasattr(frame, 'cpu'):
+        frame = frame.cpu().numpy()
+    if frame.dtype != np.uint8:
+        frame = (np.clip(frame, 0.0, 1.0) * 255).astype(np.uint8)
+    if frame.ndim == 2:
+        frame = np.stack([frame] * 3, axis=-1)
+    elif frame.shape[2] == 1:
+        frame = np.repeat(frame, 3, axis=2)
+    elif frame.shape[2] == 4:
+        frame = frame[:, :, :3]
+    return np.ascontiguousarray(frame)
+
+
+def encode_frames_mp4(frames: Any, frame_rate: float) -> bytes:
+    """
+    Encode an IMAGE frame batch (N, H, W, C) as H.264 mp4 entirely in memory.
+
+    Raw RGB frames are written to ffmpeg's stdin one at a time and fragmented mp4 (which needs
+    no seekable output) is read from stdout, so no temporary files are written and only one
+    raw frame is held at a time besides the encoded result. Raises RuntimeError if ffmpeg is
+    missing or fails.
+
+    Args:
+        frames: ComfyUI IMAGE tensor or numpy array with a leading frame axis
+        frame_rate: Frames per second of the encoded video
+    """
+    frame_count = len(frames)
+    if frame_count == 0:
+        raise ValueError("No frames to encode")
+
+    first = frame_to_rgb24(frames[0])
+    height, width = first.shape[:2]
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(frame_rate),
+        '-i', 'pipe:0',
+        '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',  # yuv420p needs even dimensions
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+        '-f', 'mp4', 'pipe:1'
+    ]
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError("FFmpeg not found. Please install ffmpeg to describe IMAGE frames as video.")
+
+    # Drain stdout and stderr concurrently so ffmpeg never blocks on a full pipe while we write
+    chunks: List[bytes] = []
+    errors: List[bytes] = []
+    readers = [
+        threading.Thread(target=lambda: chunks.extend(iter(lambda: process.stdout.read(1 << 16), b"")), daemon=True),
+        threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    try:
+        for index in range(frame_count):
+            frame = first if index == 0 else frame_to_rgb24(frames[index])
+            if frame.shape[:2] != (height, width):
+                raise ValueError(f"Frame {index} is {frame.shape[1]}x{frame.shape[0]}, expected {width}x{height}")
+            process.stdin.write(memoryview(frame).cast('B'))
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its error is reported below
+    except Exception:
+        process.kill()
+        raise
+    finally:
+        process.stdin.close()
+        process.wait()
+        for reader in readers:
+            reader.join()
+
+    if process.returncode != 0:
+        stderr = b"".join(errors).decode('utf-8', 'replace').strip()
+        raise RuntimeError(f"ffmpeg failed to encode frames: {stderr}")
+    return b"".join(chunks)
@@ -0,0 +1,294 @@
+"""
+Opt-in profiling hooks for Gemini media describe executions.
+
+Profiling is disabled by default. It can be enabled for every execution on a host through
+environment variables, or per workflow through the ``profiling`` and ``slow_request_threshold``
+fields of the Gemini Util - Options node:
+
+- SK_GEMINI_PROFILE: "cprofile" or "tracemalloc" to profile each execution (default: off)
+- SK_GEMINI_PROFILE_DIR: directory for reports (default: <sk_custom_nodes>/cache/profiles)
+- SK_GEMINI_PROFILE_KEEP: number of reports kept before the oldest are rotated out (default: 50)
+- SK_GEMINI_SLOW_THRESHOLD: executions taking longer than this many seconds are appended to
+  slow_requests.jsonl with a per-stage breakdown (default: 0, disabled)
+
+Stage timings are recorded with the ``stage()`` context manager, which is a no-op when no
+execution is being profiled on the current thread.
+"""
+
+import os
+import json
+import time
+import pstats
+import io
+import cProfile
+import threading
+import tracemalloc
+import itertools
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator, List
+
+from .file_lock import file_lock
+
+PROFILE_MODES = ("off", "cprofile", "tracemalloc")
+SLOW_LOG_NAME = "slow_requests.jsonl"
+SLOW_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_report_counter = itertools.count()
+
+
+def _default_profile_dir() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "cache", "profiles")
+
+
+def _normalize_mode(mode: Optional[str]) -> str:
+    """Map widget/env values ("cProfile", "Off", "") onto PROFILE_MODES."""
+    mode = (mode or "").strip().lower()
+    return mode if mode in PROFILE_MODES else "off"
+
+
+def resolve_settings(mode: Optional[str] = None, slow_threshold: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Combine per-node settings with the environment.
+
+    Node settings win when they enable something; otherwise the environment decides.
+    """
+    resolved_mode = _normalize_mode(mode)
+    if resolved_mode == "off":
+        resolved_mode = _normalize_mode(os.environ.get("SK_GEMINI_PROFILE"))
+
+    threshold = float(slow_threshold or 0.0)
+    if threshold <= 0:
+        try:
+            threshold = float(os.environ.get("SK_GEMINI_SLOW_THRESHOLD", "0") or 0)
+        except ValueError:
+            threshold = 0.0
+
+    try:
+        keep = int(os.environ.get("SK_GEMINI_PROFILE_KEEP", "50"))
+    except ValueError:
+        keep = 50
+
+    return {
+        'mode': resolved_mode,
+        'slow_threshold': threshold,
+        'report_dir': os.environ.get("SK_GEMINI_PROFILE_DIR") or _default_profile_dir(),
+        'keep': max(keep, 1),
+    }
+
+
+class ExecutionProfile:
+    """Timing, stage breakdown and optional profiler state for a single execution."""
+
+    def __init__(self, name: str, mode: str, slow_threshold: float, report_dir: str, keep: int):
+        self.name = name
+        self.mode = mode
+        self.slow_threshold = slow_threshold
+        self.report_dir = report_dir
+        self.keep = keep
+        self.stages: Dict[str, float] = {}
+        self.metadata: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.elapsed = 0.0
+        self.report_path: Optional[str] = None
+        self._started = 0.0
+        self._profiler: Optional[cProfile.Profile] = None
+        self._tracemalloc_started = False
+        self._snapshot_start: Optional[tracemalloc.Snapshot] = None
+
+    def add_stage(self, stage_name: str, elapsed: float) -> None:
+        """Accumulate time spent in a named stage (stages may repeat, e.g. per segment)."""
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + elapsed
+
+    def start(self) -> None:
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError as e:
+                # Another profiler is already active on this thread
+                print(f"[PROFILE] cProfile unavailable: {e}")
+                self._profiler = None
+        elif self.mode == "tracemalloc":
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._tracemalloc_started = True
+            tracemalloc.reset_peak()
+            self._snapshot_start = tracemalloc.take_snapshot()
+        self._started = time.perf_counter()
+
+    def stop(self) -> None:
+        self.elapsed = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+
+        try:
+            if self.mode == "cprofile" and self._profiler is not None:
+                self.report_path = self._write_cprofile_report()
+            elif self.mode == "tracemalloc" and self._snapshot_start is not None:
+                self.report_path = self._write_tracemalloc_report()
+        except OSError as e:
+            print(f"[PROFILE] Failed to write profile report: {e}")
+        finally:
+            if self._tracemalloc_started:
+                tracemalloc.stop()
+
+        if self.slow_threshold > 0 and self.elapsed >= self.slow_threshold:
+            self._append_slow_log()
+
+    def _report_base(self) -> str:
+        os.makedirs(self.report_dir, exist_ok=True)
+        # Timestamp first so lexical order is chronological; the counter keeps same-second reports apart
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.report_dir, f"{stamp}_{next(_report_counter):06d}_{self.name}_{os.getpid()}")
+
+    def _write_cprofile_report(self) -> str:
+        assert self._profiler is not None
+        base = self._report_base()
+        self._profiler.dump_stats(f"{base}.prof")
+
+        # Human readable summary next to the binary stats (loadable with pstats/snakeviz)
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(40)
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(self._summary_header())
+            f.write(stream.getvalue())
+
+        self._rotate_reports()
+        return f"{base}.prof"
+
+    def _write_tracemalloc_report(self) -> str:
+        assert self._snapshot_start is not None
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        top_stats = snapshot.compare_to(self._snapshot_start, 'lineno')
+
+        base = self._report_base()
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(self._summary_header())
+            f.write(f"Traced memory: current={current / 1024 / 1024:.2f} MB peak={peak / 1024 / 1024:.2f} MB\n\n")
+            f.write("Top allocations since execution start:\n")
+            for stat in top_stats[:40]:
+                f.write(f"{stat}\n")
+
+        self._rotate_reports()
+        return f"{base}.txt"
+
+    def _summary_header(self) -> str:
+        lines = [
+            f"Execution: {self.name}",
+            f"Elapsed: {self.elapsed:.3f}s",
+            "Stages: " + ", ".join(f"{k}={v:.3f}s" for k, v in self.stages.items()),
+            f"Metadata: {json.dumps(self.metadata, default=str)}",
+        ]
+        if self.error:
+            lines.append(f"Error: {self.error}")
+        return "\n".join(lines) + "\n\n"
+
+    def _rotate_reports(self) -> None:
+        """Delete the oldest reports so at most ``keep`` executions remain on disk."""
+        reports: List[str] = []
+        for filename in os.listdir(self.report_dir):
+            if filename.endswith('.prof') or filename.endswith('.txt'):
+                reports.append(os.path.join(self.report_dir, filename))
+
+        # A cProfile execution produces two files (.prof + .txt), group them by base name
+        bases = sorted({os.path.splitext(p)[0] for p in reports}, key=lambda b: os.path.basename(b))
+        for base in bases[:-self.keep]:
+            for ext in ('.prof', '.txt'):
+                try:
+                    os.remove(base + ext)
+                except OSError:
+                    pass
+
+    def _append_slow_log(self) -> None:
+        entry = {
+            'timestamp': time.time(),
+            'human_timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'name': self.name,
+            'pid': os.getpid(),
+            'elapsed': round(self.elapsed, 4),
+            'threshold': self.slow_threshold,
+            'stages': {k: round(v, 4) for k, v in self.stages.items()},
+            'unaccounted': round(max(self.elapsed - sum(self.stages.values()), 0.0), 4),
+            'metadata': self.metadata,
+            'error': self.error,
+            'report': self.report_path,
+        }
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            log_path = os.path.join(self.report_dir, SLOW_LOG_NAME)
+            # Several ComfyUI workers may share the report directory
+            with _write_lock, file_lock(log_path + ".lock"):
+                if os.path.exists(log_path) and os.path.getsize(log_path) > SLOW_LOG_MAX_BYTES:
+                    os.replace(log_path, log_path + ".1")
+                with open(log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, default=str, ensure_ascii=False) + "\n")
+            print(f"[PROFILE] Slow execution ({self.elapsed:.2f}s >= {self.slow_threshold:.2f}s) logged to {log_path}")
+        except OSError as e:
+            print(f"[PROFILE] Failed to write slow request log: {e}")
+
+
+def current_profile() -> Optional[ExecutionProfile]:
+    """Return the profile of the execution running on this thread, if any."""
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def profile_execution(name: str, mode: Optional[str] = None, slow_threshold: Optional[float] = None,
+                      metadata: Optional[Dict[str, Any]] = None) -> Iterator[Optional[ExecutionProfile]]:
+    """
+    Profile one node execution.
+
+    Yields None (and costs nothing) when neither profiling nor the slow-request log is enabled.
+    Nested calls on the same thread reuse the outer profile.
+    """
+    existing = current_profile()
+    if existing is not None:
+        yield existing
+        return
+
+    settings = resolve_settings(mode, slow_threshold)
+    if settings['mode'] == "off" and settings['slow_threshold'] <= 0:
+        yield None
+        return
+
+    profile = ExecutionProfile(name, settings['mode'], settings['slow_threshold'], settings['report_dir'], settings['keep'])
+    if metadata:
+        profile.metadata.update(metadata)
+
+    _local.profile = profile
+    profile.start()
+    try:
+        yield profile
+    except BaseException as e:
+        profile.error = str(e)
+        raise
+    finally:
+        _local.profile = None
+        profile.stop()
+
+
+@contextmanager
+def stage(stage_name: str) -> Iterator[None]:
+    """Time a stage of the current execution (no-op when not profiling)."""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_stage(stage_name, time.perf_counter() - started)
+
+
+def annotate(**metadata: Any) -> None:
+    """Attach metadata (media type, cache hit, ...) to the current execution's profile."""
+    profile = current_profile()
+    if profile is not None:
+        profile.metadata.update(metadata)
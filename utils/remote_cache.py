@@ -0,0 +1,444 @@
+"""
+Networked shared cache backend for GeminiCache.
+
+A fleet of ComfyUI hosts can share descriptions through a simple key-value store, so a
+caption paid for on one host is a cache hit on all others. The local cache directory acts
+as a near-cache in front of the remote store:
+
+- get: local file first; on a local miss the remote store is asked, and a remote hit is
+  written to the local directory for next time
+- set: written locally right away, then queued and sent to the remote store in batches by
+  a background thread
+
+Configure with SK_GEMINI_CACHE_REMOTE:
+
+- redis://host:6379/0 (or rediss://) - any Redis-compatible server, requires the `redis` package
+- http://host:8765 - the bundled HTTP store, started with:
+
+      SK_GEMINI_CACHE_REMOTE_TOKEN=<secret> python -m utils.remote_cache serve --host 0.0.0.0 --port 8765 --dir /srv/gemini_cache
+
+The HTTP store requires the shared token SK_GEMINI_CACHE_REMOTE_TOKEN (sent as a Bearer token)
+on every request except /v1/health, so hosts that can reach the port but lack the token cannot
+read, overwrite or delete entries. It refuses to listen on a non-loopback address without one.
+
+Optional settings: SK_GEMINI_CACHE_REMOTE_TTL (seconds, Redis only), SK_GEMINI_CACHE_REMOTE_TIMEOUT
+(seconds per request, default 2), SK_GEMINI_CACHE_REMOTE_BATCH (entries per batch, default 64) and
+SK_GEMINI_CACHE_REMOTE_FLUSH (seconds between flushes, default 0.5).
+"""
+
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import queue
+import atexit
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional, Dict, List, Iterable
+
+from .file_lock import atomic_write_bytes
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+
+def remote_token() -> str:
+    """Shared secret of the bundled HTTP store (SK_GEMINI_CACHE_REMOTE_TOKEN, empty = none)."""
+    return os.environ.get("SK_GEMINI_CACHE_REMOTE_TOKEN", "").strip()
+
+
+class RemoteStore:
+    """Minimal key-value interface used by GeminiCache. Values are serialized cache entries."""
+
+    name = "remote"
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set_many(self, items: Dict[str, bytes]) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        raise NotImplementedError
+
+
+class RedisStore(RemoteStore):
+    """Redis-compatible store (Redis, Valkey, KeyDB, ...). Requires the optional `redis` package."""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "sk_gemini:", ttl: Optional[int] = None, timeout: float = 2.0):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis package is required for redis:// cache remotes (pip install redis)")
+
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.client.get(self.prefix + key)
+        return bytes(value) if value is not None else None
+
+    def set_many(self, items: Dict[str, bytes]) -> None:
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.set(self.prefix + key, value, ex=self.ttl)
+        pipeline.execute()
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        prefixed = [self.prefix + key for key in keys]
+        if prefixed:
+            self.client.delete(*prefixed)
+
+
+class HttpStore(RemoteStore):
+    """Client for the bundled HTTP store (see serve_http_store)."""
+
+    name = "http"
+
+    def __init__(self, base_url: str, timeout: float = 2.0, token: Optional[str] = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token = remote_token() if token is None else token
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None) -> Optional[bytes]:
+        request = urllib.request.Request(f"{self.base_url}{path}", data=body, method=method)
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        if body is not None:
+            request.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return bytes(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._request("GET", f"/v1/entries/{key}")
+
+    def set_many(self, items: Dict[str, bytes]) -> None:
+        payload = {'set': {key: value.decode('utf-8') for key, value in items.items()}}
+        self._request("POST", "/v1/batch", json.dumps(payload).encode('utf-8'))
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        payload = {'delete': list(keys)}
+        if payload['delete']:
+            self._request("POST", "/v1/batch", json.dumps(payload).encode('utf-8'))
+
+
+class AsyncBatchWriter:
+    """
+    Background writer that coalesces remote writes and sends them in batches.
+
+    Writes are flushed when ``batch_size`` entries are pending or ``flush_interval`` seconds
+    have passed. While the remote is failing, sends back off exponentially (up to
+    ``max_backoff`` seconds) and pending entries are kept, up to ``max_pending``. The queue in
+    front of the writer thread holds at most ``max_pending`` entries as well; writes beyond
+    that are dropped (they stay in the local cache) rather than growing memory without bound.
+    """
+
+    def __init__(self, store: RemoteStore, batch_size: int = 64, flush_interval: float = 0.5,
+                 max_pending: int = 10000, max_backoff: float = 30.0):
+        self.store = store
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(max_pending, 1))
+        self._pending: Dict[str, bytes] = {}
+        self.dropped = 0
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="gemini-cache-remote-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, key: str, value: bytes) -> None:
+        try:
+            self._queue.put_nowait((key, value))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                print(f"[CACHE] Remote write queue full, dropped {self.dropped} writes (kept locally)")
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Send everything enqueued so far. Returns True when nothing is left pending."""
+        done = threading.Event()
+        result: Dict[str, bool] = {}
+        try:
+            self._queue.put((done, result), timeout=timeout)
+        except queue.Full:
+            return False
+        done.wait(timeout)
+        return result.get('drained', False)
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self.flush(timeout=5.0)
+
+    def _send(self) -> None:
+        if not self._pending or time.monotonic() < self._retry_at:
+            return
+        batch = dict(self._pending)
+        try:
+            self.store.set_many(batch)
+        except Exception as e:
+            if self._backoff == 0.0:
+                print(f"[CACHE] Remote batch write of {len(batch)} entries failed, will retry: {e}")
+            self._backoff = min(max(self._backoff * 2, 1.0), self.max_backoff)
+            self._retry_at = time.monotonic() + self._backoff
+            if len(self._pending) > self.max_pending:
+                print(f"[CACHE] Dropping {len(self._pending)} pending remote writes")
+                self._pending.clear()
+            return
+
+        if self._backoff:
+            print("[CACHE] Remote store reachable again")
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        for key, value in batch.items():
+            # Only drop what was sent; a newer value for the same key may have arrived
+            if self._pending.get(key) is value:
+                del self._pending[key]
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(self.flush_interval - (time.monotonic() - last_flush), 0.01)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and isinstance(item[0], threading.Event):
+                done, result = item
+                self._send()
+                last_flush = time.monotonic()
+                result['drained'] = not self._pending
+                done.set()
+                continue
+
+            if item is not None:
+                key, value = item
+                self._pending[key] = value
+
+            if len(self._pending) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self._send()
+                last_flush = time.monotonic()
+
+
+class RemoteCacheClient:
+    """Remote store plus async batch writer, with a short back-off after remote read failures."""
+
+    def __init__(self, store: RemoteStore, batch_size: int = 64, flush_interval: float = 0.5, backoff: float = 30.0):
+        self.store = store
+        self.writer = AsyncBatchWriter(store, batch_size=batch_size, flush_interval=flush_interval)
+        self.backoff = backoff
+        self._unavailable_until = 0.0
+
+    def get(self, key: str) -> Optional[bytes]:
+        if time.monotonic() < self._unavailable_until:
+            return None
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            # Don't add a network timeout to every lookup while the remote is down
+            print(f"[CACHE] Remote {self.store.name} store unavailable, using local cache only for {self.backoff:.0f}s: {e}")
+            self._unavailable_until = time.monotonic() + self.backoff
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        self.writer.enqueue(key, value)
+
+    def delete_many(self, keys: List[str]) -> None:
+        try:
+            self.store.delete_many(keys)
+        except Exception as e:
+            print(f"[CACHE] Remote delete of {len(keys)} entries failed: {e}")
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        return self.writer.flush(timeout)
+
+
+def create_remote_store(url: str, timeout: float = 2.0, ttl: Optional[int] = None) -> RemoteStore:
+    """Build a RemoteStore from a redis:// or http:// URL."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url, ttl=ttl, timeout=timeout)
+    if url.startswith(("http://", "https://")):
+        return HttpStore(url, timeout=timeout)
+    raise ValueError(f"Unsupported cache remote URL: {url}")
+
+
+def create_remote_client_from_env() -> Optional[RemoteCacheClient]:
+    """RemoteCacheClient for SK_GEMINI_CACHE_REMOTE, or None when no remote is configured."""
+    url = os.environ.get("SK_GEMINI_CACHE_REMOTE", "").strip()
+    if not url:
+        return None
+    ttl = os.environ.get("SK_GEMINI_CACHE_REMOTE_TTL")
+    try:
+        store = create_remote_store(
+            url,
+            timeout=float(os.environ.get("SK_GEMINI_CACHE_REMOTE_TIMEOUT", "2")),
+            ttl=int(ttl) if ttl else None,
+        )
+    except (ImportError, ValueError) as e:
+        print(f"[CACHE] Remote cache disabled: {e}")
+        return None
+    print(f"[CACHE] Using remote {store.name} cache at {url}")
+    return RemoteCacheClient(
+        store,
+        batch_size=int(os.environ.get("SK_GEMINI_CACHE_REMOTE_BATCH", "64")),
+        flush_interval=float(os.environ.get("SK_GEMINI_CACHE_REMOTE_FLUSH", "0.5")),
+    )
+
+
+class _HttpStoreHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for the bundled HTTP store. ``server.store_dir`` holds the entries and
+    ``server.token`` is the shared secret clients must send (empty = no authentication).
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.server.store_dir, key[:2], f"{key}.json")  # type: ignore[attr-defined]
+
+    def _reply(self, status: int, body: bytes = b"", content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        token = self.server.token  # type: ignore[attr-defined]
+        if not token:
+            return True
+        supplied = self.headers.get("Authorization", "")
+        if hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {token}".encode('utf-8')):
+            return True
+        # The request body (if any) is not read, so the connection cannot be reused
+        self.close_connection = True
+        self._reply(401, b'{"error": "missing or invalid token"}')
+        return False
+
+    def do_GET(self) -> None:
+        if self.path == "/v1/health":
+            self._reply(200, b'{"status": "ok"}')
+            return
+        if not self._authorized():
+            return
+        key = self.path.rsplit("/", 1)[-1]
+        if not self.path.startswith("/v1/entries/") or not KEY_PATTERN.match(key):
+            self._reply(400, b'{"error": "invalid key"}')
+            return
+        try:
+            with open(self._entry_path(key), 'rb') as f:
+                self._reply(200, f.read())
+        except FileNotFoundError:
+            self._reply(404, b'{"error": "not found"}')
+
+    def do_POST(self) -> None:
+        if not self._authorized():
+            return
+        if self.path != "/v1/batch":
+            self.close_connection = True
+            self._reply(404, b'{"error": "not found"}')
+            return
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BATCH_BYTES:
+            self.close_connection = True
+            self._reply(413 if length > 0 else 400, json.dumps(
+                {'error': f"Content-Length must be between 0 and {MAX_BATCH_BYTES} bytes"}).encode('utf-8'))
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self._reply(400, b'{"error": "invalid json"}')
+            return
+
+        # Validate the whole batch before writing any of it
+        to_set = payload.get('set') or {} if isinstance(payload, dict) else None
+        to_delete = payload.get('delete') or [] if isinstance(payload, dict) else None
+        if not isinstance(to_set, dict) or not all(isinstance(value, str) for value in to_set.values()) \
+                or not isinstance(to_delete, list) or not all(isinstance(key, str) for key in to_delete):
+            self._reply(400, json.dumps({'error': 'expected {"set": {key: string}, "delete": [key]}'}).encode('utf-8'))
+            return
+
+        stored = deleted = 0
+        for key, value in to_set.items():
+            if KEY_PATTERN.match(key):
+                path = self._entry_path(key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                atomic_write_bytes(path, value.encode('utf-8'), durable=False)
+                stored += 1
+        for key in to_delete:
+            if KEY_PATTERN.match(key):
+                try:
+                    os.remove(self._entry_path(key))
+                    deleted += 1
+                except FileNotFoundError:
+                    pass
+        self._reply(200, json.dumps({'stored': stored, 'deleted': deleted}).encode('utf-8'))
+
+
+def serve_http_store(host: str, port: int, store_dir: str, token: Optional[str] = None) -> ThreadingHTTPServer:
+    """
+    Create (but don't start) the bundled HTTP store server. Call serve_forever() on the result.
+
+    token defaults to SK_GEMINI_CACHE_REMOTE_TOKEN. Without one, only loopback addresses are
+    allowed, since anyone reaching the port could otherwise overwrite the fleet's entries.
+    """
+    token = remote_token() if token is None else token
+    if not token and host not in LOOPBACK_HOSTS:
+        raise ValueError(f"Refusing to serve on {host} without a token; set SK_GEMINI_CACHE_REMOTE_TOKEN")
+    os.makedirs(store_dir, exist_ok=True)
+    server = ThreadingHTTPServer((host, port), _HttpStoreHandler)
+    server.store_dir = store_dir  # type: ignore[attr-defined]
+    server.token = token  # type: ignore[attr-defined]
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Shared Gemini description cache store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Run the bundled HTTP key-value store")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--dir", required=True, help="Directory where entries are stored")
+    args = parser.parse_args(argv)
+
+    try:
+        server = serve_http_store(args.host, args.port, args.dir)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"[CACHE] Serving shared cache store on http://{args.host}:{server.server_port} from {args.dir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
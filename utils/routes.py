@@ -0,0 +1,322 @@
+"""
+HTTP routes for the ComfyUI frontend: Gemini description cache management, usage totals,
+resumable media uploads, thumbnails and media_path browsing.
+
+Registered on ComfyUI's PromptServer when the node pack is loaded:
+
+- GET  /sk_custom_nodes/cache/stats   entry count, size and hit/miss counters (constant time)
+- GET  /sk_custom_nodes/cache/lookup  entries for a media path/identifier, model or options hash
+- POST /sk_custom_nodes/cache/purge   bulk delete by the same filters (JSON body), or {"all": true}
+- GET  /sk_custom_nodes/cache/export  matching entries as JSON lines (download)
+- GET  /sk_custom_nodes/usage         token, latency and cost totals per model and profile,
+                                      including tokens saved by cache hits (?days=7)
+- GET  /sk_custom_nodes/scheduler     Gemini request slots, running and queued requests per priority class
+- POST /sk_custom_nodes/upload/init      start or resume a content-addressed upload (JSON body:
+                                         media_type, sha256, size, name); answers 'exists'
+                                         without a transfer when the content is already uploaded
+- PUT  /sk_custom_nodes/upload/chunk     raw bytes at ?offset= (plus media_type, sha256, size)
+- POST /sk_custom_nodes/upload/complete  verify the SHA-256 and store the file (same body as init)
+- GET  /sk_custom_nodes/thumbnail        poster JPEG or animated WebP preview (?kind=poster|preview&size=256)
+                                         of filename/subfolder/type in ComfyUI's directories, or of a
+                                         file the node registered (?fingerprint=)
+- GET  /sk_custom_nodes/browse           one page of the media files below a media_path directory, with
+                                         the match count and subdirectory counts, from the directory index
+                                         (?path=&subdir=&media_type=|ext=&mtime_after=&mtime_before=&name=
+                                         &recursive=&offset=|after=&limit=&refresh=)
+
+Filters: path, media, model, model_type, options_hash, older_than_days, newer_than_days, limit.
+Index queries and file reads run in the default executor so the server loop is never blocked.
+"""
+
+import os
+import json
+import math
+import time
+import asyncio
+from typing import Dict, Any, Mapping
+
+# PromptServer first: outside ComfyUI the ImportError is raised before aiohttp is loaded
+from server import PromptServer
+from aiohttp import web
+
+from .cache import get_cache
+from .usage import get_usage_ledger
+from .scheduler import get_scheduler
+from .uploads import UploadError, get_uploads, input_directory
+from .thumbnails import get_thumbnails, media_type_of
+from .dir_index import check_browsable, get_directory_index
+from .media import media_extensions
+
+ROUTE_PREFIX = "/sk_custom_nodes/cache"
+USAGE_ROUTE = "/sk_custom_nodes/usage"
+SCHEDULER_ROUTE = "/sk_custom_nodes/scheduler"
+UPLOAD_PREFIX = "/sk_custom_nodes/upload"
+THUMBNAIL_ROUTE = "/sk_custom_nodes/thumbnail"
+BROWSE_ROUTE = "/sk_custom_nodes/browse"
+LOOKUP_LIMIT = 50
+LOOKUP_MAX_LIMIT = 1000
+_STRING_FILTERS = {'path': 'media_path', 'media': 'media_identifier', 'model': 'gemini_model',
+                   'model_type': 'model_type', 'options_hash': 'options_hash'}
+
+routes = PromptServer.instance.routes
+
+
+def _filters_from(params: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Translate query/body parameters into GeminiCache.list_entries keyword arguments.
+    Raises ValueError for values of the wrong type (e.g. a list in a JSON body).
+    """
+    now = time.time()
+    filters: Dict[str, Any] = {}
+    for param, name in _STRING_FILTERS.items():
+        value = params.get(param)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{param} must be a string")
+        filters[name] = value or None
+    for param, name in (('older_than_days', 'older_than'), ('newer_than_days', 'newer_than')):
+        value = params.get(param)
+        if value in (None, ""):
+            continue
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError(f"{param} must be a number")
+        days = float(value)
+        if not math.isfinite(days):
+            raise ValueError(f"{param} must be a finite number")
+        filters[name] = now - days * 86400
+    return filters
+
+
+def _limit_from(params: Mapping[str, Any], default: int, maximum: int) -> int:
+    """A limit parameter clamped to 1..maximum (SQLite treats a negative LIMIT as no limit)."""
+    return min(max(int(params.get('limit') or default), 1), maximum)
+
+
+async def _run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+
+@routes.get(f"{ROUTE_PREFIX}/stats")
+async def cache_stats(request: web.Request) -> web.Response:
+    return web.json_response(await _run(get_cache().get_cache_info))
+
+
+@routes.get(f"{ROUTE_PREFIX}/lookup")
+async def cache_lookup(request: web.Request) -> web.Response:
+    try:
+        filters = _filters_from(request.query)
+        limit = _limit_from(request.query, LOOKUP_LIMIT, LOOKUP_MAX_LIMIT)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    if not any(value is not None for value in filters.values()):
+        return web.json_response({'error': "Specify at least one of path, media, model, model_type, options_hash"}, status=400)
+
+    def lookup():
+        cache = get_cache()
+        entries = []
+        for row in cache.list_entries(limit=limit, **filters):
+            entry = cache.get_entry(row['cache_key'])
+            if entry is not None:
+                entries.append({**row, 'description': entry.get('description'), 'options': entry.get('options')})
+        return entries
+
+    entries = await _run(lookup)
+    return web.json_response({'count': len(entries), 'entries': entries})
+
+
+@routes.post(f"{ROUTE_PREFIX}/purge")
+async def cache_purge(request: web.Request) -> web.Response:
+    try:
+        body = await request.json()
+        if not isinstance(body, dict):
+            raise ValueError("expected a JSON object")
+        filters = _filters_from(body)
+    except (json.JSONDecodeError, ValueError) as e:
+        return web.json_response({'error': f"Invalid request: {e}"}, status=400)
+
+    cache = get_cache()
+    if body.get('all'):
+        deleted = await _run(cache.clear)
+    elif any(value is not None for value in filters.values()):
+        deleted = await _run(cache.purge, **filters)
+    else:
+        return web.json_response({'error': "Specify filters, or {\"all\": true} to clear the cache"}, status=400)
+
+    print(f"[CACHE] Purged {deleted} entries via HTTP")
+    return web.json_response({'deleted': deleted, 'stats': await _run(cache.get_cache_info)})
+
+
+@routes.get(f"{ROUTE_PREFIX}/export")
+async def cache_export(request: web.Request) -> web.StreamResponse:
+    try:
+        filters = _filters_from(request.query)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+
+    cache = get_cache()
+    rows = await _run(cache.list_entries, **filters)
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'application/x-ndjson',
+        'Content-Disposition': f'attachment; filename="gemini_cache_{time.strftime("%Y%m%d_%H%M%S")}.jsonl"',
+    })
+    await response.prepare(request)
+
+    batch_size = 200
+    for start in range(0, len(rows), batch_size):
+        keys = [row['cache_key'] for row in rows[start:start + batch_size]]
+        entries = await _run(lambda: [cache.get_entry(key) for key in keys])
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries if entry is not None)
+        await response.write(lines.encode('utf-8'))
+
+    await response.write_eof()
+    return response
+
+
+@routes.get(USAGE_ROUTE)
+async def usage_summary(request: web.Request) -> web.Response:
+    try:
+        days = min(max(int(request.query.get('days', 7)), 1), 366)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    return web.json_response(await _run(get_usage_ledger().summary, days))
+
+
+@routes.get(SCHEDULER_ROUTE)
+async def scheduler_stats(request: web.Request) -> web.Response:
+    return web.json_response(get_scheduler().stats())
+
+
+def _upload_error(e: UploadError) -> web.Response:
+    body: Dict[str, Any] = {'error': str(e)}
+    if e.received is not None:
+        body['received'] = e.received
+    return web.json_response(body, status=e.status)
+
+
+async def _upload_body(request: web.Request) -> Dict[str, Any]:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError as e:
+        raise UploadError(f"Invalid request: {e}")
+    if not isinstance(body, dict):
+        raise UploadError("Invalid request: expected a JSON object")
+    return body
+
+
+@routes.post(f"{UPLOAD_PREFIX}/init")
+async def upload_init(request: web.Request) -> web.Response:
+    try:
+        body = await _upload_body(request)
+        result = await _run(get_uploads().begin, body.get('media_type'), body.get('sha256'), body.get('size'),
+                            str(body.get('name') or ""))
+    except UploadError as e:
+        return _upload_error(e)
+    return web.json_response(result)
+
+
+@routes.put(f"{UPLOAD_PREFIX}/chunk")
+async def upload_chunk(request: web.Request) -> web.Response:
+    query = request.query
+    data = await request.read()
+    try:
+        received = await _run(get_uploads().write_chunk, query.get('media_type'), query.get('sha256'),
+                              query.get('size'), query.get('offset'), data)
+    except UploadError as e:
+        return _upload_error(e)
+    return web.json_response({'received': received})
+
+
+@routes.post(f"{UPLOAD_PREFIX}/complete")
+async def upload_complete(request: web.Request) -> web.Response:
+    try:
+        body = await _upload_body(request)
+        result = await _run(get_uploads().complete, body.get('media_type'), body.get('sha256'),
+                            body.get('size'), str(body.get('name') or ""))
+    except UploadError as e:
+        return _upload_error(e)
+    return web.json_response(result)
+
+
+def _resolve_comfy_file(filename: str, subfolder: str, directory_type: str) -> str:
+    """Path of a file in ComfyUI's input/output/temp directory; ValueError if it escapes it."""
+    try:
+        import folder_paths
+        base_dir = folder_paths.get_directory_by_type(directory_type)
+    except ImportError:
+        base_dir = input_directory() if directory_type == "input" else None
+    if base_dir is None:
+        raise ValueError(f"Unknown directory type: {directory_type}")
+    base_dir = os.path.abspath(base_dir)
+    path = os.path.abspath(os.path.join(base_dir, subfolder, filename))
+    if os.path.commonpath([base_dir, path]) != base_dir:
+        raise ValueError("Path outside the ComfyUI directory")
+    return path
+
+
+@routes.get(THUMBNAIL_ROUTE)
+async def thumbnail(request: web.Request) -> web.StreamResponse:
+    query = request.query
+    kind = query.get('kind', 'poster')
+    size = query.get('size', '')
+    thumbnails = get_thumbnails()
+    try:
+        if query.get('fingerprint'):
+            path = await _run(thumbnails.get_by_fingerprint, query['fingerprint'], kind, size)
+            if path is None:
+                return web.json_response({'error': "Unknown fingerprint"}, status=404)
+            # Thumbnails of a fingerprint never change
+            cache_control = "public, max-age=604800, immutable"
+        else:
+            source = _resolve_comfy_file(query.get('filename', ''), query.get('subfolder', ''),
+                                         query.get('type', 'input'))
+            media_type = media_type_of(source)
+            if media_type is None:
+                return web.json_response({'error': "Not an image or video"}, status=415)
+            if not os.path.isfile(source):
+                return web.json_response({'error': "File not found"}, status=404)
+            path = await _run(thumbnails.get, source, media_type, kind, size)
+            cache_control = "no-cache"
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    except RuntimeError as e:
+        return web.json_response({'error': str(e)}, status=422)
+    content_type = "image/webp" if path.endswith(".webp") else "image/jpeg"
+    return web.FileResponse(path, headers={'Cache-Control': cache_control, 'Content-Type': content_type})
+
+
+def _browse(query: Mapping[str, Any]) -> Dict[str, Any]:
+    root = check_browsable(query.get('path', ''))
+    if query.get('ext'):
+        extensions = [f".{ext.strip().lstrip('.').lower()}" for ext in query['ext'].split(",") if ext.strip()]
+    elif query.get('media_type'):
+        if query['media_type'] not in ("image", "video"):
+            raise ValueError("media_type must be image or video")
+        extensions = sorted({ext[1:].lower() for ext in media_extensions(query['media_type'])})
+    else:
+        extensions = None
+
+    def _float(name):
+        return float(query[name]) if query.get(name) not in (None, "") else None
+
+    index = get_directory_index()
+    refreshed = index.refresh(root, force=query.get('refresh') in ("1", "true"))
+    result = index.list(root, subdir=query.get('subdir', ''), recursive=query.get('recursive', '1') not in ("0", "false"),
+                        extensions=extensions, mtime_after=_float('mtime_after'), mtime_before=_float('mtime_before'),
+                        name=query.get('name', ''), offset=int(query.get('offset', 0) or 0),
+                        limit=int(query.get('limit', 100) or 100), after=query.get('after', ''))
+    result['refreshed'] = refreshed
+    return result
+
+
+@routes.get(BROWSE_ROUTE)
+async def browse(request: web.Request) -> web.Response:
+    try:
+        result = await _run(_browse, request.query)
+    except PermissionError as e:
+        return web.json_response({'error': str(e)}, status=403)
+    except FileNotFoundError as e:
+        return web.json_response({'error': str(e)}, status=404)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    return web.json_response(result)
@@ -0,0 +1,334 @@
+"""
+Priority scheduler for the Gemini requests of this process.
+
+Without it, an operator's describe waits behind every request a bulk caption run has queued
+on the same host and key. Every Gemini request now takes a slot first. There are two priority
+classes:
+
+- interactive: Media Describe executions (the default)
+- batch: the offline warm-up and queue workers, and workflows whose Options node sets
+  request_priority to Batch
+
+Slots and queues:
+- SK_GEMINI_REQUEST_SLOTS (default 4 per API key) slots are shared by both classes.
+- SK_GEMINI_INTERACTIVE_SLOTS (default 1) extra slots are reserved for interactive requests,
+  so an interactive request never waits for a long batch request to finish.
+- When every slot is taken, waiting interactive requests start before any waiting batch request.
+- Within a class, the tenant with the fewest running requests goes next, so one workflow or
+  user cannot starve the others. The tenant is the Options node's scheduler_tenant, or the
+  warm-up's --tenant.
+- At most SK_GEMINI_QUEUE_DEPTH requests (default 256) wait per class. Beyond that, requests
+  fail at once with SchedulerBusyError. It has code 429, so callers back off as they would
+  after an HTTP 429.
+
+Batch runs usually live in their own process, so interactive requests also take precedence
+across processes. While a process has interactive requests running or waiting, it touches a
+heartbeat file in cache/scheduler/. Other processes do not start waiting batch requests while
+such a file is fresh. Batch requests that were already sent are never cancelled.
+"""
+
+import os
+import time
+import socket
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+PRIORITY_CLASSES = ("interactive", "batch")
+REQUEST_PRIORITIES = ("Interactive", "Batch")
+DEFAULT_TENANT = "default"
+DEFAULT_SLOTS_PER_KEY = 4
+DEFAULT_INTERACTIVE_SLOTS = 1
+DEFAULT_QUEUE_DEPTH = 256
+WAIT_SLICE = 0.1
+HEARTBEAT_INTERVAL = 1.0
+HEARTBEAT_TTL = 3.0  # A heartbeat older than this belongs to a finished or crashed process
+HEARTBEAT_CHECK_INTERVAL = 0.5
+
+Schedule = Tuple[str, str]  # (priority class, tenant)
+
+
+class SchedulerBusyError(RuntimeError):
+    """Too many requests of this priority class are already waiting (transient, like an HTTP 429)."""
+
+    code = 429
+
+
+def request_schedule(gemini_options: Optional[Dict[str, Any]]) -> Schedule:
+    """(priority class, tenant) of requests made with the Options node's settings."""
+    options = gemini_options or {}
+    priority = str(options.get("request_priority") or "Interactive").lower()
+    if priority not in PRIORITY_CLASSES:
+        priority = "interactive"
+    return priority, str(options.get("scheduler_tenant") or "").strip() or DEFAULT_TENANT
+
+
+def _default_heartbeat_dir() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "cache", "scheduler")
+
+
+class _Waiter:
+    """A request waiting for a slot."""
+
+    __slots__ = ('priority', 'tenant', 'event', 'granted')
+
+    def __init__(self, priority: str, tenant: str):
+        self.priority = priority
+        self.tenant = tenant
+        self.event = threading.Event()
+        self.granted = False
+
+
+class RequestScheduler:
+    """Slots for Gemini requests with priority classes, per-tenant fairness and bounded queues."""
+
+    def __init__(self, shared_slots: int, interactive_slots: int = DEFAULT_INTERACTIVE_SLOTS,
+                 queue_depth: int = DEFAULT_QUEUE_DEPTH, heartbeat_dir: Optional[str] = None):
+        self.shared_slots = max(shared_slots, 1)
+        self.interactive_slots = max(interactive_slots, 0)
+        self.queue_depth = max(queue_depth, 0)
+        self.heartbeat_dir = heartbeat_dir or _default_heartbeat_dir()
+        self._heartbeat_name = f"interactive-{socket.gethostname()}-{os.getpid()}"
+        self._lock = threading.Lock()
+        # Per class: tenant -> waiters in arrival order; tenants in round-robin order
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {p: OrderedDict() for p in PRIORITY_CLASSES}
+        self._queued = {p: 0 for p in PRIORITY_CLASSES}
+        self._running = {p: 0 for p in PRIORITY_CLASSES}
+        self._running_by_tenant: Dict[Schedule, int] = {}
+        self._started = {p: 0 for p in PRIORITY_CLASSES}
+        self._rejected = {p: 0 for p in PRIORITY_CLASSES}
+        self._waited = {p: 0.0 for p in PRIORITY_CLASSES}
+        self._heartbeat: Optional[threading.Thread] = None
+        self._elsewhere = (0.0, False)  # (checked at, interactive requests active in another process)
+
+    def _can_start(self, priority: str) -> bool:
+        running = sum(self._running.values())
+        if priority == "interactive":
+            return running < self.shared_slots + self.interactive_slots
+        return running < self.shared_slots
+
+    def _interactive_elsewhere(self) -> bool:
+        """Whether another process has interactive requests running or waiting (cached briefly)."""
+        now = time.time()
+        checked, active = self._elsewhere
+        if now - checked < HEARTBEAT_CHECK_INTERVAL:
+            return active
+        active = False
+        try:
+            with os.scandir(self.heartbeat_dir) as scan:
+                for entry in scan:
+                    if entry.name.startswith("interactive-") and entry.name != self._heartbeat_name:
+                        try:
+                            if now - entry.stat().st_mtime < HEARTBEAT_TTL:
+                                active = True
+                                break
+                        except OSError:
+                            continue
+        except OSError:
+            pass
+        self._elsewhere = (now, active)
+        return active
+
+    def _start(self, priority: str, tenant: str) -> None:
+        self._running[priority] += 1
+        self._running_by_tenant[(priority, tenant)] = self._running_by_tenant.get((priority, tenant), 0) + 1
+        self._started[priority] += 1
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting requests: interactive first, then the least-served tenant."""
+        for priority in PRIORITY_CLASSES:
+            queues = self._queues[priority]
+            while queues and self._can_start(priority):
+                if priority == "batch" and self._interactive_elsewhere():
+                    return
+                # Fewest running requests first; ties go to the tenant that has waited longest for a turn
+                tenant = min(queues, key=lambda t: self._running_by_tenant.get((priority, t), 0))
+                waiters = queues[tenant]
+                waiter = waiters.popleft()
+                if waiters:
+                    queues.move_to_end(tenant)
+                else:
+                    del queues[tenant]
+                self._queued[priority] -= 1
+                self._start(priority, tenant)
+                waiter.granted = True
+                waiter.event.set()
+            if self._queued[priority]:
+                # Lower classes wait while this one still has requests queued
+                return
+
+    def _remove(self, waiter: _Waiter) -> None:
+        waiters = self._queues[waiter.priority].get(waiter.tenant)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued[waiter.priority] -= 1
+            if not waiters:
+                del self._queues[waiter.priority][waiter.tenant]
+
+    def acquire(self, priority: str = "interactive", tenant: str = DEFAULT_TENANT, timeout: Optional[float] = None,
+                cancel: Optional[threading.Event] = None) -> float:
+        """
+        Wait for a slot. Returns the seconds waited.
+
+        Raises SchedulerBusyError when the class's queue is full, DeadlineExceededError after
+        timeout seconds (None = no limit), CallCancelledError once cancel is set, and ComfyUI's
+        interrupt exception when the operator cancels the prompt.
+        """
+        from .cancellation import CallCancelledError, DeadlineExceededError, throw_if_interrupted
+
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITY_CLASSES)}")
+        started = time.monotonic()
+        waiter = _Waiter(priority, tenant)
+        with self._lock:
+            if priority == "interactive":
+                self._touch_heartbeat()
+            if not self._queued[priority] and self._can_start(priority) and (
+                    priority == "interactive" or not (self._queued["interactive"] or self._interactive_elsewhere())):
+                self._start(priority, tenant)
+                return 0.0
+            if self._queued[priority] >= self.queue_depth:
+                self._rejected[priority] += 1
+                raise SchedulerBusyError(
+                    f"{self._queued[priority]} {priority} Gemini requests are already waiting; try again later"
+                )
+            self._queues[priority].setdefault(tenant, deque()).append(waiter)
+            self._queued[priority] += 1
+            self._dispatch()
+
+        try:
+            while not waiter.event.wait(WAIT_SLICE):
+                throw_if_interrupted()
+                if cancel is not None and cancel.is_set():
+                    raise CallCancelledError()
+                if timeout and time.monotonic() - started >= timeout:
+                    raise DeadlineExceededError(timeout)
+                if priority == "batch":
+                    # Interactive work in another process may have finished
+                    with self._lock:
+                        self._dispatch()
+        except BaseException:
+            with self._lock:
+                if waiter.granted:
+                    self._finish(priority, tenant)
+                else:
+                    self._remove(waiter)
+                    self._interactive_done()
+                    self._dispatch()
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._waited[priority] += waited
+        return waited
+
+    def _finish(self, priority: str, tenant: str) -> None:
+        self._running[priority] -= 1
+        key = (priority, tenant)
+        self._running_by_tenant[key] -= 1
+        if not self._running_by_tenant[key]:
+            del self._running_by_tenant[key]
+        self._interactive_done()
+        self._dispatch()
+
+    def release(self, priority: str = "interactive", tenant: str = DEFAULT_TENANT) -> None:
+        with self._lock:
+            self._finish(priority, tenant)
+
+    @contextmanager
+    def slot(self, schedule: Optional[Schedule] = None, timeout: Optional[float] = None,
+             cancel: Optional[threading.Event] = None) -> Iterator[float]:
+        """Hold a slot for one request; yields the seconds waited for it."""
+        priority, tenant = schedule or ("interactive", DEFAULT_TENANT)
+        waited = self.acquire(priority, tenant, timeout, cancel)
+        try:
+            yield waited
+        finally:
+            self.release(priority, tenant)
+
+    def _touch_heartbeat(self) -> None:
+        """Start the heartbeat thread if needed (called with the lock held)."""
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._run_heartbeat, name="sk-gemini-scheduler-heartbeat",
+                                               daemon=True)
+            self._heartbeat.start()
+
+    def _interactive_done(self) -> None:
+        """Remove the heartbeat once no interactive request is running or waiting, so batch
+        processes resume at once instead of when it goes stale."""
+        if not self._running["interactive"] and not self._queued["interactive"]:
+            self._remove_heartbeat()
+
+    def _remove_heartbeat(self) -> None:
+        try:
+            os.remove(os.path.join(self.heartbeat_dir, self._heartbeat_name))
+        except OSError:
+            pass
+
+    def _run_heartbeat(self) -> None:
+        path = os.path.join(self.heartbeat_dir, self._heartbeat_name)
+        while True:
+            with self._lock:
+                if not self._running["interactive"] and not self._queued["interactive"]:
+                    self._heartbeat = None
+                    self._interactive_done()
+                    return
+                try:
+                    os.makedirs(self.heartbeat_dir, exist_ok=True)
+                    with open(path, 'a'):
+                        os.utime(path)
+                except OSError:
+                    pass
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def stats(self) -> Dict[str, Any]:
+        """Slots, queue lengths and counters since this process started."""
+        with self._lock:
+            classes = {}
+            for priority in PRIORITY_CLASSES:
+                served = self._started[priority]
+                classes[priority] = {
+                    'running': self._running[priority],
+                    'queued': self._queued[priority],
+                    'tenants_queued': len(self._queues[priority]),
+                    'started': served,
+                    'rejected': self._rejected[priority],
+                    'avg_wait_ms': round(self._waited[priority] / served * 1000, 1) if served else 0.0,
+                }
+            return {
+                'shared_slots': self.shared_slots,
+                'interactive_slots': self.interactive_slots,
+                'queue_depth': self.queue_depth,
+                'interactive_elsewhere': self._elsewhere[1],
+                'classes': classes,
+            }
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(int(os.environ.get(name, default)), 0)
+    except ValueError:
+        return default
+
+
+# Global scheduler instance
+_global_scheduler: Optional[RequestScheduler] = None
+_global_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Get the global request scheduler instance."""
+    global _global_scheduler
+    with _global_scheduler_lock:
+        if _global_scheduler is None:
+            from .key_pool import get_key_pool
+
+            key_pool = get_key_pool()
+            _global_scheduler = RequestScheduler(
+                _env_int("SK_GEMINI_REQUEST_SLOTS", DEFAULT_SLOTS_PER_KEY * (len(key_pool) if key_pool else 1)),
+                _env_int("SK_GEMINI_INTERACTIVE_SLOTS", DEFAULT_INTERACTIVE_SLOTS),
+                _env_int("SK_GEMINI_QUEUE_DEPTH", DEFAULT_QUEUE_DEPTH),
+            )
+        return _global_scheduler
@@ -0,0 +1,122 @@
+"""
+Planning and merging for segmented video description.
+
+Instead of trimming a long clip to its first max_duration seconds, Segmented mode splits the
+whole video into chunks of about segment_duration seconds, describes the chunks concurrently
+and merges the results. Chunks are cut either at fixed intervals or at the scene change
+nearest to each fixed boundary, so a shot is rarely split in two.
+
+Each chunk is cached under its own identifier ("{video identifier}#segment:{start}-{end}"), so
+re-running with the other merge mode, or after one chunk failed, only calls Gemini for the
+chunks that are missing.
+
+SK_GEMINI_SEGMENT_CONCURRENCY: chunks described at the same time (default 4).
+SK_GEMINI_SUMMARY_MODEL: model for the optional merge call (default models/gemini-2.5-flash-lite).
+"""
+
+import os
+from typing import List, Tuple, Optional, Sequence
+
+SEGMENT_SPLIT_MODES = ("Fixed", "Scene")
+SEGMENT_MERGE_MODES = ("Concatenate", "Summarize")
+
+DEFAULT_SUMMARY_MODEL = "models/gemini-2.5-flash-lite"
+SCENE_THRESHOLD = 0.3
+
+# The last chunk may be up to this much longer than segment_duration instead of leaving a short tail
+_TAIL_FACTOR = 1.25
+# Scene-aligned cuts are only taken within this fraction of segment_duration from the fixed boundary
+_SCENE_WINDOW = 0.5
+
+
+def plan_segments(duration: float, segment_duration: float,
+                  scene_changes: Optional[Sequence[float]] = None) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration) into consecutive (start, end) chunks of about segment_duration seconds.
+
+    Args:
+        duration: Video duration in seconds
+        segment_duration: Target chunk length in seconds
+        scene_changes: Scene change timestamps; when given, each cut moves to the nearest scene
+            change within half a segment of the fixed boundary
+
+    Returns:
+        List of (start, end) in seconds, rounded to milliseconds so identifiers are stable
+    """
+    if duration <= 0 or segment_duration <= 0:
+        return [(0.0, round(max(duration, 0.0), 3))]
+
+    cuts = sorted(t for t in (scene_changes or []) if 0 < t < duration)
+    segments: List[Tuple[float, float]] = []
+    start = 0.0
+    while duration - start > segment_duration * _TAIL_FACTOR:
+        target = start + segment_duration
+        # Scene cuts never leave a final chunk shorter than half a segment
+        window = [t for t in cuts if abs(t - target) <= segment_duration * _SCENE_WINDOW
+                  and t <= duration - segment_duration * _SCENE_WINDOW]
+        end = round(min(window, key=lambda t: abs(t - target)) if window else target, 3)
+        segments.append((start, end))
+        start = end
+    segments.append((start, round(duration, 3)))
+    return segments
+
+
+def segment_identifier(media_identifier: str, start: float, end: float) -> str:
+    """Cache identifier of one chunk of a video."""
+    return f"{media_identifier}#segment:{start:.3f}-{end:.3f}"
+
+
+def summary_identifier(media_identifier: str, gemini_model: str, segments: Sequence[Tuple[float, float]]) -> str:
+    """Cache identifier of the merged summary of a segmented description."""
+    bounds = ",".join(f"{end:.3f}" for _, end in segments)
+    return f"{media_identifier}#summary:{gemini_model}:{bounds}"
+
+
+def segment_concurrency() -> int:
+    """Chunks described at the same time (SK_GEMINI_SEGMENT_CONCURRENCY, default 4)."""
+    try:
+        return max(int(os.environ.get("SK_GEMINI_SEGMENT_CONCURRENCY", "4")), 1)
+    except ValueError:
+        return 4
+
+
+def summary_model() -> str:
+    """Model used to merge chunk descriptions (SK_GEMINI_SUMMARY_MODEL)."""
+    return os.environ.get("SK_GEMINI_SUMMARY_MODEL", "").strip() or DEFAULT_SUMMARY_MODEL
+
+
+def format_time(seconds: float) -> str:
+    """Format seconds as m:ss.s for chunk headers."""
+    minutes, secs = divmod(max(seconds, 0.0), 60)
+    return f"{int(minutes)}:{secs:04.1f}"
+
+
+def concatenate_descriptions(segments: Sequence[Tuple[float, float]], descriptions: Sequence[Optional[str]],
+                             failures: Optional[Sequence[Optional[str]]] = None) -> str:
+    """
+    Join chunk descriptions in order, each under a [start – end] header.
+
+    Chunks without a description are kept as a header with the failure reason, so gaps in
+    coverage stay visible.
+    """
+    failures = failures or [None] * len(segments)
+    parts = []
+    for (start, end), description, failure in zip(segments, descriptions, failures):
+        header = f"[{format_time(start)} – {format_time(end)}]"
+        body = description if description is not None else f"(no description: {failure or 'unknown error'})"
+        parts.append(f"{header}\n{body}")
+    return "\n\n".join(parts)
+
+
+def build_summary_prompt(video_system_prompt: str, segments: Sequence[Tuple[float, float]],
+                         descriptions: Sequence[Optional[str]]) -> str:
+    """
+    Text-only prompt that merges chunk descriptions into one description of the whole video,
+    following the same paragraph structure as a direct video description.
+    """
+    return f"""{video_system_prompt}
+
+You are not given the video itself. Instead, below are descriptions of its {len(segments)} consecutive segments, in order, each under its time range.
+Merge them into ONE description of the whole video that follows the structure above. Describe the subject and setting once, keep changes over time in chronological order, resolve contradictions in favour of the majority of segments, and never mention segments, time ranges or the merging itself.
+
+{concatenate_descriptions(segments, descriptions)}"""
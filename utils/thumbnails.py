@@ -0,0 +1,267 @@
+"""
+Thumbnail and preview cache for the Media Describe widgets.
+
+The widgets show a small poster frame instead of loading the full image or video into the
+browser. Two kinds are generated on the server:
+
+- poster: a JPEG no larger than size x size px (the image itself, or a frame 10% into a video)
+- preview: for videos, a small animated WebP of PREVIEW_FRAMES frames spread over the clip
+
+Thumbnails are keyed by the content fingerprint (utils.fingerprint, frames=0), so renamed and
+re-uploaded copies share them, and are stored in cache/thumbnails/<fingerprint>-<kind>-<size>.
+The directory is bounded: when it grows past SK_GEMINI_THUMBNAIL_CACHE_MB (default 256), the
+least recently used thumbnails are removed. Serving a thumbnail refreshes its mtime.
+
+Files picked by "Randomize Media from Path" are outside ComfyUI's directories, so the route
+cannot serve them by name. The node registers them and pre-generates their thumbnails while
+Gemini runs; the widget then asks for them by fingerprint.
+
+SK_GEMINI_THUMBNAIL_DIR: thumbnail directory (default <sk_custom_nodes>/cache/thumbnails)
+"""
+
+import io
+import os
+import re
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from .file_lock import atomic_write_bytes
+from .fingerprint import get_metadata_store, get_video_probe
+from .media import IMAGE_EXTENSIONS, VIDEO_EXTENSIONS, read_video_frames
+
+THUMBNAIL_KINDS = ("poster", "preview")
+DEFAULT_THUMBNAIL_SIZE = 256
+MIN_THUMBNAIL_SIZE = 64
+MAX_THUMBNAIL_SIZE = 1024
+DEFAULT_CACHE_MB = 256
+POSTER_POSITION = 0.1  # Fraction of the clip; the first frame is often black
+PREVIEW_FRAMES = 12
+PREVIEW_FRAME_MS = 250
+MAX_REGISTERED_SOURCES = 10000
+
+_FINGERPRINT_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def media_type_of(file_path: str) -> Optional[str]:
+    """Media type ("image" or "video") from the file extension, or None for other files."""
+    extension = f"*{os.path.splitext(file_path)[1].lower()}"
+    if extension in IMAGE_EXTENSIONS:
+        return "image"
+    if extension in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+def clamp_size(size: Any) -> int:
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return DEFAULT_THUMBNAIL_SIZE
+    return min(max(size, MIN_THUMBNAIL_SIZE), MAX_THUMBNAIL_SIZE)
+
+
+def _video_timestamps(file_path: str, count: int, position: Optional[float] = None) -> list:
+    duration = get_video_probe(file_path).get('duration') or 0.0
+    if position is not None:
+        return [duration * position]
+    return [duration * (i + 0.5) / count for i in range(count)]
+
+
+def render_poster(file_path: str, media_type: str, size: int) -> bytes:
+    """JPEG poster no larger than size x size px."""
+    from PIL import Image, ImageOps
+
+    if media_type == "image":
+        with Image.open(file_path) as source:
+            # JPEGs are decoded at a reduced scale, which is much faster for large photos
+            source.draft('RGB', (size, size))
+            image = ImageOps.exif_transpose(source).convert('RGB')
+    else:
+        frames = read_video_frames(file_path, _video_timestamps(file_path, 1, POSTER_POSITION))
+        if not frames:
+            raise RuntimeError(f"Could not decode a frame of {os.path.basename(file_path)}")
+        image = Image.fromarray(frames[0])
+
+    image.thumbnail((size, size))
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=80)
+    return output.getvalue()
+
+
+def render_preview(file_path: str, size: int) -> bytes:
+    """Animated WebP of PREVIEW_FRAMES frames evenly spread over a video."""
+    from PIL import Image
+
+    frames = read_video_frames(file_path, _video_timestamps(file_path, PREVIEW_FRAMES))
+    if not frames:
+        raise RuntimeError(f"Could not decode frames of {os.path.basename(file_path)}")
+    images = []
+    for frame in frames:
+        image = Image.fromarray(frame)
+        image.thumbnail((size, size))
+        images.append(image)
+
+    output = io.BytesIO()
+    images[0].save(output, format='WEBP', save_all=True, append_images=images[1:], duration=PREVIEW_FRAME_MS,
+                   loop=0, quality=70)
+    return output.getvalue()
+
+
+def _default_thumbnail_dir() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "cache", "thumbnails")
+
+
+def _max_cache_bytes() -> int:
+    try:
+        return max(int(float(os.environ.get("SK_GEMINI_THUMBNAIL_CACHE_MB", DEFAULT_CACHE_MB)) * 1024 * 1024), 0)
+    except ValueError:
+        return DEFAULT_CACHE_MB * 1024 * 1024
+
+
+class ThumbnailCache:
+    """Posters and animated previews on disk, keyed by content fingerprint, with LRU eviction."""
+
+    def __init__(self, thumbnail_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.thumbnail_dir = thumbnail_dir or os.environ.get("SK_GEMINI_THUMBNAIL_DIR") or _default_thumbnail_dir()
+        self.max_bytes = _max_cache_bytes() if max_bytes is None else max_bytes
+        self._total_bytes: Optional[int] = None
+        self._sources: Dict[str, Tuple[str, str]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, fingerprint: str, kind: str, size: int) -> str:
+        extension = "webp" if kind == "preview" else "jpg"
+        return os.path.join(self.thumbnail_dir, f"{fingerprint}-{kind}-{size}.{extension}")
+
+    def register(self, file_path: str, media_type: str) -> str:
+        """Allow thumbnails of file_path to be requested by fingerprint. Returns the fingerprint."""
+        fingerprint = get_metadata_store().fingerprint(file_path)
+        with self._lock:
+            if len(self._sources) >= MAX_REGISTERED_SOURCES:
+                self._sources.clear()
+            self._sources[fingerprint] = (os.path.abspath(file_path), media_type)
+        return fingerprint
+
+    def get(self, file_path: str, media_type: str, kind: str = "poster", size: int = DEFAULT_THUMBNAIL_SIZE) -> str:
+        """
+        Path of the thumbnail of file_path, generating it on first use.
+
+        Images have no animated preview; their poster is returned for both kinds.
+        """
+        if kind not in THUMBNAIL_KINDS:
+            raise ValueError(f"kind must be one of {', '.join(THUMBNAIL_KINDS)}")
+        if media_type == "image":
+            kind = "poster"
+        size = clamp_size(size)
+        fingerprint = get_metadata_store().fingerprint(file_path)
+        path = self._path(fingerprint, kind, size)
+
+        with self._lock:
+            key_lock = self._locks.setdefault(path, threading.Lock())
+        try:
+            # Concurrent requests for the same thumbnail generate it once
+            with key_lock:
+                if os.path.exists(path):
+                    try:
+                        os.utime(path)
+                    except OSError:
+                        pass
+                    return path
+                data = render_preview(file_path, size) if kind == "preview" else render_poster(file_path, media_type, size)
+                os.makedirs(self.thumbnail_dir, exist_ok=True)
+                atomic_write_bytes(path, data, durable=False)
+        finally:
+            with self._lock:
+                self._locks.pop(path, None)
+        self._account(len(data))
+        return path
+
+    def get_by_fingerprint(self, fingerprint: str, kind: str = "poster",
+                           size: int = DEFAULT_THUMBNAIL_SIZE) -> Optional[str]:
+        """Thumbnail of a registered file, or one generated earlier; None if neither exists."""
+        if not _FINGERPRINT_RE.match(fingerprint):
+            raise ValueError("fingerprint must be 32 lowercase hex characters")
+        with self._lock:
+            source = self._sources.get(fingerprint)
+        if source is not None and os.path.exists(source[0]):
+            return self.get(source[0], source[1], kind, size)
+        for candidate_kind in (kind, "poster"):
+            path = self._path(fingerprint, candidate_kind, clamp_size(size))
+            if os.path.exists(path):
+                return path
+        return None
+
+    def pregenerate(self, file_path: str, media_type: str) -> None:
+        """Generate the default-size poster (and preview for videos) ahead of the widget's request."""
+        try:
+            self.get(file_path, media_type, "poster")
+            if media_type == "video":
+                self.get(file_path, media_type, "preview")
+        except Exception as e:
+            print(f"[THUMBNAILS] Could not pre-generate thumbnails for {file_path}: {e}")
+
+    def _account(self, added: int) -> None:
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += added
+            if self._total_bytes <= self.max_bytes:
+                return
+            # Evict down to 90% so eviction does not run on every new thumbnail
+            target = self.max_bytes * 0.9
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._total_bytes = total
+
+    def _entries(self) -> list:
+        """(path, size, mtime) of every thumbnail on disk."""
+        entries = []
+        try:
+            with os.scandir(self.thumbnail_dir) as scan:
+                for entry in scan:
+                    if entry.name.endswith((".jpg", ".webp")):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((entry.path, stat.st_size, stat.st_mtime))
+        except OSError:
+            pass
+        return entries
+
+
+# Global thumbnail cache instance
+_global_thumbnails: Optional[ThumbnailCache] = None
+
+
+def get_thumbnails() -> ThumbnailCache:
+    """Get the global thumbnail cache instance."""
+    global _global_thumbnails
+    if _global_thumbnails is None:
+        _global_thumbnails = ThumbnailCache()
+    return _global_thumbnails
+
+
+def request_thumbnail(file_path: str, media_type: str) -> Dict[str, Any]:
+    """
+    Register file_path and start generating its thumbnails in the IO pool.
+
+    Returns:
+        What the widget needs to request them: {'fingerprint', 'media_type', 'filename'}
+    """
+    from .workers import submit_io
+
+    thumbnails = get_thumbnails()
+    fingerprint = thumbnails.register(file_path, media_type)
+    submit_io(thumbnails.pregenerate, file_path, media_type)
+    return {'fingerprint': fingerprint, 'media_type': media_type, 'filename': os.path.basename(file_path)}
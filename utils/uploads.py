@@ -0,0 +1,212 @@
+"""
+Content-addressed, resumable uploads for the Media Describe upload widgets.
+
+ComfyUI's /upload/image takes a whole file in one request, so a large video upload that drops
+halfway restarts from zero, and uploading the same clip again creates a new file with a new
+cache identity. Uploads through these routes are instead identified by the SHA-256 of the whole
+file, which the browser computes before sending anything:
+
+1. init: if <input>/<subfolder>/<sha256><ext> already exists, nothing is transferred
+2. chunk: the file is appended in CHUNK_SIZE pieces to <subfolder>/.partial/<sha256>-<size>.part
+3. complete: the server hashes the assembled file and moves it into place
+
+A full hash rather than the sampled video fingerprint (utils.fingerprint), so that two files
+differing outside the sampled ranges never share an upload, and a chunk corrupted anywhere
+is caught at completion.
+
+The partial file is named after the content, so an interrupted upload resumes from the bytes
+already received, even after a page reload or a ComfyUI restart. Chunks must arrive at the
+current end of the partial file; a chunk at any other offset is rejected with the received
+byte count so the client can continue from there. Partial files untouched for
+PARTIAL_MAX_AGE seconds are removed, together with their lock files.
+"""
+
+import os
+import re
+import time
+import hashlib
+from typing import Any, Dict, Optional
+
+from .file_lock import file_lock
+from .media import media_extensions
+
+UPLOAD_SUBFOLDERS = {"image": "gemini_images", "video": "gemini_videos"}
+CHUNK_SIZE = 8 * 1024 * 1024
+PARTIAL_DIRNAME = ".partial"
+PARTIAL_MAX_AGE = 24 * 3600
+HASH_BLOCK_SIZE = 1024 * 1024
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadError(ValueError):
+    """Rejected upload request; status is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400, received: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.received = received
+
+
+def file_sha256(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def input_directory() -> str:
+    """ComfyUI's input directory (or <sk_custom_nodes>/input outside ComfyUI)."""
+    try:
+        import folder_paths
+        return folder_paths.get_input_directory()
+    except ImportError:
+        return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "input")
+
+
+class ChunkedUploads:
+    """Resumable uploads into the input directory, named by content SHA-256."""
+
+    def __init__(self, input_dir: Optional[str] = None):
+        self.input_dir = input_dir or input_directory()
+
+    def _validate(self, media_type: str, sha256: str, size: Any, name: str = "") -> int:
+        if media_type not in UPLOAD_SUBFOLDERS:
+            raise UploadError(f"media_type must be one of {', '.join(UPLOAD_SUBFOLDERS)}")
+        if not isinstance(sha256, str) or not _SHA256_RE.match(sha256):
+            raise UploadError("sha256 must be 64 lowercase hex characters")
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise UploadError("size must be an integer")
+        if size <= 0:
+            raise UploadError("size must be positive")
+        if name:
+            extension = os.path.splitext(name)[1].lower()
+            if f"*{extension}" not in media_extensions(media_type):
+                raise UploadError(f"Unsupported {media_type} extension: {extension or '(none)'}")
+        return size
+
+    def _directory(self, media_type: str) -> str:
+        return os.path.join(self.input_dir, UPLOAD_SUBFOLDERS[media_type])
+
+    def _partial_path(self, media_type: str, sha256: str, size: int) -> str:
+        return os.path.join(self._directory(media_type), PARTIAL_DIRNAME, f"{sha256}-{size}.part")
+
+    def _existing(self, media_type: str, sha256: str) -> Optional[str]:
+        """File name of an earlier upload with this content, whatever its extension."""
+        directory = self._directory(media_type)
+        for extension in media_extensions(media_type):
+            name = sha256 + extension[1:]
+            if os.path.isfile(os.path.join(directory, name)):
+                return name
+        return None
+
+    def _result(self, media_type: str, name: str, existed: bool) -> Dict[str, Any]:
+        return {'status': 'exists' if existed else 'complete', 'name': name,
+                'subfolder': UPLOAD_SUBFOLDERS[media_type], 'type': 'input'}
+
+    def _remove_stale_partials(self, media_type: str) -> None:
+        partial_dir = os.path.join(self._directory(media_type), PARTIAL_DIRNAME)
+        try:
+            entries = list(os.scandir(partial_dir))
+        except OSError:
+            return
+        now = time.time()
+        for entry in entries:
+            try:
+                if entry.name.endswith((".part", ".part.lock")) and now - entry.stat().st_mtime > PARTIAL_MAX_AGE:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def begin(self, media_type: str, sha256: str, size: Any, name: str) -> Dict[str, Any]:
+        """
+        Start or resume an upload.
+
+        Returns:
+            {'status': 'exists', 'name', 'subfolder', 'type'} when the content is already uploaded,
+            else {'status': 'partial', 'received': bytes already stored, 'chunk_size'}
+        """
+        size = self._validate(media_type, sha256, size, name)
+        existing = self._existing(media_type, sha256)
+        if existing is not None:
+            return self._result(media_type, existing, existed=True)
+
+        self._remove_stale_partials(media_type)
+        partial_path = self._partial_path(media_type, sha256, size)
+        os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+        with file_lock(partial_path + ".lock"):
+            received = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            if received > size:
+                # Left over from a broken write; start again
+                os.remove(partial_path)
+                received = 0
+        return {'status': 'partial', 'received': received, 'chunk_size': CHUNK_SIZE}
+
+    def write_chunk(self, media_type: str, sha256: str, size: Any, offset: Any, data: bytes) -> int:
+        """Append data at offset (the current end of the partial file). Returns the bytes received."""
+        size = self._validate(media_type, sha256, size)
+        try:
+            offset = int(offset)
+        except (TypeError, ValueError):
+            raise UploadError("offset must be an integer")
+        if len(data) > CHUNK_SIZE:
+            raise UploadError(f"Chunks may be at most {CHUNK_SIZE} bytes", status=413)
+
+        partial_path = self._partial_path(media_type, sha256, size)
+        os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+        with file_lock(partial_path + ".lock"):
+            received = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            if offset != received:
+                raise UploadError(f"Expected offset {received}, got {offset}", status=409, received=received)
+            if received + len(data) > size:
+                raise UploadError(f"Chunk ends past the declared size of {size} bytes", received=received)
+            with open(partial_path, 'ab') as f:
+                f.write(data)
+            return received + len(data)
+
+    def complete(self, media_type: str, sha256: str, size: Any, name: str) -> Dict[str, Any]:
+        """
+        Verify the assembled file against its SHA-256 and move it to its content-addressed name.
+
+        Returns:
+            {'status': 'complete' or 'exists', 'name', 'subfolder', 'type'}
+        """
+        if not name:
+            # The stored file takes its extension from name; without one it could never be found again
+            raise UploadError("name is required")
+        size = self._validate(media_type, sha256, size, name)
+        existing = self._existing(media_type, sha256)
+        if existing is not None:
+            return self._result(media_type, existing, existed=True)
+
+        partial_path = self._partial_path(media_type, sha256, size)
+        final_name = sha256 + os.path.splitext(name)[1].lower()
+        with file_lock(partial_path + ".lock"):
+            received = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            if received != size:
+                raise UploadError(f"Upload incomplete: {received} of {size} bytes received", status=409,
+                                  received=received)
+            actual = file_sha256(partial_path)
+            if actual != sha256:
+                os.remove(partial_path)
+                raise UploadError(f"Uploaded content does not match SHA-256 {sha256} (got {actual})",
+                                  status=422, received=0)
+            os.replace(partial_path, os.path.join(self._directory(media_type), final_name))
+
+        print(f"[UPLOAD] Stored {name} ({size / 1024 / 1024:.1f} MB) as {UPLOAD_SUBFOLDERS[media_type]}/{final_name}")
+        return self._result(media_type, final_name, existed=False)
+
+
+# Global uploads instance
+_global_uploads: Optional[ChunkedUploads] = None
+
+
+def get_uploads() -> ChunkedUploads:
+    """Get the global chunked uploads instance."""
+    global _global_uploads
+    if _global_uploads is None:
+        _global_uploads = ChunkedUploads()
+    return _global_uploads
@@ -0,0 +1,274 @@
+"""
+Token and cost accounting for Gemini calls.
+
+Every successful call stores its usage_metadata (prompt, thinking and output tokens), its
+latency and the size of the uploaded media in the cache entry. The same numbers are added to
+a small daily ledger in cache/usage/<YYYY-MM-DD>.json, aggregated:
+
+- per model (the model that actually produced the text)
+- per profile: model, media kind, describe options and media size bucket, so it is visible
+  which option combinations and media sizes drive cost and latency
+
+Cache hits are recorded too: a hit adds the tokens stored with the cached entry to
+tokens_saved, i.e. what the hit would have cost had Gemini been called again.
+
+When a hedged request (hedging.py) answers, the other request is cancelled but was still
+billed for its prompt. It counts as a request and a cancelled_request, with the prompt tokens
+of the answer that was used, so cost_usd includes the extra spend of hedging.
+
+Counts are buffered in memory and merged into the day's file every FLUSH_INTERVAL seconds and
+at exit, under a file lock with an atomic write, so several ComfyUI processes can share the
+ledger. Costs are estimates from DEFAULT_PRICES (USD per million tokens, thinking billed as
+output); SK_GEMINI_PRICES='{"models/gemini-2.5-flash": [0.30, 2.50]}' overrides them.
+
+SK_GEMINI_USAGE_DIR: ledger directory (default <sk_custom_nodes>/cache/usage)
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cache import GeminiCache
+from .file_lock import atomic_write_json, file_lock
+
+FLUSH_INTERVAL = 10.0
+
+# USD per million (input, output) tokens for prompts up to 200k tokens
+DEFAULT_PRICES = {
+    "flash-lite": (0.10, 0.40),
+    "flash": (0.30, 2.50),
+    "pro": (1.25, 10.00),
+}
+
+# Upper bounds of the media size buckets, in bytes
+SIZE_BUCKETS = (
+    (256 * 1024, "<256KB"),
+    (1024 * 1024, "256KB-1MB"),
+    (4 * 1024 * 1024, "1-4MB"),
+    (16 * 1024 * 1024, "4-16MB"),
+)
+
+_USAGE_FIELDS = {
+    'prompt_tokens': 'prompt_token_count',
+    'thinking_tokens': 'thoughts_token_count',
+    'output_tokens': 'candidates_token_count',
+    'cached_tokens': 'cached_content_token_count',
+    'total_tokens': 'total_token_count',
+}
+_COUNTERS = ('requests', 'prompt_tokens', 'thinking_tokens', 'output_tokens', 'cached_tokens', 'total_tokens',
+             'latency_seconds', 'media_bytes', 'cancelled_requests', 'cache_hits', 'tokens_saved', 'cost_usd', 'cost_saved_usd')
+
+
+def usage_from_response(response: Any) -> Optional[Dict[str, int]]:
+    """usage_metadata of a generate_content response as a plain dict (None if absent)."""
+    metadata = getattr(response, 'usage_metadata', None)
+    if metadata is None:
+        return None
+    usage = {}
+    for name in _USAGE_FIELDS.values():
+        value = getattr(metadata, name, None)
+        if isinstance(value, int):
+            usage[name] = value
+    return usage or None
+
+
+def _prices(model: str) -> Tuple[float, float]:
+    override = os.environ.get("SK_GEMINI_PRICES", "").strip()
+    if override:
+        try:
+            prices = json.loads(override)
+            if model in prices:
+                return float(prices[model][0]), float(prices[model][1])
+        except (ValueError, TypeError, IndexError, KeyError):
+            pass
+    name = model.rsplit("/", 1)[-1]
+    # Longest family name first, so "flash-lite" wins over "flash"
+    for family in sorted(DEFAULT_PRICES, key=len, reverse=True):
+        if family in name:
+            return DEFAULT_PRICES[family]
+    return 0.0, 0.0
+
+
+def estimate_cost(model: str, usage: Optional[Dict[str, int]]) -> float:
+    """Estimated USD cost of one call from its usage_metadata."""
+    if not usage:
+        return 0.0
+    input_price, output_price = _prices(model)
+    output_tokens = usage.get('candidates_token_count', 0) + usage.get('thoughts_token_count', 0)
+    return (usage.get('prompt_token_count', 0) * input_price + output_tokens * output_price) / 1_000_000
+
+
+def format_usage(usage: Optional[Dict[str, int]]) -> str:
+    """Token counts for status text, e.g. "1,290 prompt + 412 thinking + 188 output"."""
+    if not usage:
+        return "not reported"
+    return (f"{usage.get('prompt_token_count', 0):,} prompt + {usage.get('thoughts_token_count', 0):,} thinking + "
+            f"{usage.get('candidates_token_count', 0):,} output")
+
+
+def size_bucket(media_bytes: Optional[int]) -> str:
+    if media_bytes is None:
+        return "unknown"
+    for limit, label in SIZE_BUCKETS:
+        if media_bytes < limit:
+            return label
+    return ">16MB"
+
+
+def _options_hash(options: Optional[Dict[str, Any]]) -> str:
+    # Same hash as in cache keys, so profiles match the options_hash filter of the cache routes
+    return GeminiCache._get_options_hash(options)
+
+
+def _default_usage_dir() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "cache", "usage")
+
+
+def _add(target: Dict[str, Any], delta: Dict[str, Any]) -> None:
+    for key, value in delta.items():
+        if key in _COUNTERS:
+            target[key] = round(target.get(key, 0) + value, 6)
+        else:
+            target.setdefault(key, value)
+
+
+class UsageLedger:
+    """Daily token, latency and cost totals per model and per profile."""
+
+    def __init__(self, usage_dir: Optional[str] = None):
+        self.usage_dir = usage_dir or os.environ.get("SK_GEMINI_USAGE_DIR") or _default_usage_dir()
+        self._pending: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def _day_path(self, day: str) -> str:
+        return os.path.join(self.usage_dir, f"{day}.json")
+
+    def _record(self, model: str, kind: str, options: Optional[Dict[str, Any]], media_bytes: Optional[int],
+                delta: Dict[str, Any]) -> None:
+        day = time.strftime('%Y-%m-%d')
+        bucket = size_bucket(media_bytes)
+        profile = f"{model}|{kind}|{_options_hash(options)}|{bucket}"
+        with self._lock:
+            pending = self._pending.setdefault(day, {'models': {}, 'profiles': {}})
+            _add(pending['models'].setdefault(model, {}), delta)
+            _add(pending['profiles'].setdefault(profile, {'model': model, 'kind': kind, 'options': options or {},
+                                                          'size': bucket}), delta)
+            due = time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def record_call(self, model: str, kind: str, options: Optional[Dict[str, Any]], media_bytes: Optional[int],
+                    usage: Optional[Dict[str, int]], latency: float) -> None:
+        """Add one Gemini call (model = the model that produced the text)."""
+        usage = usage or {}
+        delta: Dict[str, Any] = {'requests': 1, 'latency_seconds': latency, 'media_bytes': media_bytes or 0,
+                                 'cost_usd': estimate_cost(model, usage)}
+        for field, name in _USAGE_FIELDS.items():
+            delta[field] = usage.get(name, 0)
+        self._record(model, kind, options, media_bytes, delta)
+
+    def record_cancelled(self, model: str, kind: str, options: Optional[Dict[str, Any]], media_bytes: Optional[int],
+                         prompt_tokens: int, latency: float) -> None:
+        """Add a request that was cancelled after the other half of a hedged request answered."""
+        self._record(model, kind, options, media_bytes, {
+            'requests': 1,
+            'cancelled_requests': 1,
+            'prompt_tokens': prompt_tokens,
+            'total_tokens': prompt_tokens,
+            'latency_seconds': latency,
+            'media_bytes': media_bytes or 0,
+            'cost_usd': estimate_cost(model, {'prompt_token_count': prompt_tokens}),
+        })
+
+    def record_cache_hit(self, entry: Dict[str, Any], kind: str) -> None:
+        """Add one cache hit, crediting the tokens stored with the entry as saved."""
+        model = entry.get('produced_by_model') or entry.get('gemini_model', 'unknown')
+        usage = entry.get('usage_metadata') or {}
+        self._record(model, kind, entry.get('options'), entry.get('media_bytes'), {
+            'cache_hits': 1,
+            'tokens_saved': usage.get('total_token_count', 0),
+            'cost_saved_usd': estimate_cost(model, usage),
+        })
+
+    def flush(self) -> None:
+        """Merge buffered counts into the daily files."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            os.makedirs(self.usage_dir, exist_ok=True)
+            for day, totals in pending.items():
+                path = self._day_path(day)
+                with file_lock(path + ".lock"):
+                    ledger = self._read(path) or {'date': day, 'models': {}, 'profiles': {}}
+                    for section in ('models', 'profiles'):
+                        for key, delta in totals[section].items():
+                            _add(ledger[section].setdefault(key, {}), delta)
+                    ledger['updated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+                    atomic_write_json(path, ledger, durable=False)
+        except (IOError, OSError) as e:
+            print(f"[USAGE] Failed to write usage ledger: {e}")
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def summary(self, days: int = 7) -> Dict[str, Any]:
+        """
+        Totals over the last `days` days (including today).
+
+        Returns:
+            {'days': [daily ledgers, newest first], 'models': totals per model,
+             'profiles': totals per profile sorted by cost, 'totals': overall totals}
+        """
+        self.flush()
+        daily: List[Dict[str, Any]] = []
+        models: Dict[str, Dict[str, Any]] = {}
+        profiles: Dict[str, Dict[str, Any]] = {}
+        for offset in range(max(days, 1)):
+            day = time.strftime('%Y-%m-%d', time.localtime(time.time() - offset * 86400))
+            ledger = self._read(self._day_path(day))
+            if ledger is None:
+                continue
+            daily.append(ledger)
+            for model, counts in ledger.get('models', {}).items():
+                _add(models.setdefault(model, {}), counts)
+            for profile, counts in ledger.get('profiles', {}).items():
+                _add(profiles.setdefault(profile, {}), counts)
+
+        totals: Dict[str, Any] = {}
+        for counts in models.values():
+            _add(totals, counts)
+        for counts in list(models.values()) + list(profiles.values()):
+            if counts.get('requests'):
+                counts['mean_latency_seconds'] = round(counts['latency_seconds'] / counts['requests'], 3)
+        return {
+            'days': daily,
+            'models': models,
+            'profiles': sorted(profiles.values(), key=lambda counts: counts.get('cost_usd', 0), reverse=True),
+            'totals': totals,
+        }
+
+
+# Global ledger instance
+_global_ledger: Optional[UsageLedger] = None
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Get the global usage ledger instance."""
+    global _global_ledger
+    if _global_ledger is None:
+        _global_ledger = UsageLedger()
+    return _global_ledger
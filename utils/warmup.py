@@ -0,0 +1,468 @@
+"""
+Offline cache warm-up for Gemini media descriptions.
+
+Walks a media directory outside of ComfyUI and precomputes GeminiCache entries for a
+GeminiUtilOptions configuration, so interactive runs on the same media are cache hits.
+
+- Media preparation (decode, re-encode, trim) runs in a process pool
+- Gemini calls run concurrently in a thread pool under a requests-per-minute limit
+- Runs are resumable: cached media is skipped, and failures are recorded in a state file
+  so a rerun only retries them with --retry-failed
+
+Usage (from the sk_custom_nodes directory):
+
+    python -m utils.warmup /data/dataset --media-type image --options options.json --rpm 60
+    python -m utils.warmup /data/clips --media-type video --max-duration 5 --workers 8 --concurrency 4
+
+The options file holds the JSON produced by the Gemini Util - Options node, e.g.
+{"gemini_model": "models/gemini-2.5-flash", "model_type": "Text2Image", "describe_clothing": true}.
+Missing keys fall back to the Media Describe defaults.
+
+With a key pool configured (SK_GEMINI_API_KEYS or SK_GEMINI_API_KEYS_FILE, see utils/key_pool.py),
+requests are spread over all keys and --concurrency defaults to 4 per key, so throughput scales
+with the number of provisioned keys.
+
+Requests are scheduled as Batch (utils/scheduler.py): while a ComfyUI process on the same host
+has interactive describes running or waiting, queued warm-up requests wait.
+
+To split a run over several processes or hosts, use the job queue in utils/job_queue.py.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any, Iterable, List, Set, Tuple
+
+from .cache import (get_cache, get_file_media_identifier, get_video_media_identifier, negative_cache_ttl, near_duplicate_distance,
+                    perceptual_hash_algorithm)
+from .file_lock import file_lock
+from .gemini_backend import EmptyResponseError
+from .media import find_media_files, prepare_image as prepare_media_image, read_file, trim_video
+from .workers import cpu_workers
+from .fingerprint import get_video_probe
+from .key_pool import get_key_pool
+from .hedging import get_hedge_policy
+from .scheduler import REQUEST_PRIORITIES, request_schedule
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls evenly to at most ``rpm`` requests per minute."""
+
+    def __init__(self, rpm: float):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def prepare_image(file_path: str, phash_algorithm: Optional[str] = None) -> Tuple[bytes, str, Optional[str]]:
+    """
+    Process-pool task: decode and re-encode an image exactly like the Media Describe node,
+    plus its perceptual hash when near-duplicate reuse is enabled.
+    """
+    image_data, _, image_phash = prepare_media_image(file_path, phash_algorithm)
+    return image_data, "image/jpeg", image_phash
+
+
+def prepare_video(file_path: str, max_duration: float) -> Tuple[bytes, str, Optional[str]]:
+    """Process-pool task: trim a video to max_duration (when longer) and return its bytes."""
+    video_info = get_video_probe(file_path)
+    final_path = file_path
+    trimmed_path = None
+    if max_duration > 0 and max_duration < video_info['duration']:
+        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
+            trimmed_path = temp_file.name
+        if trim_video(file_path, trimmed_path, max_duration):
+            final_path = trimmed_path
+
+    try:
+        return read_file(final_path), "video/mp4", None
+    finally:
+        if trimmed_path and os.path.exists(trimmed_path):
+            os.remove(trimmed_path)
+
+
+class WarmupState:
+    """
+    Append-only JSONL record of finished, failed and blocked files, used to resume interrupted
+    runs. Blocked files (Gemini answered without text) are not retried without --retry-failed,
+    like failed ones.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        self.failed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partial last line from an interrupted run
+                    if record.get('status') == 'done':
+                        self.done.add(record['path'])
+                        self.failed.pop(record['path'], None)
+                    elif record.get('status') in ('failed', 'blocked'):
+                        self.failed[record['path']] = record.get('error', '')
+
+    def record(self, file_path: str, status: str, error: str = "") -> None:
+        with self._lock, file_lock(self.path + ".lock"):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'path': file_path, 'status': status, 'error': error, 'timestamp': time.time()}) + "\n")
+
+
+class WarmupRunner:
+    """Precompute cache entries for every media file under a directory."""
+
+    def __init__(self, media_dir: str, media_type: str, gemini_options: Dict[str, Any], max_duration: float = 5.0,
+                 workers: Optional[int] = None, concurrency: Optional[int] = None, rpm: float = 0.0, state_path: Optional[str] = None,
+                 retry_failed: bool = False, max_retries: int = 3, progress_interval: float = 5.0,
+                 state: Optional[WarmupState] = None):
+        # Imported here so `--help` works without google-genai installed
+        from .nodes import GeminiMediaDescribe
+
+        self.media_dir = media_dir
+        self.media_type = media_type
+        self.options = gemini_options
+        self.max_duration = max_duration
+        self.workers = workers or cpu_workers() or 1
+        # 4 concurrent requests per key, so a pool of keys is actually used in parallel
+        key_pool = get_key_pool()
+        self.concurrency = max(concurrency or 4 * (len(key_pool) if key_pool else 1), 1)
+        self.rate_limiter = RateLimiter(rpm)
+        # hedge_mode etc. in the options file hedge slow requests like the Options node does
+        self.hedge = get_hedge_policy(gemini_options)
+        # Batch class unless the options say otherwise, so interactive describes on this host go first
+        self.schedule = request_schedule(dict(gemini_options,
+                                              request_priority=gemini_options.get("request_priority") or "Batch",
+                                              scheduler_tenant=gemini_options.get("scheduler_tenant") or "warmup"))
+        self.retry_failed = retry_failed
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self.node = GeminiMediaDescribe()
+        self.cache = get_cache()
+        self.model_type = gemini_options["model_type"] if media_type == "image" else ""  # Videos don't use model_type
+        self.cache_options = self.node._cache_options(
+            gemini_options["describe_clothing"], gemini_options["describe_hair_style"],
+            gemini_options["describe_bokeh"], gemini_options["describe_subject"],
+        )
+        if media_type == "image":
+            self.system_prompt, self.user_prompt = self.node._build_image_prompts(
+                gemini_options["model_type"], gemini_options["describe_clothing"], gemini_options["describe_hair_style"],
+                gemini_options["describe_bokeh"], gemini_options["describe_subject"],
+            )
+        else:
+            self.system_prompt, self.user_prompt = self.node._build_video_prompts(
+                gemini_options["describe_clothing"], gemini_options["describe_hair_style"],
+                gemini_options["describe_bokeh"], gemini_options["describe_subject"],
+            )
+        # Queue workers (utils/job_queue.py) record outcomes in the job table instead
+        self.state = state or WarmupState(state_path or self._default_state_path())
+
+        self.negative_ttl = negative_cache_ttl(gemini_options.get("negative_cache_hours"))
+        self.near_duplicate_distance = near_duplicate_distance(gemini_options.get("near_duplicate_distance")) \
+            if media_type == "image" else 0
+        self.phash_algorithm = perceptual_hash_algorithm() if self.near_duplicate_distance > 0 else None
+        self.counts = {'total': 0, 'cached': 0, 'described': 0, 'near_duplicate': 0, 'failed': 0,
+                       'skipped_failed': 0, 'blocked': 0}
+        self._counts_lock = threading.Lock()
+        self._started = 0.0
+        self._last_report = 0.0
+
+    def _default_state_path(self) -> str:
+        run_id = hashlib.sha256(json.dumps({
+            'media_dir': os.path.abspath(self.media_dir),
+            'media_type': self.media_type,
+            'model': self.options["gemini_model"],
+            'model_type': self.model_type,
+            'options': self.cache_options,
+        }, sort_keys=True).encode()).hexdigest()[:16]
+        return os.path.join(os.path.dirname(self.cache.cache_dir), "warmup", f"{run_id}.jsonl")
+
+    def _media_identifier(self, file_path: str) -> str:
+        # Same identity as the Media Describe node: content fingerprint for videos
+        if self.media_type == "video":
+            return get_video_media_identifier(file_path)
+        return get_file_media_identifier(file_path)
+
+    def _is_cached(self, file_path: str) -> bool:
+        return self.cache.get_with_legacy(
+            media_identifier=self._media_identifier(file_path),
+            legacy_identifier=get_file_media_identifier(file_path),
+            gemini_model=self.options["gemini_model"],
+            model_type=self.model_type,
+            options=self.cache_options,
+            extra_data={'media_path': file_path},
+        ) is not None
+
+    def _is_blocked(self, file_path: str) -> bool:
+        """Gemini answered this file without text recently (negative cache entry)."""
+        return self.cache.get_negative(
+            media_identifier=self._media_identifier(file_path),
+            gemini_model=self.options["gemini_model"],
+            model_type=self.model_type,
+            options=self.cache_options,
+            ttl=self.negative_ttl,
+        ) is not None
+
+    def start(self, total: int = 0) -> None:
+        """Start the clock for throughput and ETA, with total files known so far."""
+        with self._counts_lock:
+            self._started = time.monotonic()
+            self.counts['total'] = total
+
+    def add_to_total(self, count: int = 1) -> None:
+        """Count files discovered after start(), e.g. jobs claimed by a queue worker."""
+        with self._counts_lock:
+            self.counts['total'] += count
+
+    def record_outcome(self, key: str) -> None:
+        """Count a finished file under key ('cached', 'described', 'failed', 'blocked', ...)."""
+        with self._counts_lock:
+            self.counts[key] += 1
+        self.report()
+
+    def report(self, force: bool = False) -> None:
+        """Print progress, at most every progress_interval seconds unless forced."""
+        now = time.monotonic()
+        with self._counts_lock:
+            if not force and now - self._last_report < self.progress_interval:
+                return
+            self._last_report = now
+            counts = dict(self.counts)
+        finished = (counts['cached'] + counts['described'] + counts['near_duplicate'] + counts['failed']
+                    + counts['skipped_failed'] + counts['blocked'])
+        elapsed = max(now - self._started, 1e-6)
+        rate = counts['described'] / elapsed
+        remaining = counts['total'] - finished
+        eta = f"{remaining / rate:.0f}s" if rate > 0 else "n/a"
+        print(f"[WARMUP] {finished}/{counts['total']} | cached {counts['cached']} | described {counts['described']} | "
+              f"near-duplicate {counts['near_duplicate']} | "
+              f"failed {counts['failed']} | blocked {counts['blocked']} | {rate:.2f} items/s | ETA {eta}")
+
+    def _describe(self, file_path: str, prepared: "Future[Tuple[bytes, str, Optional[str]]]") -> None:
+        """API-pool task: send prepared media to Gemini (rate limited, retried on 429/5xx) and cache it."""
+        try:
+            media_data, mime_type, image_phash = prepared.result()
+        except Exception as e:
+            self._fail(file_path, f"preparation failed: {e}")
+            return
+
+        if image_phash is not None:
+            near_duplicate = self.cache.find_near_duplicate(image_phash, self.options["gemini_model"], self.model_type,
+                                                            self.cache_options, self.near_duplicate_distance)
+            if near_duplicate is not None:
+                original, distance = near_duplicate
+                self.cache.set(
+                    media_identifier=self._media_identifier(file_path),
+                    gemini_model=self.options["gemini_model"],
+                    description=original['description'],
+                    model_type=self.model_type,
+                    options=self.cache_options,
+                    extra_data={'perceptual_hash': image_phash, 'near_duplicate_of': original.get('media_identifier'),
+                                'hamming_distance': distance},
+                )
+                self.state.record(file_path, 'done')
+                self.record_outcome('near_duplicate')
+                return
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                description, generation_info = self.node._generate_description(
+                    self.options["gemini_api_key"], self.options["gemini_model"], mime_type, media_data,
+                    self.system_prompt, self.user_prompt, hedge=self.hedge, schedule=self.schedule,
+                )
+                generation_info['media_bytes'] = len(media_data)
+                self.node._record_usage(generation_info, mime_type.split("/", 1)[0], self.cache_options)
+                break
+            except EmptyResponseError as e:
+                # Not retryable: record it so interactive runs fail fast on this file too
+                if self.negative_ttl > 0:
+                    self.cache.set_negative(self._media_identifier(file_path), self.options["gemini_model"], e.reason,
+                                            self.model_type, self.cache_options)
+                print(f"[WARMUP] Blocked {file_path}: {e}")
+                self.state.record(file_path, 'blocked', str(e))
+                self.record_outcome('blocked')
+                return
+            except Exception as e:
+                code = getattr(e, 'code', None)
+                retryable = code == 429 or (isinstance(code, int) and code >= 500)
+                if not retryable or attempt == self.max_retries:
+                    self._fail(file_path, str(e))
+                    return
+                time.sleep(min(2 ** attempt * 2.0, 60.0))
+
+        self.cache.set(
+            media_identifier=self._media_identifier(file_path),
+            gemini_model=self.options["gemini_model"],
+            description=description,
+            model_type=self.model_type,
+            options=self.cache_options,
+            extra_data=dict(generation_info, perceptual_hash=image_phash, media_path=file_path) if image_phash
+            else dict(generation_info, media_path=file_path),
+        )
+        self.state.record(file_path, 'done')
+        self.record_outcome('described')
+
+    def _fail(self, file_path: str, error: str) -> None:
+        print(f"[WARMUP] Failed {file_path}: {error}")
+        self.state.record(file_path, 'failed', error)
+        self.record_outcome('failed')
+
+    def skip_reason(self, file_path: str) -> Optional[str]:
+        """'cached' or 'blocked' when file_path needs no Gemini call, else None."""
+        if self._is_cached(file_path):
+            return 'cached'
+        if self._is_blocked(file_path):
+            return 'blocked'
+        return None
+
+    def process(self, files: Iterable[str]) -> None:
+        """
+        Prepare and describe files on the preparation and API pools, recording each in the state.
+
+        files is consumed lazily, one file per free pipeline slot, so it may be a generator that
+        waits for or claims work.
+        """
+        # Bound the number of prepared payloads held in memory at once
+        in_flight = threading.BoundedSemaphore(self.workers + self.concurrency * 2)
+        all_done = threading.Event()
+        outstanding = [0]
+        exhausted = [False]
+        outstanding_lock = threading.Lock()
+
+        def finish(_: Future) -> None:
+            in_flight.release()
+            with outstanding_lock:
+                outstanding[0] -= 1
+                if outstanding[0] == 0 and exhausted[0]:
+                    all_done.set()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as prep_pool, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="warmup-api") as api_pool:
+
+            def hand_off(prepared: "Future[Tuple[bytes, str, Optional[str]]]", file_path: str) -> None:
+                api_pool.submit(self._describe, file_path, prepared).add_done_callback(finish)
+
+            iterator = iter(files)
+            while True:
+                in_flight.acquire()
+                file_path = next(iterator, None)
+                if file_path is None:
+                    in_flight.release()
+                    break
+                with outstanding_lock:
+                    outstanding[0] += 1
+                if self.media_type == "image":
+                    prepared = prep_pool.submit(prepare_image, file_path, self.phash_algorithm)
+                else:
+                    prepared = prep_pool.submit(prepare_video, file_path, self.max_duration)
+                prepared.add_done_callback(lambda f, path=file_path: hand_off(f, path))
+
+            with outstanding_lock:
+                exhausted[0] = True
+                if outstanding[0] == 0:
+                    all_done.set()
+            all_done.wait()
+
+    def run(self) -> Dict[str, int]:
+        files = sorted(set(find_media_files(self.media_dir, self.media_type)))
+        self.start(len(files))
+        print(f"[WARMUP] Found {len(files)} {self.media_type} files in {self.media_dir}")
+        print(f"[WARMUP] State file: {self.state.path}")
+
+        pending: List[str] = []
+        for file_path in files:
+            if file_path in self.state.failed and not self.retry_failed:
+                self.counts['skipped_failed'] += 1
+                continue
+            skipped = self.skip_reason(file_path)
+            if skipped is not None:
+                self.counts[skipped] += 1
+            else:
+                pending.append(file_path)
+        self.report(force=True)
+
+        self.process(pending)
+
+        self.report(force=True)
+        key_pool = get_key_pool()
+        if key_pool is not None:
+            for key_stats in key_pool.stats():
+                print(f"[WARMUP] Key {key_stats['key']}: {key_stats['requests']} requests, {key_stats['errors']} errors")
+        return dict(self.counts)
+
+
+def load_options(options_path: Optional[str], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Media Describe defaults, updated from an options JSON file and command line overrides."""
+    from .nodes import DEFAULT_GEMINI_OPTIONS
+
+    options = dict(DEFAULT_GEMINI_OPTIONS)
+    if options_path:
+        with open(options_path, 'r', encoding='utf-8') as f:
+            options.update(json.load(f))
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return options
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute Gemini description cache entries for a media directory")
+    parser.add_argument("media_dir", help="Directory to walk (including subdirectories)")
+    parser.add_argument("--media-type", choices=["image", "video"], default="image")
+    parser.add_argument("--options", help="JSON file with Gemini Util - Options values")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"), help="Overrides gemini_api_key (default: $GEMINI_API_KEY; ignored when a key pool is configured)")
+    parser.add_argument("--model", help="Overrides gemini_model")
+    parser.add_argument("--model-type", choices=["Text2Image", "ImageEdit"], help="Overrides model_type (images only)")
+    parser.add_argument("--near-duplicate-distance", type=int, help="Overrides near_duplicate_distance (images only)")
+    parser.add_argument("--max-duration", type=float, default=5.0, help="Trim videos to this many seconds (0 = full video)")
+    parser.add_argument("--workers", type=int, default=None, help="Media preparation processes (default: $SK_GEMINI_CPU_WORKERS or CPU count)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Concurrent Gemini requests (default: 4 per API key)")
+    parser.add_argument("--rpm", type=float, default=0.0, help="Maximum Gemini requests per minute (0 = unlimited)")
+    parser.add_argument("--priority", choices=list(REQUEST_PRIORITIES), default="Batch",
+                        help="Scheduler class of the Gemini requests (default: Batch, which yields to interactive describes)")
+    parser.add_argument("--tenant", help="Scheduler tenant of the requests (default: the options' scheduler_tenant, else warmup)")
+    parser.add_argument("--state", help="Resume state file (default: cache/warmup/<run id>.jsonl)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry files that failed in a previous run")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between progress reports")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.media_dir):
+        parser.error(f"Media directory does not exist: {args.media_dir}")
+
+    options = load_options(args.options, {
+        "gemini_api_key": args.api_key,
+        "gemini_model": args.model,
+        "model_type": args.model_type,
+        "near_duplicate_distance": args.near_duplicate_distance,
+        "request_priority": args.priority,
+        "scheduler_tenant": args.tenant,
+    })
+    runner = WarmupRunner(
+        args.media_dir, args.media_type, options, max_duration=args.max_duration, workers=args.workers,
+        concurrency=args.concurrency, rpm=args.rpm, state_path=args.state, retry_failed=args.retry_failed,
+        progress_interval=args.progress_interval,
+    )
+    counts = runner.run()
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
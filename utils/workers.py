@@ -0,0 +1,154 @@
+"""
+Shared worker pools for media preparation.
+
+- IO pool (threads): file reads, ffmpeg subprocesses and other work that mostly waits
+- CPU pool: image decoding, JPEG encoding and hashing
+
+Both pools are created on first use and shared by every node in the process. Callers submit
+work and keep going (cache lookups, API calls for the previous item), so batch modes overlap
+Gemini calls with preparing the next item instead of leaving most cores idle.
+
+The CPU pool uses threads by default: Pillow, numpy, hashlib and OpenCV release the GIL in
+their heavy loops, and threads avoid pickling full-resolution images. Worker processes are
+opt-in, because inside ComfyUI a spawned child re-imports ComfyUI's main module and often
+cannot import a custom node package by name. Processes are started with "spawn" so they never
+inherit CUDA state. If the process pool turns out to be unusable, CPU work falls back to
+threads for the rest of the session.
+
+SK_GEMINI_IO_WORKERS: IO threads (default min(32, CPU count + 4))
+SK_GEMINI_CPU_WORKERS: CPU workers (default CPU count)
+SK_GEMINI_CPU_POOL: "thread" (default) or "process"
+"""
+
+import os
+import pickle
+import threading
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+_pools_lock = threading.Lock()
+_io_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[Executor] = None
+_process_pool_disabled = False
+
+
+def _env_workers(name: str, default: int) -> int:
+    try:
+        return max(int(os.environ.get(name, default)), 0)
+    except ValueError:
+        return default
+
+
+def io_workers() -> int:
+    """IO pool size (SK_GEMINI_IO_WORKERS)."""
+    return max(_env_workers("SK_GEMINI_IO_WORKERS", min(32, (os.cpu_count() or 1) + 4)), 1)
+
+
+def cpu_workers() -> int:
+    """CPU pool size (SK_GEMINI_CPU_WORKERS)."""
+    return max(_env_workers("SK_GEMINI_CPU_WORKERS", os.cpu_count() or 1), 1)
+
+
+def cpu_pool_kind() -> str:
+    """CPU pool kind: "thread" or "process" (SK_GEMINI_CPU_POOL)."""
+    kind = os.environ.get("SK_GEMINI_CPU_POOL", "thread").strip().lower()
+    return "process" if kind == "process" and not _process_pool_disabled else "thread"
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    """Get the shared IO thread pool."""
+    global _io_pool
+    with _pools_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=io_workers(), thread_name_prefix="sk-gemini-io")
+        return _io_pool
+
+
+def get_cpu_pool() -> Executor:
+    """Get the shared CPU pool (threads, or spawned processes with SK_GEMINI_CPU_POOL=process)."""
+    global _cpu_pool
+    with _pools_lock:
+        if _cpu_pool is None:
+            if cpu_pool_kind() == "process":
+                _cpu_pool = ProcessPoolExecutor(max_workers=cpu_workers(), mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _cpu_pool = ThreadPoolExecutor(max_workers=cpu_workers(), thread_name_prefix="sk-gemini-cpu")
+        return _cpu_pool
+
+
+def _disable_process_pool(error: BaseException) -> None:
+    global _cpu_pool, _process_pool_disabled
+    with _pools_lock:
+        if _process_pool_disabled:
+            return
+        _process_pool_disabled = True
+        pool, _cpu_pool = _cpu_pool, None
+    print(f"[WORKERS] Process pool unavailable ({type(error).__name__}: {error}); running CPU work in threads")
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def submit_io(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """Submit func to the IO pool."""
+    return get_io_pool().submit(func, *args, **kwargs)
+
+
+def submit_cpu(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """
+    Submit func to the CPU pool. With worker processes, func must be a module-level function
+    and its arguments and result must be picklable; if the process pool breaks, the call is
+    retried in the thread pool.
+    """
+    pool = get_cpu_pool()
+    if not isinstance(pool, ProcessPoolExecutor):
+        return pool.submit(func, *args, **kwargs)
+
+    result: Future = Future()
+
+    def fallback(error: BaseException) -> None:
+        _disable_process_pool(error)
+        get_cpu_pool().submit(func, *args, **kwargs).add_done_callback(lambda done: _copy_result(done, result))
+
+    def relay(done: Future) -> None:
+        error = done.exception()
+        if isinstance(error, (BrokenProcessPool, pickle.PicklingError)):
+            fallback(error)
+        else:
+            _copy_result(done, result)
+
+    try:
+        pool.submit(func, *args, **kwargs).add_done_callback(relay)
+    except (BrokenProcessPool, RuntimeError) as e:
+        fallback(e)
+    return result
+
+
+def _copy_result(source: Future, target: Future) -> None:
+    error = source.exception()
+    if error is not None:
+        target.set_exception(error)
+    else:
+        target.set_result(source.result())
+
+
+def run_io(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run func in the IO pool and wait for its result."""
+    return submit_io(func, *args, **kwargs).result()
+
+
+def run_cpu(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run func in the CPU pool and wait for its result."""
+    return submit_cpu(func, *args, **kwargs).result()
+
+
+def shutdown_pools(wait: bool = True) -> None:
+    """Shut down both pools; they are re-created on next use."""
+    global _io_pool, _cpu_pool
+    with _pools_lock:
+        io_pool, cpu_pool = _io_pool, _cpu_pool
+        _io_pool = _cpu_pool = None
+    for pool in (cpu_pool, io_pool):
+        if pool is not None:
+            pool.shutdown(wait=wait)
@@ -3,11 +3,547 @@ import { api } from "../../../scripts/api.js";
 
 console.log("Loading gemini_widgets.js extension");
 
+// ---------------------------------------------------------------------------
+// Gemini description cache panel (backed by /sk_custom_nodes/cache/* routes)
+// ---------------------------------------------------------------------------
+
+const CACHE_ROUTE = "/sk_custom_nodes/cache";
+
+function formatBytes(bytes) {
+    if (!bytes) return "0 B";
+    const units = ["B", "KB", "MB", "GB", "TB"];
+    const i = Math.min(Math.floor(Math.log(bytes) / Math.log(1024)), units.length - 1);
+    return `${(bytes / Math.pow(1024, i)).toFixed(i === 0 ? 0 : 1)} ${units[i]}`;
+}
+
+async function cacheRequest(path, options = {}) {
+    const response = await api.fetchApi(`${CACHE_ROUTE}${path}`, options);
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `HTTP ${response.status}`);
+    }
+    return data;
+}
+
+function buildCachePanel() {
+    const panel = document.createElement("div");
+    panel.style.cssText =
+        "display:flex;flex-direction:column;gap:10px;padding:12px;min-width:420px;max-width:720px;color:var(--fg-color);font-size:13px;";
+
+    const el = (tag, text, css = "") => {
+        const node = document.createElement(tag);
+        if (text) node.textContent = text;
+        if (css) node.style.cssText = css;
+        return node;
+    };
+    const input = (placeholder) => {
+        const node = el("input", "", "flex:1;padding:4px 6px;background:var(--comfy-input-bg);color:var(--input-text);border:1px solid var(--border-color);border-radius:4px;");
+        node.placeholder = placeholder;
+        return node;
+    };
+    const button = (label, onClick) => {
+        const node = el("button", label, "padding:4px 10px;cursor:pointer;");
+        node.addEventListener("click", onClick);
+        return node;
+    };
+    const row = (...children) => {
+        const node = el("div", "", "display:flex;gap:6px;align-items:center;");
+        children.forEach((child) => node.appendChild(child));
+        return node;
+    };
+
+    panel.appendChild(el("h3", "Gemini Description Cache", "margin:0;"));
+
+    // Stats
+    const statsBox = el("div", "Loading…", "font-family:monospace;white-space:pre;");
+    const refreshStats = async () => {
+        try {
+            const stats = await cacheRequest("/stats");
+            const hitRate = stats.hit_rate === null ? "n/a" : `${(stats.hit_rate * 100).toFixed(1)}%`;
+            statsBox.textContent =
+                `Entries:   ${stats.entries.toLocaleString()}\n` +
+                `Size:      ${formatBytes(stats.total_size)}\n` +
+                `Remote:    ${stats.remote || "none"}\n` +
+                `Session:   ${stats.hits} hits, ${stats.remote_hits} remote hits, ${stats.misses} misses (hit rate ${hitRate})`;
+        } catch (error) {
+            statsBox.textContent = `Failed to load stats: ${error.message}`;
+        }
+    };
+    panel.appendChild(row(statsBox));
+    panel.appendChild(row(button("↻ Refresh", refreshStats)));
+
+    // Lookup by media / model
+    const pathInput = input("Media file path");
+    const modelInput = input("Model (e.g. models/gemini-2.5-pro)");
+    const results = el("div", "", "max-height:260px;overflow:auto;border-top:1px solid var(--border-color);padding-top:6px;");
+    const currentFilters = () => {
+        const filters = {};
+        if (pathInput.value.trim()) filters.path = pathInput.value.trim();
+        if (modelInput.value.trim()) filters.model = modelInput.value.trim();
+        return filters;
+    };
+
+    const lookup = async () => {
+        results.textContent = "Searching…";
+        try {
+            const data = await cacheRequest(`/lookup?${new URLSearchParams(currentFilters())}`);
+            results.textContent = data.count ? "" : "No matching entries";
+            for (const entry of data.entries) {
+                const item = el("div", "", "margin-bottom:8px;");
+                item.appendChild(el("div",
+                    `${new Date(entry.timestamp * 1000).toLocaleString()} · ${entry.gemini_model} · ${entry.model_type || "video"} · options ${entry.options_hash}`,
+                    "opacity:0.7;font-size:11px;"));
+                item.appendChild(el("div", entry.media_path || entry.media_identifier, "font-size:11px;word-break:break-all;"));
+                item.appendChild(el("div", entry.description, "white-space:pre-wrap;"));
+                results.appendChild(item);
+            }
+        } catch (error) {
+            results.textContent = `Lookup failed: ${error.message}`;
+        }
+    };
+
+    const purge = async () => {
+        const filters = currentFilters();
+        if (!Object.keys(filters).length) {
+            app.ui.dialog.show("Enter a media path and/or model to purge.");
+            return;
+        }
+        if (!confirm(`Delete all cached descriptions matching ${JSON.stringify(filters)}?`)) return;
+        try {
+            const data = await cacheRequest("/purge", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify(filters),
+            });
+            app.extensionManager?.toast?.add({
+                severity: "success",
+                summary: "Cache purged",
+                detail: `Deleted ${data.deleted} entries`,
+                life: 3000,
+            });
+            results.textContent = "";
+            refreshStats();
+        } catch (error) {
+            app.ui.dialog.show(`Purge failed: ${error.message}`);
+        }
+    };
+
+    const exportEntries = () => {
+        const link = document.createElement("a");
+        link.href = api.apiURL(`${CACHE_ROUTE}/export?${new URLSearchParams(currentFilters())}`);
+        link.download = "";
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+    };
+
+    panel.appendChild(row(pathInput));
+    panel.appendChild(row(modelInput));
+    panel.appendChild(row(button("🔍 Lookup", lookup), button("🗑 Purge matching", purge), button("⬇ Export", exportEntries)));
+    panel.appendChild(results);
+
+    refreshStats();
+    return panel;
+}
+
+function showCachePanel() {
+    app.ui.dialog.show(buildCachePanel());
+}
+
+function addCacheMenuOption(nodeType) {
+    const getExtraMenuOptions = nodeType.prototype.getExtraMenuOptions;
+    nodeType.prototype.getExtraMenuOptions = function (_, options) {
+        getExtraMenuOptions?.apply(this, arguments);
+        options.push({ content: "🗄️ Gemini Cache…", callback: showCachePanel });
+    };
+}
+
+// ---------------------------------------------------------------------------
+// Resumable, content-addressed uploads (backed by /sk_custom_nodes/upload/* routes)
+// ---------------------------------------------------------------------------
+
+const UPLOAD_ROUTE = "/sk_custom_nodes/upload";
+const UPLOAD_MAX_RETRIES = 8;
+
+// Files up to this size are hashed with crypto.subtle in one piece; larger files (or pages
+// without crypto.subtle) are streamed through Sha256 so they are never held in memory whole
+const SUBTLE_HASH_MAX_BYTES = 256 * 1024 * 1024;
+const HASH_SLICE_BYTES = 8 * 1024 * 1024;
+
+const SHA256_K = new Uint32Array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+]);
+
+// Incremental SHA-256, for files too large for crypto.subtle.digest and for pages served over
+// plain HTTP (e.g. ComfyUI over a VPN), where crypto.subtle is unavailable
+class Sha256 {
+    constructor() {
+        this.hash = new Uint32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+        ]);
+        this.w = new Uint32Array(64);
+        this.buffer = new Uint8Array(64);
+        this.buffered = 0;
+        this.length = 0;
+    }
+
+    update(bytes) {
+        this.length += bytes.length;
+        let position = 0;
+        if (this.buffered > 0) {
+            position = Math.min(64 - this.buffered, bytes.length);
+            this.buffer.set(bytes.subarray(0, position), this.buffered);
+            this.buffered += position;
+            if (this.buffered < 64) return;
+            this.compress(new DataView(this.buffer.buffer), 0);
+            this.buffered = 0;
+        }
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        for (; position + 64 <= bytes.length; position += 64) {
+            this.compress(view, position);
+        }
+        this.buffer.set(bytes.subarray(position));
+        this.buffered = bytes.length - position;
+    }
+
+    compress(view, offset) {
+        const rotr = (x, n) => (x >>> n) | (x << (32 - n));
+        const w = this.w;
+        for (let i = 0; i < 16; i++) w[i] = view.getUint32(offset + i * 4);
+        for (let i = 16; i < 64; i++) {
+            const s0 = rotr(w[i - 15], 7) ^ rotr(w[i - 15], 18) ^ (w[i - 15] >>> 3);
+            const s1 = rotr(w[i - 2], 17) ^ rotr(w[i - 2], 19) ^ (w[i - 2] >>> 10);
+            w[i] = (w[i - 16] + s0 + w[i - 7] + s1) >>> 0;
+        }
+        let [a, b, c, d, e, f, g, h] = this.hash;
+        for (let i = 0; i < 64; i++) {
+            const t1 = (h + (rotr(e, 6) ^ rotr(e, 11) ^ rotr(e, 25)) + ((e & f) ^ (~e & g)) + SHA256_K[i] + w[i]) >>> 0;
+            const t2 = ((rotr(a, 2) ^ rotr(a, 13) ^ rotr(a, 22)) + ((a & b) ^ (a & c) ^ (b & c))) >>> 0;
+            h = g;
+            g = f;
+            f = e;
+            e = (d + t1) >>> 0;
+            d = c;
+            c = b;
+            b = a;
+            a = (t1 + t2) >>> 0;
+        }
+        [a, b, c, d, e, f, g, h].forEach((value, i) => {
+            this.hash[i] = (this.hash[i] + value) >>> 0;
+        });
+    }
+
+    digest() {
+        const length = this.length;
+        const padding = new Uint8Array(((this.buffered + 8) >> 6 ? 128 : 64) - this.buffered);
+        padding[0] = 0x80;
+        const view = new DataView(padding.buffer);
+        view.setUint32(padding.length - 8, Math.floor(length / 0x20000000));
+        view.setUint32(padding.length - 4, (length << 3) >>> 0);
+        this.update(padding);
+        const digest = new Uint8Array(32);
+        const digestView = new DataView(digest.buffer);
+        this.hash.forEach((value, i) => digestView.setUint32(i * 4, value));
+        return digest;
+    }
+}
+
+// SHA-256 of a whole File as 64 hex characters, identical to hashlib.sha256 on the server.
+// Uploads are named by it, so two files only share a stored upload when every byte matches.
+async function computeContentHash(file, onProgress) {
+    let digest;
+    if (window.crypto?.subtle && file.size <= SUBTLE_HASH_MAX_BYTES) {
+        digest = new Uint8Array(await window.crypto.subtle.digest("SHA-256", await file.arrayBuffer()));
+    } else {
+        const hasher = new Sha256();
+        for (let offset = 0; offset < file.size; offset += HASH_SLICE_BYTES) {
+            onProgress?.(offset / file.size);
+            hasher.update(new Uint8Array(await file.slice(offset, offset + HASH_SLICE_BYTES).arrayBuffer()));
+        }
+        digest = hasher.digest();
+    }
+    return Array.from(digest, (byte) => byte.toString(16).padStart(2, "0")).join("");
+}
+
+async function uploadRequest(path, body) {
+    const response = await api.fetchApi(`${UPLOAD_ROUTE}${path}`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(body),
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `HTTP ${response.status}`);
+    }
+    return data;
+}
+
+/**
+ * Upload a file to <input>/gemini_images or gemini_videos under its SHA-256.
+ * Skips the transfer when the same content was uploaded before, resumes from the bytes the
+ * server already has, and retries failed chunks with backoff.
+ *
+ * @returns {{name: string, subfolder: string, status: "exists"|"complete", resumedFrom: number}}
+ */
+async function uploadMediaResumable(file, mediaType, onProgress) {
+    const sha256 = await computeContentHash(file);
+    const meta = { media_type: mediaType, sha256, size: file.size, name: file.name };
+
+    const state = await uploadRequest("/init", meta);
+    if (state.status === "exists") {
+        return { ...state, resumedFrom: file.size };
+    }
+
+    const resumedFrom = state.received;
+    let offset = state.received;
+    let failures = 0;
+    while (offset < file.size) {
+        onProgress?.(offset / file.size);
+        const params = new URLSearchParams({
+            media_type: mediaType,
+            sha256,
+            size: String(file.size),
+            offset: String(offset),
+        });
+        let response = null;
+        let data = {};
+        try {
+            response = await api.fetchApi(`${UPLOAD_ROUTE}/chunk?${params}`, {
+                method: "PUT",
+                headers: { "Content-Type": "application/octet-stream" },
+                body: file.slice(offset, offset + state.chunk_size),
+            });
+            data = await response.json();
+        } catch (error) {
+            // Network errors and non-JSON gateway errors are retried below
+            console.log("[UPLOAD] Chunk request failed:", error);
+        }
+
+        if (response?.ok) {
+            offset = data.received;
+            failures = 0;
+        } else if (response?.status === 409 && typeof data.received === "number") {
+            // Another tab or a lost response moved the server's offset; continue from there
+            offset = data.received;
+        } else if (response && response.status < 500) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        } else {
+            failures += 1;
+            if (failures > UPLOAD_MAX_RETRIES) {
+                throw new Error(`Upload interrupted at ${formatBytes(offset)} of ${formatBytes(file.size)}; choose the file again to resume`);
+            }
+            await new Promise((resolve) => window.setTimeout(resolve, Math.min(1000 * 2 ** failures, 30000)));
+        }
+    }
+    onProgress?.(1);
+
+    return { ...(await uploadRequest("/complete", meta)), resumedFrom };
+}
+
+const THUMBNAIL_ROUTE = "/sk_custom_nodes/thumbnail";
+const THUMBNAIL_SIZE = 256;
+
+// source: {filename, subfolder, type} for files in ComfyUI's directories, or {fingerprint}
+function thumbnailURL(source, kind) {
+    const params = new URLSearchParams({ ...source, kind, size: String(THUMBNAIL_SIZE) });
+    return api.apiURL(`${THUMBNAIL_ROUTE}?${params}`);
+}
+
+// ---------------------------------------------------------------------------
+// Media path browser (backed by the /sk_custom_nodes/browse route and its directory index)
+// ---------------------------------------------------------------------------
+
+const BROWSE_ROUTE = "/sk_custom_nodes/browse";
+const BROWSE_PAGE_SIZE = 100;
+
+async function browseRequest(params) {
+    const response = await api.fetchApi(`${BROWSE_ROUTE}?${new URLSearchParams(params)}`);
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `HTTP ${response.status}`);
+    }
+    return data;
+}
+
+function buildBrowsePanel(node) {
+    const mediaPathWidget = node.widgets?.find((w) => w.name === "media_path");
+    const mediaType = node.widgets?.find((w) => w.name === "media_type")?.value || "image";
+    const root = (mediaPathWidget?.value || "").trim();
+
+    const panel = document.createElement("div");
+    panel.style.cssText =
+        "display:flex;flex-direction:column;gap:8px;padding:12px;min-width:420px;max-width:720px;color:var(--fg-color);font-size:13px;";
+    const el = (tag, text, css = "") => {
+        const item = document.createElement(tag);
+        if (text) item.textContent = text;
+        if (css) item.style.cssText = css;
+        return item;
+    };
+    const button = (label, onClick) => {
+        const item = el("button", label, "padding:4px 10px;cursor:pointer;");
+        item.addEventListener("click", onClick);
+        return item;
+    };
+    const row = (...children) => {
+        const item = el("div", "", "display:flex;gap:6px;align-items:center;");
+        children.forEach((child) => item.appendChild(child));
+        return item;
+    };
+
+    panel.appendChild(el("h3", `Browse ${mediaType}s in media_path`, "margin:0;"));
+    if (!root) {
+        panel.appendChild(el("div", "Set media_path on the node first."));
+        return panel;
+    }
+
+    const location = el("div", "", "font-family:monospace;word-break:break-all;");
+    const nameInput = el("input", "", "flex:1;padding:4px 6px;background:var(--comfy-input-bg);color:var(--input-text);border:1px solid var(--border-color);border-radius:4px;");
+    nameInput.placeholder = "Filter by file name";
+    const summary = el("div", "", "opacity:0.8;");
+    const directories = el("div", "", "display:flex;flex-wrap:wrap;gap:4px;");
+    const files = el("div", "", "max-height:300px;overflow:auto;border-top:1px solid var(--border-color);padding-top:6px;font-family:monospace;font-size:11px;");
+    const pager = el("div", "", "opacity:0.8;");
+
+    // cursors[i] is the 'after' value of page i (the first page has none)
+    let subdir = "";
+    let cursors = [""];
+    let nextCursor = null;
+
+    const load = async (refresh = false) => {
+        const page = cursors.length - 1;
+        location.textContent = subdir ? `${root} / ${subdir}` : root;
+        summary.textContent = "Loading…";
+        try {
+            const data = await browseRequest({
+                path: root, subdir, media_type: mediaType, name: nameInput.value.trim(),
+                after: cursors[page], limit: String(BROWSE_PAGE_SIZE), refresh: refresh ? "1" : "0",
+            });
+            summary.textContent = `${data.total.toLocaleString()} ${mediaType} files` +
+                (data.refreshed.rescanned ? ` (re-indexed ${data.refreshed.rescanned} directories)` : "");
+
+            directories.replaceChildren();
+            if (subdir) {
+                directories.appendChild(button("⬆ ..", () => {
+                    subdir = subdir.split("/").slice(0, -1).join("/");
+                    cursors = [""];
+                    load();
+                }));
+            }
+            for (const directory of data.directories) {
+                if (!directory.files) continue;
+                directories.appendChild(button(`📁 ${directory.name} (${directory.files.toLocaleString()})`, () => {
+                    subdir = subdir ? `${subdir}/${directory.name}` : directory.name;
+                    cursors = [""];
+                    load();
+                }));
+            }
+
+            files.replaceChildren(...data.files.map((file) => el("div",
+                `${file.path}  ·  ${formatBytes(file.size)}  ·  ${new Date(file.mtime * 1000).toLocaleString()}`)));
+            nextCursor = data.next_after;
+            const first = page * BROWSE_PAGE_SIZE + 1;
+            pager.textContent = data.files.length
+                ? `${first.toLocaleString()}–${(first + data.files.length - 1).toLocaleString()} of ${data.total.toLocaleString()}`
+                : "";
+        } catch (error) {
+            summary.textContent = `Browse failed: ${error.message}`;
+        }
+    };
+
+    let filterTimer = null;
+    nameInput.addEventListener("input", () => {
+        window.clearTimeout(filterTimer);
+        filterTimer = window.setTimeout(() => {
+            cursors = [""];
+            load();
+        }, 250);
+    });
+
+    panel.appendChild(location);
+    panel.appendChild(row(nameInput, button("↻ Rescan", () => load(true))));
+    panel.appendChild(summary);
+    panel.appendChild(directories);
+    panel.appendChild(files);
+    panel.appendChild(row(
+        button("◀ Prev", () => {
+            if (cursors.length > 1) {
+                cursors.pop();
+                load();
+            }
+        }),
+        button("Next ▶", () => {
+            if (nextCursor) {
+                cursors.push(nextCursor);
+                load();
+            }
+        }),
+        pager,
+    ));
+    panel.appendChild(row(button("✔ Use this directory for media_path", () => {
+        if (mediaPathWidget) {
+            mediaPathWidget.value = subdir ? `${root.replace(/[\\/]+$/, "")}/${subdir}` : root;
+            mediaPathWidget.callback?.(mediaPathWidget.value);
+            node.setDirtyCanvas(true, true);
+        }
+        app.ui.dialog.close();
+    })));
+
+    load();
+    return panel;
+}
+
+function addBrowseMenuOption(nodeType) {
+    const getExtraMenuOptions = nodeType.prototype.getExtraMenuOptions;
+    nodeType.prototype.getExtraMenuOptions = function (_, options) {
+        getExtraMenuOptions?.apply(this, arguments);
+        options.push({ content: "📂 Browse media_path…", callback: () => app.ui.dialog.show(buildBrowsePanel(this)) });
+    };
+}
+
+function uploadSummary(file, result) {
+    if (result.status === "exists") {
+        return `${file.name} was already uploaded`;
+    }
+    if (result.resumedFrom > 0) {
+        return `Uploaded ${file.name} (resumed at ${formatBytes(result.resumedFrom)})`;
+    }
+    return `Successfully uploaded ${file.name}`;
+}
+
 // Register custom widget for the Gemini Video Describe node
 app.registerExtension({
     name: "sk_custom_nodes.gemini_widgets",
 
+    setup() {
+        // Cache panel in the sidebar, on frontends that support sidebar tabs
+        app.extensionManager?.registerSidebarTab?.({
+            id: "sk_gemini_cache",
+            icon: "pi pi-database",
+            title: "Gemini Cache",
+            tooltip: "Gemini description cache",
+            type: "custom",
+            render: (element) => {
+                element.replaceChildren(buildCachePanel());
+            },
+        });
+    },
+
     async beforeRegisterNodeDef(nodeType, nodeData, app) {
+        // Cache panel is available from the context menu of the Gemini nodes
+        if (nodeData.name === "GeminiUtilOptions" || nodeData.name === "GeminiUtilMediaDescribe") {
+            addCacheMenuOption(nodeType);
+        }
+        if (nodeData.name === "GeminiUtilMediaDescribe") {
+            addBrowseMenuOption(nodeType);
+        }
+
         // Handle GeminiUtilOptions node
         if (nodeData.name === "GeminiUtilOptions") {
             console.log("Registering GeminiUtilOptions node");
@@ -750,6 +1286,9 @@ app.registerExtension({
                                     console.log("[DEBUG] No video file info to restore");
                                 }
 
+                                // Show the restored upload's thumbnail
+                                this.showUploadedPreview();
+
                                 // Clean up temporary storage
                                 delete this._pendingFileRestore;
                                 console.log("[DEBUG] Cleaned up _pendingFileRestore");
@@ -779,6 +1318,11 @@ app.registerExtension({
             const onExecutedMedia = nodeType.prototype.onExecuted;
             nodeType.prototype.onExecuted = function (message) {
                 const result = onExecutedMedia?.apply(this, arguments);
+                // "Randomize Media from Path" reports the picked file's pre-generated thumbnail
+                const thumbnail = message?.sk_thumbnails?.[0];
+                if (thumbnail) {
+                    this.showMediaPreview({ fingerprint: thumbnail.fingerprint }, thumbnail.media_type);
+                }
                 return result;
             };
 
@@ -800,6 +1344,7 @@ app.registerExtension({
                     }
                 } else if (mediaType === "image") {
                     // Clear image state
+                    this.clearMediaPreview();
                     this.uploadedImageFile = null;
                     this.uploadedImageSubfolder = null;
 
@@ -841,23 +1386,12 @@ app.registerExtension({
                     this.imageInfoWidget.value = "Uploading image...";
 
                     try {
-                        // Upload the image file
-                        const formData = new FormData();
-                        formData.append("image", file);
-                        formData.append("subfolder", "gemini_images");
-                        formData.append("type", "input");
-
-                        const uploadResponse = await fetch("/upload/image", {
-                            method: "POST",
-                            body: formData,
+                        // Upload the image file in resumable chunks under its SHA-256
+                        const uploadResult = await uploadMediaResumable(file, "image", (fraction) => {
+                            this.imageInfoWidget.value = `Uploading image... ${Math.floor(fraction * 100)}%`;
+                            this.setDirtyCanvas?.(true);
                         });
 
-                        if (!uploadResponse.ok) {
-                            throw new Error(`Upload failed: ${uploadResponse.statusText}`);
-                        }
-
-                        const uploadResult = await uploadResponse.json();
-
                         // Update the image info widget
                         this.imageInfoWidget.value = `${file.name} (${(
                             file.size /
@@ -898,10 +1432,12 @@ app.registerExtension({
                         app.extensionManager?.toast?.add({
                             severity: "success",
                             summary: "Image Upload",
-                            detail: `Successfully uploaded ${file.name}`,
+                            detail: uploadSummary(file, uploadResult),
                             life: 3000,
                         });
 
+                        this.showUploadedPreview();
+
                         console.log("Image uploaded:", uploadResult);
                     } catch (error) {
                         console.error("Upload error:", error);
@@ -957,23 +1493,12 @@ app.registerExtension({
                     this.videoInfoWidget.value = "Uploading video...";
 
                     try {
-                        // Upload the video file
-                        const formData = new FormData();
-                        formData.append("image", file);
-                        formData.append("subfolder", "gemini_videos");
-                        formData.append("type", "input");
-
-                        const uploadResponse = await fetch("/upload/image", {
-                            method: "POST",
-                            body: formData,
+                        // Upload the video file in resumable chunks under its SHA-256
+                        const uploadResult = await uploadMediaResumable(file, "video", (fraction) => {
+                            this.videoInfoWidget.value = `Uploading video... ${Math.floor(fraction * 100)}%`;
+                            this.setDirtyCanvas?.(true);
                         });
 
-                        if (!uploadResponse.ok) {
-                            throw new Error(`Upload failed: ${uploadResponse.statusText}`);
-                        }
-
-                        const uploadResult = await uploadResponse.json();
-
                         console.log("[DEBUG] Video upload successful, result:", uploadResult);
 
                         // Update the video info widget
@@ -1037,10 +1562,12 @@ app.registerExtension({
                         app.extensionManager?.toast?.add({
                             severity: "success",
                             summary: "Video Upload",
-                            detail: `Successfully uploaded ${file.name}`,
+                            detail: uploadSummary(file, uploadResult),
                             life: 3000,
                         });
 
+                        this.showUploadedPreview();
+
                         console.log("Video uploaded:", uploadResult);
                     } catch (error) {
                         console.error("Upload error:", error);
@@ -1067,11 +1594,78 @@ app.registerExtension({
                 fileInput.click();
             };
 
-            // Add video preview clearing method (minimal version for media node)
+            // Thumbnails come from the server's thumbnail cache, never from the full file
+            nodeType.prototype.showMediaPreview = function (source, mediaType) {
+                this.previewSource = { source, mediaType };
+                this.posterImage = null;
+                this.previewImage = null;
+
+                const poster = new Image();
+                poster.onload = () => {
+                    if (this.previewSource?.source !== source) return;
+                    this.posterImage = poster;
+                    this.imgs = [poster];
+                    this.setDirtyCanvas?.(true, true);
+                };
+                poster.onerror = () => console.log("[PREVIEW] No thumbnail for", source);
+                poster.src = thumbnailURL(source, "poster");
+            };
+
+            nodeType.prototype.showUploadedPreview = function () {
+                const mediaType = this.mediaTypeWidget?.value || "image";
+                const file = mediaType === "video" ? this.uploadedVideoFile : this.uploadedImageFile;
+                const subfolder =
+                    mediaType === "video" ? this.uploadedVideoSubfolder : this.uploadedImageSubfolder;
+                if (file) {
+                    this.showMediaPreview({ filename: file, subfolder: subfolder || "", type: "input" }, mediaType);
+                }
+            };
+
+            nodeType.prototype.clearMediaPreview = function () {
+                this.previewSource = null;
+                this.previewHover = false;
+                this.posterImage = null;
+                this.previewImage = null;
+                this.imgs = undefined;
+                this.setDirtyCanvas?.(true, true);
+            };
+
+            // Hovering a video poster plays its animated preview
+            const onMouseEnterMedia = nodeType.prototype.onMouseEnter;
+            nodeType.prototype.onMouseEnter = function () {
+                const result = onMouseEnterMedia?.apply(this, arguments);
+                if (this.previewSource?.mediaType !== "video" || !this.posterImage) {
+                    return result;
+                }
+                if (!this.previewImage) {
+                    this.previewImage = new Image();
+                    this.previewImage.src = thumbnailURL(this.previewSource.source, "preview");
+                }
+                this.imgs = [this.previewImage];
+                this.previewHover = true;
+                // The canvas only redraws when dirty; keep it redrawing so the WebP animates
+                const redraw = () => {
+                    if (!this.previewHover) return;
+                    this.setDirtyCanvas?.(true, false);
+                    window.requestAnimationFrame(redraw);
+                };
+                redraw();
+                return result;
+            };
+
+            const onMouseLeaveMedia = nodeType.prototype.onMouseLeave;
+            nodeType.prototype.onMouseLeave = function () {
+                const result = onMouseLeaveMedia?.apply(this, arguments);
+                if (this.previewHover) {
+                    this.previewHover = false;
+                    if (this.posterImage) this.imgs = [this.posterImage];
+                    this.setDirtyCanvas?.(true, false);
+                }
+                return result;
+            };
+
             nodeType.prototype.clearVideoPreview = function () {
-                // For the media node, we don't have complex video preview
-                // This is just a placeholder method
-                console.log("Video preview cleared for media node");
+                this.clearMediaPreview();
             };
         }
     },